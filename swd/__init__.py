@@ -3,5 +3,7 @@
 
 from swd.swd import Swd
 from swd.cortexm import CortexM
+from swd.pool import ProbePool
+from swd.flash import Flash
 
-__all__ = ["Swd", "CortexM"]
+__all__ = ["Swd", "CortexM", "ProbePool", "Flash"]
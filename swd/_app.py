@@ -211,9 +211,10 @@ class Application:
 
     def print_buffer(self, addr, data, hex_line=hex_line8):
         """Print buffer in hex and ASCII"""
-        prev_chunk = []
+        prev_chunk = b''
         same_chunk = False
-        for chunk in chunks(data, 16):
+        for offset in range(0, len(data), 16):
+            chunk = data[offset:offset + 16]
             if self._verbose > 0 or prev_chunk != chunk:
                 print('%08x  %s  %s' % (
                     addr,
@@ -239,7 +240,7 @@ class Application:
         addr = convert_numeric(params[0])
         if len(params) == 1:
             if addr % 4:
-                data = self._swd.read_mem(addr, 4)
+                data = self._swd.read(addr, 4)
                 val = int.from_bytes(data, byteorder='little')
             else:
                 val = self._swd.get_mem32(addr)
@@ -247,7 +248,7 @@ class Application:
         elif len(params) == 2:
             size = convert_numeric(params[1])
             test_alignment(size, "Size", 4)
-            data = self._swd.read_mem(addr, size)
+            data = self._swd.read(addr, size)
             self.print_buffer(addr, data, hex_line32)
         else:
             raise PyswdException("too many parameters")
@@ -258,13 +259,13 @@ class Application:
             raise PyswdException("no parameters")
         addr = convert_numeric(params[0])
         if len(params) == 1:
-            data = self._swd.read_mem(addr, 2)
+            data = self._swd.read(addr, 2)
             val = int.from_bytes(data, byteorder='little')
             print("%08x: %04x" % (addr, val))
         elif len(params) == 2:
             size = convert_numeric(params[1])
             test_alignment(size, "Size", 2)
-            data = self._swd.read_mem(addr, size)
+            data = self._swd.read(addr, size)
             self.print_buffer(addr, data, hex_line16)
         else:
             raise PyswdException("too many parameters")
@@ -275,11 +276,11 @@ class Application:
             raise PyswdException("no parameters")
         addr = convert_numeric(params[0])
         if len(params) == 1:
-            data = self._swd.read_mem(addr, 1)
-            print("%08x: %02x" % (addr, next(data)))
+            data = self._swd.read(addr, 1)
+            print("%08x: %02x" % (addr, data[0]))
         elif len(params) == 2:
             size = convert_numeric(params[1])
-            data = self._swd.read_mem(addr, size)
+            data = self._swd.read(addr, size)
             self.print_buffer(addr, data, hex_line8)
         else:
             raise PyswdException("too many parameters")
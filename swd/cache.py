@@ -0,0 +1,89 @@
+"""Host side cache of target memory
+"""
+
+import collections as _collections
+
+
+class MemoryCache():
+    """LRU cache of memory blocks
+
+    Only blocks fully inside cacheable regions of memory map are cached.
+    """
+
+    def __init__(self, memory_map, block_size, max_blocks=64):
+        """Memory cache constructor
+
+        Arguments:
+            memory_map: instance of swd.memmap.MemoryMap
+            block_size: size of cached blocks, blocks are aligned to
+                this size
+            max_blocks: maximum number of cached blocks
+        """
+        self._memory_map = memory_map
+        self._block_size = block_size
+        self._max_blocks = max_blocks
+        self._blocks = _collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def block_size(self):
+        """Size of cached blocks"""
+        return self._block_size
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def is_cacheable(self, block_address):
+        """Check if block can be cached"""
+        return self._memory_map.is_cacheable(block_address, self._block_size)
+
+    def get(self, block_address):
+        """Get cached block
+
+        Arguments:
+            block_address: aligned address of block
+
+        Return:
+            bytes of block or None if block is not cached
+        """
+        block = self._blocks.get(block_address)
+        if block is None:
+            self.misses += 1
+            return None
+        self._blocks.move_to_end(block_address)
+        self.hits += 1
+        return block
+
+    def put(self, block_address, block):
+        """Store block, least recently used block is evicted if cache is full
+
+        Arguments:
+            block_address: aligned address of block
+            block: bytes of block
+        """
+        self._blocks[block_address] = block
+        self._blocks.move_to_end(block_address)
+        while len(self._blocks) > self._max_blocks:
+            self._blocks.popitem(last=False)
+
+    def invalidate(self, address=None, size=0):
+        """Invalidate blocks
+
+        Arguments:
+            address: start of invalidated range, None invalidate all blocks
+            size: size of invalidated range
+        """
+        if address is None:
+            self._blocks.clear()
+            return
+        if len(self._blocks) < size // self._block_size:
+            for block_address in list(self._blocks):
+                if (block_address < address + size
+                        and address < block_address + self._block_size):
+                    del self._blocks[block_address]
+            return
+        block_address = address - address % self._block_size
+        while block_address < address + size:
+            self._blocks.pop(block_address, None)
+            block_address += self._block_size
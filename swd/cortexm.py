@@ -1,11 +1,104 @@
 """Cortex-Mx definitions
 """
 
+import collections as _collections
+import contextlib as _contextlib
+import math as _math
+import struct as _struct
+import time as _time
+import swd.elf as _elf
+import swd.routines as _routines
+
 
 class CortexMException(Exception):
     """CortexM general exception"""
 
 
+class CortexMNotHaltedException(CortexMException):
+    """Core can not be halted"""
+
+
+class Profile():
+    """Result of statistical profiling by PC sampling"""
+
+    def __init__(self, samples, invalid, duration, symbols=None):
+        """Profile constructor
+
+        Arguments:
+            samples: Counter with number of samples of each PC
+            invalid: number of samples without PC (core was halted)
+            duration: real sampling time in seconds
+            symbols: swd.elf.SymbolTable for mapping PC to functions
+        """
+        self._samples = samples
+        self._invalid = invalid
+        self._duration = duration
+        self._symbols = symbols
+
+    @property
+    def samples(self):
+        """Counter with number of samples of each PC"""
+        return self._samples
+
+    @property
+    def invalid(self):
+        """Number of samples while core was halted"""
+        return self._invalid
+
+    @property
+    def count(self):
+        """Number of all samples"""
+        return sum(self._samples.values()) + self._invalid
+
+    @property
+    def duration(self):
+        """Sampling time in seconds"""
+        return self._duration
+
+    @property
+    def rate(self):
+        """Achieved number of samples per second"""
+        if not self._duration:
+            return 0.0
+        return self.count / self._duration
+
+    def functions(self):
+        """Number of samples per function
+
+        PC without symbol (or without symbol table) is used as name.
+
+        Return:
+            list of tuples with (name, count, percent) sorted by count,
+            percents are from samples with valid PC
+        """
+        functions = _collections.Counter()
+        for address, count in self._samples.items():
+            name = None
+            if self._symbols is not None:
+                name = self._symbols.lookup(address)
+            functions[name or f'0x{address:08x}'] += count
+        total = sum(functions.values())
+        return [
+            (name, count, 100.0 * count / total)
+            for name, count in functions.most_common()]
+
+    def report(self, limit=None):
+        """Text report with percents of functions
+
+        Arguments:
+            limit: maximum number of functions, None is all
+
+        Return:
+            string with one function per line
+        """
+        lines = [
+            f"{self.count} samples in {self._duration:.3f} s "
+            f"({self.rate:.0f} samples/s, {self._invalid} halted)"]
+        for name, count, percent in self.functions()[:limit]:
+            lines.append(f"{percent:6.2f}% {count:8d}  {name}")
+        return '\n'.join(lines)
+
+
 class CortexM():
     """Definitions for Cortex-M MCUs"""
     REGISTERS = [
@@ -17,6 +110,7 @@ class CortexM():
     DHCSR_REG = 0xe000edf0
     DEMCR_REG = 0xe000edfc
     DWTCTRL_REG = 0xe0001000
+    DWTPCSR_REG = 0xe000101c
     BPCTRL_REG = 0xe0002000
     BPCOMP0_REG = 0xe0002008
     BPCOMP1_REG = 0xe000200c
@@ -38,18 +132,38 @@ class CortexM():
     DHCSR_DEBUGEN_BIT = 0x00000001
     DHCSR_HALT_BIT = 0x00000002
     DHCSR_STEP_BIT = 0x00000004
+    DHCSR_MASKINTS_BIT = 0x00000008
     DHCSR_STATUS_HALT_BIT = 0x00020000
     DHCSR_DEBUGDIS = DHCSR_KEY
     DHCSR_DEBUGEN = DHCSR_KEY | DHCSR_DEBUGEN_BIT
     DHCSR_HALT = DHCSR_KEY | DHCSR_DEBUGEN_BIT | DHCSR_HALT_BIT
     DHCSR_STEP = DHCSR_KEY | DHCSR_DEBUGEN_BIT | DHCSR_STEP_BIT
+    DHCSR_HALT_MASKINTS = DHCSR_HALT | DHCSR_MASKINTS_BIT
+    DHCSR_RUN_MASKINTS = DHCSR_DEBUGEN | DHCSR_MASKINTS_BIT
 
     DEMCR_RUN_AFTER_RESET = 0x00000000
     DEMCR_HALT_AFTER_RESET = 0x00000001
+    DEMCR_VC_HARDERR_BIT = 0x00000400
+    DEMCR_TRCENA_BIT = 0x01000000
+
+    # DWT_PCSR value while core is halted
+    PCSR_INVALID = 0xffffffff
+
+    PSR_THUMB_BIT = 0x01000000
+    # BKPT #0, return address of routines executed on target
+    BKPT_INSTRUCTION = b'\x00\xbe'
+    # registers which can be changed by called routine (AAPCS)
+    CALLER_SAVED_REGISTERS = (
+        'R0', 'R1', 'R2', 'R3', 'R12', 'SP', 'LR', 'PC', 'PSR')
 
     def __init__(self, swd):
         self._swd = swd
 
+    @property
+    def swd(self):
+        """Instance of swd.Swd used by this core"""
+        return self._swd
+
     @classmethod
     def _get_reg_index(cls, reg):
         if reg.upper() not in cls.REGISTERS:
@@ -72,6 +186,8 @@ class CortexM():
         """Reset"""
         self._swd.set_mem32(CortexM.DEMCR_REG, CortexM.DEMCR_RUN_AFTER_RESET)
         self._swd.set_mem32(CortexM.AIRCR_REG, CortexM.AIRCR_SYSRESETREQ)
+        self._swd.flush()
+        self._swd.invalidate_cache()
         # self._swd.get_mem32(CortexM.AIRCR_REG)
 
     def reset_halt(self):
@@ -79,29 +195,509 @@ class CortexM():
         self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_HALT)
         self._swd.set_mem32(CortexM.DEMCR_REG, CortexM.DEMCR_HALT_AFTER_RESET)
         self._swd.set_mem32(CortexM.AIRCR_REG, CortexM.AIRCR_SYSRESETREQ)
+        self._swd.flush()
+        self._swd.invalidate_cache()
         # self._swd.get_mem32(CortexM.AIRCR_REG)
 
     def halt(self):
         """Halt"""
         self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_HALT)
+        self._swd.flush()
 
     def step(self):
         """Step"""
         self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_STEP)
+        self._swd.flush()
+        self._swd.invalidate_cache()
 
     def run(self):
         """Enable debug"""
         self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_DEBUGEN)
+        self._swd.flush()
+        self._swd.invalidate_cache()
 
     def nodebug(self):
         """Disable debug"""
         self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_DEBUGDIS)
+        self._swd.flush()
+        self._swd.invalidate_cache()
 
     def is_halted(self):
         """check if core is halted"""
         return self._swd.get_mem32(
             CortexM.DHCSR_REG) & CortexM.DHCSR_STATUS_HALT_BIT > 0
 
+    def wait_for_halt(self, timeout=1.0, poll_interval=0.0):
+        """Wait until core is halted
+
+        Arguments:
+            timeout: maximum waiting time in seconds
+            poll_interval: time between checks of DHCSR in seconds
+
+        Return:
+            True if core is halted, False on timeout
+        """
+        deadline = _time.monotonic() + timeout
+        while not self.is_halted():
+            if _time.monotonic() > deadline:
+                return False
+            if poll_interval:
+                _time.sleep(poll_interval)
+        return True
+
+    def call(
+            self, entry, args=(), stack_pointer=None,
+            return_address=None, timeout=1.0):
+        """Call routine on target
+
+        Routine is called as C function (AAPCS): arguments are in R0-R3,
+        result is in R0 and it return to return_address, where must be
+        BKPT instruction. Interrupts are masked and HardFault is caught
+        during call. Core is halted if it is running and registers
+        changed by call are restored at end, if core was running, then
+        it is resumed.
+
+        Arguments:
+            entry: address of routine (without Thumb bit)
+            args: up to 4 arguments (32 bit numbers)
+            stack_pointer: stack pointer for routine, None keep current SP
+            return_address: address of BKPT instruction (required)
+            timeout: maximum time of execution in seconds
+
+        Return:
+            value of R0
+
+        Raises:
+            CortexMException: on timeout, without return_address or if
+                routine does not return to return_address
+        """
+        context = self.start_call(
+            entry, args, stack_pointer=stack_pointer,
+            return_address=return_address, timeout=timeout)
+        return self.finish_call(context, timeout=timeout)
+
+    def start_call(
+            self, entry, args=(), stack_pointer=None,
+            return_address=None, timeout=1.0):
+        """Start routine on target and return without waiting for it
+
+        Same as call(), but host can access memory while routine is
+        running (e.g. to feed it with data), finish_call() must follow.
+
+        Arguments:
+            entry: address of routine (without Thumb bit)
+            args: up to 4 arguments (32 bit numbers)
+            stack_pointer: stack pointer for routine, None keep current SP
+            return_address: address of BKPT instruction (required)
+            timeout: maximum time to halt running core in seconds
+
+        Return:
+            context of call for finish_call()
+
+        Raises:
+            CortexMException: without return_address
+            CortexMNotHaltedException: if core can not be halted
+        """
+        if len(args) > 4:
+            raise CortexMException("Too many arguments")
+        if return_address is None:
+            raise CortexMException("Return address is required")
+        was_halted = self.is_halted()
+        if not was_halted:
+            self.halt()
+            if not self.wait_for_halt(timeout):
+                self.run()
+                raise CortexMNotHaltedException("Core is not halted")
+        context = {
+            'was_halted': was_halted,
+            'registers': self.get_reg_all(),
+            'demcr': self._swd.get_mem32(CortexM.DEMCR_REG),
+            'return_address': return_address,
+        }
+        try:
+            for index, arg in enumerate(args):
+                self.set_reg('R%d' % index, arg)
+            if stack_pointer is not None:
+                self.set_reg('SP', stack_pointer)
+            self.set_reg('LR', return_address | 1)
+            self.set_reg('PC', entry & ~1)
+            self.set_reg('PSR', CortexM.PSR_THUMB_BIT)
+            self._swd.set_mem32(
+                CortexM.DEMCR_REG,
+                context['demcr'] | CortexM.DEMCR_VC_HARDERR_BIT)
+            # C_MASKINTS can be changed only while core is halted
+            self._swd.set_mem32(
+                CortexM.DHCSR_REG, CortexM.DHCSR_HALT_MASKINTS)
+            self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_RUN_MASKINTS)
+            self._swd.flush()
+            self._swd.invalidate_cache()
+        except Exception:
+            self._restore_call(context)
+            raise
+        return context
+
+    def finish_call(self, context, timeout=1.0):
+        """Wait for return of routine started by start_call()
+
+        Registers are restored and core is resumed if it was running.
+
+        Arguments:
+            context: context returned by start_call()
+            timeout: maximum time of execution in seconds
+
+        Return:
+            value of R0
+
+        Raises:
+            CortexMException: on timeout or if routine does not return
+                to return_address
+        """
+        try:
+            if not self.wait_for_halt(timeout):
+                self.halt()
+                raise CortexMException("Routine timeout")
+            program_counter = self.get_reg('PC')
+            if program_counter != context['return_address']:
+                raise CortexMException(
+                    "Routine stopped at address: 0x%08x" % program_counter)
+            return self.get_reg('R0')
+        finally:
+            self._restore_call(context)
+
+    def _restore_call(self, context):
+        """Restore state of core saved by start_call()"""
+        self._swd.set_mem32(CortexM.DHCSR_REG, CortexM.DHCSR_HALT)
+        self._swd.set_mem32(CortexM.DEMCR_REG, context['demcr'])
+        registers = context['registers']
+        for reg in CortexM.CALLER_SAVED_REGISTERS:
+            self.set_reg(reg, registers[reg])
+        if not context['was_halted']:
+            self.run()
+
+    @_contextlib.contextmanager
+    def _halted(self, timeout=1.0):
+        """Halt core for block and resume it at end if it was running
+
+        Raises:
+            CortexMNotHaltedException: if core can not be halted, block
+                is not executed
+        """
+        was_halted = self.is_halted()
+        if not was_halted:
+            self.halt()
+            if not self.wait_for_halt(timeout):
+                self.run()
+                raise CortexMNotHaltedException("Core is not halted")
+        try:
+            yield
+        finally:
+            if not was_halted:
+                self.run()
+
+    @_contextlib.contextmanager
+    def _scratch(self, address, size, timeout=1.0):
+        """Halt core for block and restore scratch area in RAM at end
+
+        Core is halted before scratch area is saved and it is resumed
+        after scratch area is restored.
+
+        Raises:
+            CortexMNotHaltedException: if core can not be halted, block
+                is not executed
+        """
+        with self._halted(timeout):
+            saved = self._swd.read(address, size)
+            try:
+                yield
+            finally:
+                self._swd.write_mem(address, saved)
+
+    def load_routine(self, code, address):
+        """Upload position independent Thumb routine into RAM
+
+        BKPT instruction for return is stored before routine. Core must
+        be halted, so running firmware does not use this RAM.
+
+        Arguments:
+            code: bytes of routine
+            address: address in RAM aligned to 4 Bytes
+
+        Return:
+            tuple with (entry, return_address)
+
+        Raises:
+            CortexMException: if core is not halted
+        """
+        if not self.is_halted():
+            raise CortexMException(
+                "Core must be halted before routine is uploaded")
+        data = CortexM.BKPT_INSTRUCTION * 2 + bytes(code)
+        data += bytes(-len(data) % 4)
+        self._swd.write_mem32(address, data)
+        return address + 4, address
+
+    def execute(
+            self, code, args=(), address=0x20000000, stack_size=256,
+            timeout=1.0):
+        """Upload and execute position independent Thumb routine
+
+        Running core is halted before routine is stored at address in RAM
+        and stack is placed after it, this area is overwritten.
+
+        Arguments:
+            code: bytes of routine, it is called as C function (AAPCS)
+            args: up to 4 arguments (32 bit numbers)
+            address: address of scratch area in RAM aligned to 4 Bytes
+            stack_size: size of stack for routine
+            timeout: maximum time of execution in seconds
+
+        Return:
+            value of R0
+
+        Raises:
+            CortexMNotHaltedException: if core can not be halted
+        """
+        with self._halted():
+            entry, return_address = self.load_routine(code, address)
+            stack_pointer = (address + 4 + len(code) + stack_size + 7) & ~7
+            return self.call(
+                entry, args, stack_pointer=stack_pointer,
+                return_address=return_address, timeout=timeout)
+
+    def _call_sectors(
+            self, routine, address, size, sector_size, scratch, timeout):
+        """Call routine with (address, sector_size, count, results) for
+        all sectors and return list of results"""
+        sectors = []
+        count, last_size = divmod(size, sector_size)
+        if count:
+            sectors.append((address, sector_size, count))
+        if last_size:
+            sectors.append((address + count * sector_size, last_size, 1))
+        # routine, stack and results of largest call
+        results = (scratch + 4 + len(routine) + 64 + 7) & ~7
+        scratch_end = results + 4 * max(
+            (count for _, _, count in sectors), default=0)
+        if address < scratch_end and scratch < address + size:
+            raise CortexMException("Memory range overlap scratch area")
+        values = []
+        with self._scratch(scratch, scratch_end - scratch):
+            entry, return_address = self.load_routine(routine, scratch)
+            for sector_address, sector_size, count in sectors:
+                self.call(
+                    entry, (sector_address, sector_size, count, results),
+                    stack_pointer=results, return_address=return_address,
+                    timeout=timeout)
+                values.extend(_struct.unpack(
+                    '<%dL' % count, self._swd.read(results, count * 4)))
+        return values
+
+    def checksum_sectors(
+            self, address, size, sector_size, scratch=0x20000000,
+            timeout=None):
+        """Compute CRC32 of memory sectors on target
+
+        CRC32 is same as zlib.crc32() and only results are transferred.
+        Last sector can be shorter.
+
+        Arguments:
+            address: start address of memory
+            size: number of bytes
+            sector_size: size of one sector
+            scratch: address of scratch area in RAM (about 1.2 KB for
+                routine, stack and 4 Bytes for result of each sector),
+                it is restored at end
+            timeout: maximum time of execution in seconds, default depends
+                on size
+
+        Return:
+            list of CRC32 of sectors
+
+        Raises:
+            CortexMException: if memory range overlap scratch area
+            CortexMNotHaltedException: if core can not be halted
+        """
+        if timeout is None:
+            timeout = 1.0 + size / 200000
+        return self._call_sectors(
+            _routines.crc32_sectors(), address, size, sector_size,
+            scratch, timeout)
+
+    def blank_check_sectors(
+            self, address, size, sector_size, scratch=0x20000000,
+            timeout=None):
+        """Check on target which memory sectors are erased
+
+        Sector is erased if all bytes are 0xff. Only results are
+        transferred. Address and sizes must be aligned to 4 Bytes, last
+        sector can be shorter.
+
+        Arguments:
+            address: start address of memory
+            size: number of bytes
+            sector_size: size of one sector
+            scratch: address of scratch area in RAM (about 100 Bytes for
+                routine, stack and 4 Bytes for result of each sector),
+                it is restored at end
+            timeout: maximum time of execution in seconds, default depends
+                on size
+
+        Return:
+            list of bool, True for erased sector
+
+        Raises:
+            CortexMException: if address or sizes are not aligned or memory
+                range overlap scratch area
+            CortexMNotHaltedException: if core can not be halted
+        """
+        if sector_size <= 0 or (address | size | sector_size) % 4:
+            # routine compare words, unaligned sector would overrun
+            raise CortexMException(
+                "Address and sizes must be aligned to 4 Bytes")
+        if timeout is None:
+            timeout = 1.0 + size / 1000000
+        return [bool(value) for value in self._call_sectors(
+            _routines.BLANK_CHECK, address, size, sector_size,
+            scratch, timeout)]
+
+    def checksum(self, address, size, scratch=0x20000000, timeout=None):
+        """Compute CRC32 of memory on target
+
+        Arguments:
+            address: start address of memory
+            size: number of bytes
+            scratch: address of scratch area in RAM, it is restored at end
+            timeout: maximum time of execution in seconds
+
+        Return:
+            CRC32 of memory, same as zlib.crc32() of data
+
+        Raises:
+            CortexMException: if memory range overlap scratch area
+            CortexMNotHaltedException: if core can not be halted
+        """
+        if not size:
+            return 0
+        return self.checksum_sectors(
+            address, size, size, scratch=scratch, timeout=timeout)[0]
+
+    def fill_mem(
+            self, address, pattern, size, bits=32, scratch=0x20000000,
+            timeout=None):
+        """Fill memory with pattern by routine on target
+
+        Pattern is uploaded once and memory is filled by MCU. Running
+        core is halted before anything is uploaded, scratch area is
+        restored at end.
+
+        Arguments:
+            address: address in memory aligned to access size
+            pattern: list of bytes to fill
+            size: number of bytes to fill, multiple of access size
+            bits: access size (8, 16 or 32)
+            scratch: address of scratch area in RAM (about 100 Bytes and
+                pattern repeated to multiple of access size)
+            timeout: maximum time of execution in seconds, default depends
+                on size
+
+        Return:
+            True if memory was filled, False if filled range overlap
+            scratch area or core can not be halted
+        """
+        if timeout is None:
+            timeout = 1.0 + size / 1000000
+        width = bits // 8
+        pattern = bytes(pattern)
+        pattern *= width // _math.gcd(len(pattern), width)
+        routine = _routines.FILL[bits]
+        pattern_address = scratch + 4 + len(routine) + (-len(routine) % 4)
+        stack_pointer = (pattern_address + len(pattern) + 64 + 7) & ~7
+        if address < stack_pointer and scratch < address + size:
+            return False
+        try:
+            with self._scratch(scratch, stack_pointer - scratch):
+                entry, return_address = self.load_routine(routine, scratch)
+                self._swd.write_mem(pattern_address, pattern)
+                self.call(
+                    entry, (
+                        address, address + size,
+                        pattern_address, pattern_address + len(pattern)),
+                    stack_pointer=stack_pointer,
+                    return_address=return_address, timeout=timeout)
+        except CortexMNotHaltedException:
+            return False
+        return True
+
+    def enable_target_fill(self, scratch=0x20000000, min_size=1024):
+        """Use fill routine on target for Swd.fill_mem*
+
+        Arguments:
+            scratch: address of scratch area in RAM
+            min_size: smaller ranges are filled by host
+        """
+
+        def backend(address, pattern, size, bits):
+            if size < min_size:
+                return False
+            return self.fill_mem(
+                address, pattern, size, bits=bits, scratch=scratch)
+
+        self._swd.fill_backend = backend
+
+    def disable_target_fill(self):
+        """Fill memory only by host"""
+        self._swd.fill_backend = None
+
+    def profile(self, duration, rate=None, symbols=None, batch=32):
+        """Statistical profile of running code by sampling of DWT_PCSR
+
+        Core is not halted and firmware is not changed. Samples are read
+        in batches by Swd.sample_mem32(), so with deferred_check and
+        pipelined driver whole batch wait for USB only once.
+
+        Arguments:
+            duration: sampling time in seconds
+            rate: requested samples per second, None is maximum rate
+            symbols: swd.elf.SymbolTable or name of ELF file
+            batch: maximum number of samples read in one operation
+
+        Return:
+            Profile instance
+        """
+        if symbols is not None and not isinstance(symbols, _elf.SymbolTable):
+            symbols = _elf.SymbolTable.from_elf(symbols)
+        demcr = self._swd.get_mem32(self.DEMCR_REG)
+        if not demcr & self.DEMCR_TRCENA_BIT:
+            # DWT is enabled by TRCENA
+            self._swd.set_mem32(
+                self.DEMCR_REG, demcr | self.DEMCR_TRCENA_BIT)
+        samples = _collections.Counter()
+        count = 0
+        start = _time.monotonic()
+        try:
+            while True:
+                now = _time.monotonic()
+                elapsed = now - start
+                if elapsed >= duration:
+                    break
+                size = batch
+                if rate is not None:
+                    size = min(batch, int(rate * elapsed) - count)
+                    if size <= 0:
+                        _time.sleep(min(
+                            start + (count + 1) / rate, start + duration)
+                            - now)
+                        continue
+                samples.update(
+                    self._swd.sample_mem32(self.DWTPCSR_REG, size))
+                count += size
+        finally:
+            if not demcr & self.DEMCR_TRCENA_BIT:
+                self._swd.set_mem32(self.DEMCR_REG, demcr)
+        duration = _time.monotonic() - start
+        invalid = samples.pop(self.PCSR_INVALID, 0)
+        return Profile(samples, invalid, duration, symbols)
+
     # def get_num_breakpoints(self):
     #     """Return number of HW break points"""
     #     return (self._swd.get_mem32(CortexM.BPCTRL_REG) >> 4) & 0x0f
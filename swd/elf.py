@@ -0,0 +1,123 @@
+"""Minimal ELF symbol table reader
+
+Only function symbols from symbol table of 32 bit little endian ELF
+(Cortex-M firmware) are read, for mapping of addresses to functions.
+"""
+
+import bisect as _bisect
+import struct as _struct
+
+
+class ElfException(Exception):
+    """Elf general exception"""
+
+
+class SymbolTable:
+    """Sorted function symbols with lookup by address"""
+
+    _ELF_MAGIC = b'\x7fELF'
+    _ELFCLASS32 = 1
+    _ELFDATA2LSB = 1
+    _SHT_SYMTAB = 2
+    _STT_FUNC = 2
+    _SECTION_HEADER = _struct.Struct('<10L')
+    _SYMBOL = _struct.Struct('<3LBBH')
+
+    def __init__(self, symbols):
+        """SymbolTable constructor
+
+        Arguments:
+            symbols: iterable of tuples with (address, size, name)
+        """
+        self._symbols = sorted(symbols)
+        self._addresses = [address for address, _, _ in self._symbols]
+
+    def __len__(self):
+        return len(self._symbols)
+
+    @property
+    def symbols(self):
+        """Sorted list of tuples with (address, size, name)"""
+        return self._symbols
+
+    @classmethod
+    def from_elf(cls, elf):
+        """Read function symbols from ELF file
+
+        Thumb bit of function addresses is cleared.
+
+        Arguments:
+            elf: file name or bytes with content of ELF file
+
+        Return:
+            SymbolTable instance
+
+        Raises:
+            ElfException: if file is not 32 bit little endian ELF or
+                there is no symbol table
+        """
+        if isinstance(elf, (bytes, bytearray, memoryview)):
+            data = bytes(elf)
+        else:
+            with open(elf, 'rb') as elf_file:
+                data = elf_file.read()
+        return cls(cls._parse(data))
+
+    @classmethod
+    def _parse(cls, data):
+        if len(data) < 52 or data[:4] != cls._ELF_MAGIC:
+            raise ElfException("Not ELF file")
+        if data[4] != cls._ELFCLASS32 or data[5] != cls._ELFDATA2LSB:
+            raise ElfException("Only 32 bit little endian ELF is supported")
+        shoff, = _struct.unpack_from('<L', data, 0x20)
+        shentsize, shnum = _struct.unpack_from('<HH', data, 0x2e)
+        try:
+            sections = [
+                cls._SECTION_HEADER.unpack_from(data, shoff + i * shentsize)
+                for i in range(shnum)]
+        except _struct.error as err:
+            raise ElfException(
+                f"Corrupted section headers: {err}") from err
+        symbols = []
+        for section in sections:
+            _, sh_type, _, _, offset, size, link, _, _, entsize = section
+            if sh_type != cls._SHT_SYMTAB:
+                continue
+            if link >= len(sections) or entsize < cls._SYMBOL.size:
+                raise ElfException("Corrupted symbol table")
+            strtab_offset, strtab_size = sections[link][4:6]
+            strtab = data[strtab_offset:strtab_offset + strtab_size]
+            for entry in range(offset, offset + size, entsize):
+                try:
+                    name, value, sym_size, info, _, shndx = (
+                        cls._SYMBOL.unpack_from(data, entry))
+                except _struct.error as err:
+                    raise ElfException("Corrupted symbol table") from err
+                if info & 0x0f != cls._STT_FUNC or not shndx:
+                    continue
+                end = strtab.find(b'\x00', name)
+                symbols.append((
+                    value & ~1, sym_size,
+                    strtab[name:end].decode(errors='replace')))
+        if not any(section[1] == cls._SHT_SYMTAB for section in sections):
+            raise ElfException("No symbol table (stripped ELF file)")
+        return symbols
+
+    def lookup(self, address):
+        """Find function containing address
+
+        Symbol with zero size contains addresses up to next symbol.
+
+        Arguments:
+            address: address of instruction
+
+        Return:
+            function name or None
+        """
+        index = _bisect.bisect_right(self._addresses, address) - 1
+        if index < 0:
+            return None
+        symbol_address, size, name = self._symbols[index]
+        if size and address >= symbol_address + size:
+            return None
+        return name
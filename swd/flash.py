@@ -0,0 +1,1105 @@
+"""Flash programming of STM32 MCUs
+
+Sectors are erased by host through registers of flash controller. Data
+are programmed by loader running in RAM of MCU, host upload next buffer
+by write_mem32 while loader program previous one, so programming speed is
+limited mainly by SWD throughput and not by round trips.
+"""
+
+import json as _json
+import os as _os
+import struct as _struct
+import time as _time
+import zlib as _zlib
+import swd.cortexm as _cortexm
+import swd.routines as _routines
+import swd.stlink as _stlink
+
+
+class FlashException(Exception):
+    """Flash general exception"""
+
+
+# sectors are compared by CRC32 computed on MCU
+CHECKSUM_TARGET = 'target'
+# sectors are read back and compared by CRC32 computed on host
+CHECKSUM_READ = 'read'
+
+
+class FlashSector():
+    """Erasable sector (or page) of flash memory"""
+
+    def __init__(self, address, size, number, bank=0):
+        """Flash sector constructor
+
+        Arguments:
+            address: start address of sector
+            size: size of sector in bytes
+            number: number of sector (or page) in bank used by erase
+            bank: index of flash bank
+        """
+        self._address = address
+        self._size = size
+        self._number = number
+        self._bank = bank
+
+    def __repr__(self):
+        return "FlashSector(0x%08x, 0x%08x, %d, %d)" % (
+            self._address, self._size, self._number, self._bank)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, FlashSector)
+            and (self._address, self._size, self._number, self._bank) == (
+                other.address, other.size, other.number, other.bank))
+
+    def __hash__(self):
+        return hash((self._address, self._size, self._number, self._bank))
+
+    @property
+    def address(self):
+        """Start address of sector"""
+        return self._address
+
+    @property
+    def size(self):
+        """Size of sector"""
+        return self._size
+
+    @property
+    def end(self):
+        """Address after end of sector"""
+        return self._address + self._size
+
+    @property
+    def number(self):
+        """Number of sector in bank"""
+        return self._number
+
+    @property
+    def bank(self):
+        """Index of flash bank"""
+        return self._bank
+
+
+class FlashDriver():
+    """Flash controller of STM32 family
+
+    Subclasses define registers of flash controller, program size and
+    layout of sectors. Offsets of registers are relative to registers()
+    of sector, banks with own registers are at BANK_OFFSET.
+    """
+    NAME = None
+    # IDs of devices (DBGMCU_IDCODE & 0xfff) with this controller
+    DEV_IDS = ()
+    FLASH_ADDRESS = 0x08000000
+    # address of 16 bit register with size of flash in KB
+    FLASH_SIZE_REG = None
+    # address of 96 bit unique device ID
+    UID_REG = None
+    REGISTERS = 0x40022000
+    BANK_OFFSET = 0
+
+    KEYR = 0x04
+    SR = 0x0c
+    CR = 0x10
+    # address register used by page erase
+    AR = None
+    # register for clearing of status flags, None is SR
+    CCR = None
+
+    KEY1 = 0x45670123
+    KEY2 = 0xcdef89ab
+
+    SR_BUSY = 0x00000001
+    SR_ERRORS = 0x00000000
+    SR_CLEAR = 0x00000000
+    CR_LOCK = 0x00000000
+    CR_PROGRAM = 0x00000001
+    CR_START = 0x00000000
+
+    # number of bytes programmed at once
+    PROGRAM_SIZE = 4
+    # program by 16 bit writes
+    PROGRAM_HALFWORD = False
+
+    def __init__(self, flash_size):
+        """Flash driver constructor
+
+        Arguments:
+            flash_size: size of flash in bytes
+        """
+        self._flash_size = flash_size
+
+    def __repr__(self):
+        return "%s(%d KB)" % (
+            self.__class__.__name__, self._flash_size // 1024)
+
+    @property
+    def flash_size(self):
+        """Size of flash in bytes"""
+        return self._flash_size
+
+    def sectors(self):
+        """List of all sectors
+
+        Return:
+            list of FlashSector sorted by address
+        """
+        raise NotImplementedError()
+
+    def registers(self, sector):
+        """Base address of flash controller registers for sector"""
+        return self.REGISTERS + sector.bank * self.BANK_OFFSET
+
+    def erase_command(self, sector):
+        """Value of CR for erase of sector (without CR_START)"""
+        raise NotImplementedError()
+
+    def _uniform_sectors(self, sector_size, bank_size=None):
+        if bank_size is None:
+            bank_size = self._flash_size
+        return [
+            FlashSector(
+                self.FLASH_ADDRESS + offset, sector_size,
+                (offset % bank_size) // sector_size, offset // bank_size)
+            for offset in range(0, self._flash_size, sector_size)]
+
+
+class FlashDriverF0(FlashDriver):
+    """STM32F0, pages of 1 or 2 KB"""
+    NAME = 'STM32F0'
+    DEV_IDS = (0x440, 0x442, 0x444, 0x445, 0x448)
+    FLASH_SIZE_REG = 0x1ffff7cc
+    UID_REG = 0x1ffff7ac
+    AR = 0x14
+    SR_BUSY = 0x00000001
+    SR_ERRORS = 0x00000014
+    SR_CLEAR = 0x00000034
+    CR_LOCK = 0x00000080
+    CR_PROGRAM = 0x00000001
+    CR_PAGE_ERASE = 0x00000002
+    CR_START = 0x00000040
+    PROGRAM_SIZE = 2
+    PROGRAM_HALFWORD = True
+
+    def __init__(self, flash_size, page_size=1024):
+        """Flash driver constructor
+
+        Arguments:
+            flash_size: size of flash in bytes
+            page_size: size of erase page in bytes
+        """
+        super().__init__(flash_size)
+        self._page_size = page_size
+
+    def sectors(self):
+        return self._uniform_sectors(self._page_size)
+
+    def erase_command(self, sector):
+        return self.CR_PAGE_ERASE
+
+
+class FlashDriverF1(FlashDriverF0):
+    """STM32F1, pages of 1 or 2 KB, XL-density has second bank"""
+    NAME = 'STM32F1'
+    DEV_IDS = (0x410, 0x412, 0x414, 0x418, 0x420, 0x428, 0x430)
+    FLASH_SIZE_REG = 0x1ffff7e0
+    UID_REG = 0x1ffff7e8
+    BANK_OFFSET = 0x40
+    BANK_SIZE = 0x80000
+
+    def sectors(self):
+        return self._uniform_sectors(self._page_size, self.BANK_SIZE)
+
+
+class FlashDriverF4(FlashDriver):
+    """STM32F4, sectors of 16, 64 and 128 KB, programmed by 32 bits"""
+    NAME = 'STM32F4'
+    DEV_IDS = (
+        0x413, 0x419, 0x421, 0x423, 0x431, 0x433, 0x434, 0x441, 0x458, 0x463)
+    FLASH_SIZE_REG = 0x1fff7a22
+    UID_REG = 0x1fff7a10
+    REGISTERS = 0x40023c00
+    SR_BUSY = 0x00010000
+    SR_ERRORS = 0x000001f2
+    SR_CLEAR = 0x000001f3
+    CR_LOCK = 0x80000000
+    # PG with PSIZE x32
+    CR_PROGRAM = 0x00000201
+    # SER with PSIZE x32
+    CR_SECTOR_ERASE = 0x00000202
+    CR_START = 0x00010000
+    PROGRAM_SIZE = 4
+    BANK_SIZE = 0x100000
+    BANK_SECTORS = (
+        [16 * 1024] * 4 + [64 * 1024] + [128 * 1024] * 7)
+    # 2 MB parts have two banks, other parts (e.g. F413 with 1.5 MB and
+    # 16 sectors) have one bank with 128 KB sectors up to end of flash
+    DUAL_BANK_SIZE = 0x200000
+
+    def __init__(self, flash_size, dual_bank=None):
+        """Flash driver constructor
+
+        Arguments:
+            flash_size: size of flash in bytes
+            dual_bank: flash is split into two banks of same size, None is
+                True for parts with 2 MB
+        """
+        super().__init__(flash_size)
+        if dual_bank is None:
+            dual_bank = flash_size >= self.DUAL_BANK_SIZE
+        self._dual_bank = dual_bank
+
+    def sectors(self):
+        sectors = []
+        address = self.FLASH_ADDRESS
+        banks = 2 if self._dual_bank else 1
+        bank_size = self._flash_size // banks
+        for bank in range(banks):
+            bank_end = address + bank_size
+            index = 0
+            while address < bank_end:
+                size = self.BANK_SECTORS[min(
+                    index, len(self.BANK_SECTORS) - 1)]
+                sectors.append(FlashSector(
+                    address, size, bank * len(self.BANK_SECTORS) + index,
+                    bank))
+                address += size
+                index += 1
+        return sectors
+
+    def registers(self, sector):
+        # both banks share one controller
+        return self.REGISTERS
+
+    def erase_command(self, sector):
+        # sectors of second bank have SNB 0b1xxxx
+        number = sector.number + (4 if sector.bank else 0)
+        return self.CR_SECTOR_ERASE | (number << 3)
+
+
+class FlashDriverL4(FlashDriver):
+    """STM32L4, pages of 2 KB, programmed by 64 bits, L47x/L48x and
+    L49x/L4Ax are dual bank"""
+    NAME = 'STM32L4'
+    DEV_IDS = (0x415, 0x435, 0x461, 0x462, 0x464)
+    FLASH_SIZE_REG = 0x1fff75e0
+    UID_REG = 0x1fff7590
+    KEYR = 0x08
+    SR = 0x10
+    CR = 0x14
+    SR_BUSY = 0x00010000
+    SR_ERRORS = 0x000043fa
+    SR_CLEAR = 0x0000c3fb
+    CR_LOCK = 0x80000000
+    CR_PROGRAM = 0x00000001
+    CR_PAGE_ERASE = 0x00000002
+    CR_BANK2 = 0x00000800
+    CR_START = 0x00010000
+    PROGRAM_SIZE = 8
+    PAGE_SIZE = 2048
+    # dual bank parts have two banks of half flash size, each with own page
+    # numbers, only dual bank parts have 1 MB
+    DUAL_BANK_SIZE = 0x100000
+
+    def __init__(self, flash_size, dual_bank=None):
+        """Flash driver constructor
+
+        Arguments:
+            flash_size: size of flash in bytes
+            dual_bank: second half of flash is second bank, None is True
+                for parts with 1 MB
+        """
+        super().__init__(flash_size)
+        if dual_bank is None:
+            dual_bank = flash_size >= self.DUAL_BANK_SIZE
+        self._dual_bank = dual_bank
+
+    def sectors(self):
+        bank_size = self._flash_size
+        if self._dual_bank:
+            bank_size //= 2
+        return self._uniform_sectors(self.PAGE_SIZE, bank_size)
+
+    def registers(self, sector):
+        return self.REGISTERS
+
+    def erase_command(self, sector):
+        command = self.CR_PAGE_ERASE | (sector.number << 3)
+        if sector.bank:
+            command |= self.CR_BANK2
+        return command
+
+
+class FlashDriverG0(FlashDriverL4):
+    """STM32G0, pages of 2 KB, programmed by 64 bits"""
+    NAME = 'STM32G0'
+    DEV_IDS = (0x456, 0x460, 0x466)
+    # BSY1 and CFGBSY
+    SR_BUSY = 0x00050000
+
+    def sectors(self):
+        return self._uniform_sectors(self.PAGE_SIZE)
+
+    def erase_command(self, sector):
+        return self.CR_PAGE_ERASE | (sector.number << 3)
+
+
+class FlashDriverH7(FlashDriver):
+    """STM32H7, sectors of 128 KB, programmed by 256 bit flash words,
+    each bank of 1 MB has own registers"""
+    NAME = 'STM32H7'
+    DEV_IDS = (0x450, 0x483)
+    FLASH_SIZE_REG = 0x1ff1e880
+    UID_REG = 0x1ff1e800
+    REGISTERS = 0x52002000
+    BANK_OFFSET = 0x100
+    KEYR = 0x04
+    CR = 0x0c
+    SR = 0x10
+    CCR = 0x14
+    # BSY and QW
+    SR_BUSY = 0x00000005
+    SR_ERRORS = 0x07ee0000
+    SR_CLEAR = 0x07ef0000
+    CR_LOCK = 0x00000001
+    # PG with PSIZE x64
+    CR_PROGRAM = 0x00000032
+    # SER with PSIZE x64
+    CR_SECTOR_ERASE = 0x00000034
+    CR_START = 0x00000080
+    PROGRAM_SIZE = 32
+    SECTOR_SIZE = 128 * 1024
+    BANK_SIZE = 0x100000
+
+    def sectors(self):
+        return self._uniform_sectors(self.SECTOR_SIZE, self.BANK_SIZE)
+
+    def erase_command(self, sector):
+        return self.CR_SECTOR_ERASE | (sector.number << 8)
+
+
+DRIVERS = (
+    FlashDriverF0, FlashDriverF1, FlashDriverF4,
+    FlashDriverL4, FlashDriverG0, FlashDriverH7)
+
+# DBGMCU_IDCODE registers of Cortex-M3/M4/M7, Cortex-M0/M0+ and STM32H7
+DBGMCU_IDCODE_REGS = (0xe0042000, 0x40015800, 0x5c001000)
+
+# devices with pages of 2 KB
+_LARGE_PAGES = (0x414, 0x418, 0x428, 0x430, 0x442, 0x448)
+# STM32L4 devices with two banks of half flash size
+_L4_DUAL_BANK = (0x415, 0x461)
+
+
+def find_driver_class(dev_id):
+    """Find flash driver class for device ID
+
+    Arguments:
+        dev_id: device ID (DBGMCU_IDCODE & 0xfff)
+
+    Return:
+        subclass of FlashDriver or None
+    """
+    for driver_class in DRIVERS:
+        if dev_id in driver_class.DEV_IDS:
+            return driver_class
+    return None
+
+
+def detect_driver(swd):
+    """Detect flash driver of connected MCU
+
+    Arguments:
+        swd: instance of swd.Swd
+
+    Return:
+        instance of FlashDriver for detected MCU
+
+    Raises:
+        FlashException: if MCU is not supported
+    """
+    for idcode_reg in DBGMCU_IDCODE_REGS:
+        try:
+            dev_id = swd.get_mem32(idcode_reg) & 0xfff
+        except _stlink.StlinkException:
+            continue
+        driver_class = find_driver_class(dev_id)
+        if driver_class is None:
+            continue
+        flash_size = int.from_bytes(
+            swd.read_mem8(driver_class.FLASH_SIZE_REG, 2), 'little') * 1024
+        if issubclass(driver_class, FlashDriverF0):
+            return driver_class(
+                flash_size, page_size=2048 if dev_id in _LARGE_PAGES else 1024)
+        if driver_class is FlashDriverL4:
+            return driver_class(
+                flash_size, dual_bank=dev_id in _L4_DUAL_BANK)
+        return driver_class(flash_size)
+    raise FlashException("Not supported MCU")
+
+
+class FlashHashCache():
+    """Host cache of CRC32 of programmed sectors
+
+    CRC32 of sectors programmed by Flash.update() are stored for each MCU
+    by its unique ID, so next update compare new image only with cache
+    and does not need to read anything from flash. Cache is valid only if
+    flash is changed only by update() with this cache.
+    """
+
+    def __init__(self, path=None):
+        """Hash cache constructor
+
+        Arguments:
+            path: JSON file where cache is stored, None keep cache only
+                in memory
+        """
+        self._path = path
+        self._devices = {}
+        if path is not None and _os.path.exists(path):
+            with open(path) as cache_file:
+                self._devices = _json.load(cache_file)
+
+    def get(self, uid, sector):
+        """Get CRC32 of sector
+
+        Arguments:
+            uid: unique ID of MCU (bytes)
+            sector: instance of FlashSector
+
+        Return:
+            CRC32 of sector or None if it is not cached
+        """
+        return self._devices.get(uid.hex(), {}).get(
+            '0x%08x' % sector.address)
+
+    def put(self, uid, sector, crc):
+        """Store CRC32 of sector
+
+        Arguments:
+            uid: unique ID of MCU (bytes)
+            sector: instance of FlashSector
+            crc: CRC32 of whole sector
+        """
+        self._devices.setdefault(uid.hex(), {})[
+            '0x%08x' % sector.address] = crc
+
+    def invalidate(self, uid, sectors=None):
+        """Remove cached sectors of MCU
+
+        Arguments:
+            uid: unique ID of MCU (bytes)
+            sectors: list of FlashSector, None remove all sectors
+        """
+        if sectors is None:
+            self._devices.pop(uid.hex(), None)
+            return
+        device = self._devices.get(uid.hex(), {})
+        for sector in sectors:
+            device.pop('0x%08x' % sector.address, None)
+
+    def save(self):
+        """Store cache into file"""
+        if self._path is None:
+            return
+        with open(self._path, 'w') as cache_file:
+            _json.dump(self._devices, cache_file, indent=1, sort_keys=True)
+
+
+class Flash():
+    """Flash memory programmer
+
+    Core should be halted (e.g. by CortexM.reset_halt()) before erase
+    or programming, because code running from flash is stalled and
+    can interfere with flash controller.
+    """
+
+    # size of loader params and two buffer descriptors
+    _PARAMS_SIZE = 5 * 4
+    _BUFFERS_SIZE = 2 * 3 * 4
+    _STACK_SIZE = 64
+    # size of buffer descriptor 0xffffffff stop loader
+    _STOP = 0xffffffff
+
+    def __init__(
+            self, cortexm, driver=None, scratch=0x20000000,
+            buffer_size=4096):
+        """Flash constructor
+
+        Arguments:
+            cortexm: instance of swd.CortexM
+            driver: instance of FlashDriver, None detect MCU
+            scratch: address of scratch area in RAM for loader and two
+                buffers (about 200 Bytes and 2 * buffer_size)
+            buffer_size: size of one buffer, multiple of 32 Bytes
+
+        Raises:
+            FlashException: if buffer size is wrong or MCU is not supported
+        """
+        if buffer_size <= 0 or buffer_size % 32:
+            raise FlashException("Buffer size must be multiple of 32 Bytes")
+        self._cortexm = cortexm
+        self._swd = cortexm.swd
+        if driver is None:
+            driver = detect_driver(self._swd)
+        self._driver = driver
+        self._scratch = scratch
+        self._buffer_size = buffer_size
+
+    @property
+    def driver(self):
+        """Flash driver"""
+        return self._driver
+
+    def sectors(self):
+        """List of all flash sectors"""
+        return self._driver.sectors()
+
+    def erase_plan(self, address, size):
+        """Sectors which must be erased before writing of range
+
+        Arguments:
+            address: start address of range
+            size: size of range in bytes
+
+        Return:
+            list of FlashSector
+
+        Raises:
+            FlashException: if range is not inside flash
+        """
+        flash_address = self._driver.FLASH_ADDRESS
+        if (address < flash_address or
+                address + size > flash_address + self._driver.flash_size):
+            raise FlashException(
+                "Range 0x%08x - 0x%08x is not in flash" % (
+                    address, address + size))
+        return [
+            sector for sector in self._driver.sectors()
+            if sector.address < address + size and address < sector.end]
+
+    def _get_reg(self, sector, offset):
+        return self._swd.get_mem32(self._driver.registers(sector) + offset)
+
+    def _set_reg(self, sector, offset, value):
+        self._swd.set_mem32(self._driver.registers(sector) + offset, value)
+
+    def _unlock(self, sector):
+        driver = self._driver
+        if not self._get_reg(sector, driver.CR) & driver.CR_LOCK:
+            return
+        self._set_reg(sector, driver.KEYR, driver.KEY1)
+        self._set_reg(sector, driver.KEYR, driver.KEY2)
+        if self._get_reg(sector, driver.CR) & driver.CR_LOCK:
+            raise FlashException("Flash can not be unlocked")
+
+    def _lock(self, sector):
+        self._set_reg(sector, self._driver.CR, self._driver.CR_LOCK)
+
+    def _clear_status(self, sector):
+        driver = self._driver
+        self._set_reg(
+            sector, driver.SR if driver.CCR is None else driver.CCR,
+            driver.SR_CLEAR)
+
+    def _check_status(self, sector, status):
+        if status & self._driver.SR_ERRORS:
+            self._clear_status(sector)
+            raise FlashException("Flash error, SR: 0x%08x" % status)
+
+    def _wait_ready(self, sector, timeout):
+        deadline = _time.monotonic() + timeout
+        while True:
+            status = self._get_reg(sector, self._driver.SR)
+            if not status & self._driver.SR_BUSY:
+                break
+            if _time.monotonic() > deadline:
+                raise FlashException("Flash timeout")
+        self._check_status(sector, status)
+
+    def _erase_sector(self, sector, timeout):
+        driver = self._driver
+        command = driver.erase_command(sector)
+        self._set_reg(sector, driver.CR, command)
+        if driver.AR is not None:
+            self._set_reg(sector, driver.AR, sector.address)
+        self._set_reg(sector, driver.CR, command | driver.CR_START)
+        try:
+            self._wait_ready(sector, timeout)
+        finally:
+            self._set_reg(sector, driver.CR, 0)
+
+    def erase(
+            self, address, size, progress=None, timeout=5.0,
+            skip_blank=False):
+        """Erase all sectors overlapping range
+
+        Arguments:
+            address: start address of range
+            size: size of range in bytes
+            progress: callable progress('erase', done, total) called
+                after each sector with number of erased bytes
+            timeout: maximum time of erase of one sector in seconds
+            skip_blank: already erased sectors are found by blank check
+                on MCU and skipped
+
+        Return:
+            list of erased FlashSector
+        """
+        sectors = self.erase_plan(address, size)
+        if skip_blank:
+            sectors = [
+                sector for sector, is_blank in zip(
+                    sectors, self.blank_sectors(sectors))
+                if not is_blank]
+        self.erase_sectors(sectors, progress=progress, timeout=timeout)
+        return sectors
+
+    def erase_sectors(self, sectors, progress=None, timeout=5.0):
+        """Erase sectors
+
+        Arguments:
+            sectors: list of FlashSector
+            progress: callable progress('erase', done, total)
+            timeout: maximum time of erase of one sector in seconds
+
+        Raises:
+            FlashException: on error reported by flash controller
+        """
+        total = sum(sector.size for sector in sectors)
+        done = 0
+        # registers of unlocked controllers and one of their sectors
+        unlocked = {}
+        try:
+            for sector in sectors:
+                registers = self._driver.registers(sector)
+                if registers not in unlocked:
+                    self._unlock(sector)
+                    unlocked[registers] = sector
+                    self._clear_status(sector)
+                self._erase_sector(sector, timeout)
+                self._swd.invalidate_cache(sector.address, sector.size)
+                done += sector.size
+                if progress is not None:
+                    progress('erase', done, total)
+        finally:
+            for sector in unlocked.values():
+                self._lock(sector)
+
+    def _segments(self, address, data):
+        """Split data into parts programmed by one flash controller
+
+        Return:
+            list of tuples with (first sector, address, data)
+        """
+        segments = []
+        end = address + len(data)
+        for sector in self.erase_plan(address, len(data)):
+            if segments and (
+                    self._driver.registers(segments[-1][0]) ==
+                    self._driver.registers(sector)):
+                continue
+            segments.append((sector, max(address, sector.address)))
+        result = []
+        for index, (sector, start) in enumerate(segments):
+            stop = segments[index + 1][1] if index + 1 < len(segments) else end
+            result.append(
+                (sector, start, data[start - address:stop - address]))
+        return result
+
+    def _align(self, address, data):
+        """Pad data by erased bytes to program size"""
+        program_size = self._driver.PROGRAM_SIZE
+        head = address % program_size
+        data = b'\xff' * head + bytes(data)
+        data += b'\xff' * (-len(data) % program_size)
+        return address - head, data
+
+    def program(self, address, data, progress=None, timeout=5.0):
+        """Program data into erased flash
+
+        Data are aligned to program size of flash by erased bytes.
+
+        Arguments:
+            address: start address in flash
+            data: bytes or any buffer of data
+            progress: callable progress('program', done, total) called
+                after upload of each buffer with number of uploaded bytes
+            timeout: maximum time of programming of one buffer in seconds
+
+        Raises:
+            FlashException: on error reported by flash controller
+        """
+        if not len(data):
+            return
+        address, data = self._align(address, data)
+        total = len(data)
+        done = 0
+        for sector, start, segment in self._segments(address, data):
+            self._unlock(sector)
+            try:
+                self._clear_status(sector)
+                self._program_segment(
+                    sector, start, segment, progress, done, total, timeout)
+            finally:
+                self._set_reg(sector, self._driver.CR, 0)
+                self._lock(sector)
+                self._swd.invalidate_cache(start, len(segment))
+            done += len(segment)
+
+    def _program_segment(
+            self, sector, address, data, progress, done, total, timeout):
+        driver = self._driver
+        entry, return_address = self._cortexm.load_routine(
+            _routines.FLASH_LOADER, self._scratch)
+        params = (entry + len(_routines.FLASH_LOADER) + 3) & ~3
+        buffers = params + self._PARAMS_SIZE
+        stack_pointer = (
+            buffers + self._BUFFERS_SIZE + self._STACK_SIZE + 7) & ~7
+        data_buffers = (stack_pointer, stack_pointer + self._buffer_size)
+        self._swd.write_mem32(params, _struct.pack(
+            '<5L6L',
+            driver.registers(sector) + driver.SR, driver.SR_BUSY,
+            driver.SR_ERRORS, driver.PROGRAM_SIZE,
+            1 if driver.PROGRAM_HALFWORD else 0, *([0] * 6)))
+        self._set_reg(sector, driver.CR, driver.CR_PROGRAM)
+        context = self._cortexm.start_call(
+            entry, (buffers, params), stack_pointer=stack_pointer,
+            return_address=return_address)
+        try:
+            self._feed_loader(
+                buffers, data_buffers, address, data, progress, done, total,
+                timeout)
+        except Exception:
+            # stop loader and restore core, original error is reported
+            self._cortexm.halt()
+            try:
+                self._cortexm.finish_call(context, timeout=timeout)
+            except _cortexm.CortexMException:
+                pass
+            raise
+        status = self._cortexm.finish_call(context, timeout=timeout)
+        self._check_status(sector, status)
+
+    def _feed_loader(
+            self, buffers, data_buffers, address, data, progress, done,
+            total, timeout):
+        """Upload data into free buffers of running loader and stop it"""
+        index = 0
+        for offset in range(0, len(data), self._buffer_size):
+            chunk = data[offset:offset + self._buffer_size]
+            descriptor = buffers + index * 12
+            if not self._wait_buffer(descriptor, timeout):
+                # loader stopped on error
+                return
+            self._swd.write_mem32(
+                data_buffers[index], chunk + b'\xff' * (-len(chunk) % 4))
+            # size is written last, so loader see complete descriptor
+            self._swd.write_mem32(descriptor, _struct.pack(
+                '<3L', data_buffers[index], address + offset, len(chunk)))
+            index ^= 1
+            if progress is not None:
+                progress('program', done + offset + len(chunk), total)
+        descriptor = buffers + index * 12
+        if self._wait_buffer(descriptor, timeout):
+            self._swd.set_mem32(descriptor + 8, self._STOP)
+
+    def _wait_buffer(self, descriptor, timeout):
+        """Wait until loader free buffer, False if loader is stopped"""
+        deadline = _time.monotonic() + timeout
+        while self._swd.get_mem32(descriptor + 8):
+            if self._cortexm.is_halted():
+                return False
+            if _time.monotonic() > deadline:
+                raise FlashException("Loader timeout")
+        return True
+
+    def write(self, address, data, progress=None, verify=True):
+        """Erase sectors and program data
+
+        Content of erased sectors outside of data is lost.
+
+        Arguments:
+            address: start address in flash
+            data: bytes or any buffer of data
+            progress: callable progress(operation, done, total), where
+                operation is 'erase' or 'program'
+            verify: compare CRC32 of flash with data
+
+        Raises:
+            FlashException: on error or if verification fails
+        """
+        self.erase(address, len(data), progress=progress)
+        self.program(address, data, progress=progress)
+        if verify and not self.verify(address, data):
+            raise FlashException("Verification failed")
+
+    def get_uid(self):
+        """Read 96 bit unique device ID
+
+        Return:
+            12 bytes of unique ID
+        """
+        if self._driver.UID_REG is None:
+            raise FlashException("Unique ID is not known")
+        return b''.join(
+            _struct.pack('<L', self._swd.get_mem32(self._driver.UID_REG + i))
+            for i in range(0, 12, 4))
+
+    def _sector_images(self, address, data):
+        """Expected content of whole sectors after erase and programming
+
+        Return:
+            list of tuples with (FlashSector, bytes)
+        """
+        data = bytes(data)
+        images = []
+        for sector in self.erase_plan(address, len(data)):
+            start = max(address, sector.address)
+            end = min(address + len(data), sector.end)
+            images.append((sector, (
+                b'\xff' * (start - sector.address)
+                + data[start - address:end - address]
+                + b'\xff' * (sector.end - end))))
+        return images
+
+    def sector_checksums(self, sectors, method=CHECKSUM_TARGET):
+        """CRC32 of whole sectors in flash
+
+        Arguments:
+            sectors: list of FlashSector
+            method: CHECKSUM_TARGET compute CRC32 on MCU and transfer only
+                results, CHECKSUM_READ read sectors and compute CRC32 on
+                host
+
+        Return:
+            list of CRC32 (same as zlib.crc32())
+        """
+        if method == CHECKSUM_READ:
+            return [
+                _zlib.crc32(self._swd.read(sector.address, sector.size))
+                for sector in sectors]
+        if method != CHECKSUM_TARGET:
+            raise FlashException("Unknown checksum method: %s" % method)
+        crcs = []
+        for address, size, count in self._sector_runs(sectors):
+            crcs.extend(self._cortexm.checksum_sectors(
+                address, size * count, size, scratch=self._scratch))
+        return crcs
+
+    @staticmethod
+    def _sector_runs(sectors):
+        """Group consecutive sectors of same size for one routine call
+
+        Return:
+            list of [address, sector size, count]
+        """
+        runs = []
+        for sector in sectors:
+            if runs and runs[-1][1] == sector.size and (
+                    runs[-1][0] + runs[-1][1] * runs[-1][2] == sector.address):
+                runs[-1][2] += 1
+            else:
+                runs.append([sector.address, sector.size, 1])
+        return runs
+
+    def blank_sectors(self, sectors, samples=None):
+        """Check which sectors are erased (all bytes are 0xff)
+
+        Arguments:
+            sectors: list of FlashSector
+            samples: None check whole sectors on MCU, number of words
+                read by host from each sector for coarse check (sector
+                with programmed word out of samples is reported as erased)
+
+        Return:
+            list of bool, True for erased sector
+
+        Raises:
+            FlashException: if sector is not aligned to 4 Bytes
+        """
+        if samples is None:
+            if any((sector.address | sector.size) % 4 for sector in sectors):
+                raise FlashException("Sectors must be aligned to 4 Bytes")
+            result = []
+            for address, size, count in self._sector_runs(sectors):
+                result.extend(self._cortexm.blank_check_sectors(
+                    address, size * count, size, scratch=self._scratch))
+            return result
+        addresses = []
+        for sector in sectors:
+            step = max(4, (sector.size // samples) & ~3)
+            addresses.append(range(sector.address, sector.end, step)[:samples])
+        values = iter(self._swd.get_mem32_many(
+            address for sector_addresses in addresses
+            for address in sector_addresses))
+        return [
+            all([next(values) == 0xffffffff for _ in sector_addresses])
+            for sector_addresses in addresses]
+
+    def read_sparse(self, address, size, samples=None, progress=None):
+        """Read flash without erased sectors
+
+        Arguments:
+            address: start address in flash
+            size: number of bytes
+            samples: None check whole sectors on MCU, number of words for
+                coarse check by host (see blank_sectors())
+            progress: callable progress('read', done, total) called after
+                each read segment with number of checked bytes
+
+        Return:
+            list of tuples with (address, bytes) of not erased parts,
+            neighbouring sectors are merged
+        """
+        sectors = self.erase_plan(address, size)
+        blank = self.blank_sectors(sectors, samples=samples)
+        end = address + size
+        segments = []
+        for sector, is_blank in zip(sectors, blank):
+            if is_blank:
+                continue
+            start = max(address, sector.address)
+            stop = min(end, sector.end)
+            if segments and segments[-1][1] == start:
+                segments[-1][1] = stop
+            else:
+                segments.append([start, stop])
+        result = []
+        for start, stop in segments:
+            result.append((start, self._swd.read(start, stop - start)))
+            if progress is not None:
+                progress('read', stop - address, size)
+        if progress is not None:
+            progress('read', size, size)
+        return result
+
+    def changed_sectors(
+            self, address, data, method=CHECKSUM_TARGET, hash_cache=None):
+        """Sectors which content differ from sectors written by write()
+
+        Arguments:
+            address: start address in flash
+            data: bytes or any buffer of data
+            method: CHECKSUM_TARGET or CHECKSUM_READ
+            hash_cache: instance of FlashHashCache, if all sectors are
+                cached for this MCU, then flash is not checked
+
+        Return:
+            list of FlashSector
+        """
+        return [
+            sector for sector, crc, expected_crc in self._compare_sectors(
+                address, data, method, hash_cache)
+            if crc != expected_crc]
+
+    def _compare_sectors(self, address, data, method, hash_cache):
+        """CRC32 of sectors in flash (or in cache) and expected CRC32
+
+        Return:
+            list of tuples with (FlashSector, CRC32, expected CRC32)
+        """
+        images = self._sector_images(address, data)
+        expected = [_zlib.crc32(image) for _, image in images]
+        sectors = [sector for sector, _ in images]
+        crcs = None
+        if hash_cache is not None:
+            uid = self.get_uid()
+            crcs = [hash_cache.get(uid, sector) for sector in sectors]
+            if None in crcs:
+                crcs = None
+        if crcs is None:
+            crcs = self.sector_checksums(sectors, method=method)
+        return list(zip(sectors, crcs, expected))
+
+    def update(
+            self, address, data, progress=None, verify=True,
+            method=CHECKSUM_TARGET, hash_cache=None):
+        """Erase and program only sectors which differ
+
+        Result is same as write(), but unchanged sectors are skipped and
+        changed sectors which are already erased are only programmed.
+
+        Arguments:
+            address: start address in flash
+            data: bytes or any buffer of data
+            progress: callable progress(operation, done, total), where
+                operation is 'erase' or 'program'
+            verify: compare CRC32 of flash with data
+            method: CHECKSUM_TARGET or CHECKSUM_READ
+            hash_cache: instance of FlashHashCache
+
+        Return:
+            list of reprogrammed FlashSector
+
+        Raises:
+            FlashException: on error or if verification fails
+        """
+        data = bytes(data)
+        sectors = []
+        erase_sectors = []
+        for sector, crc, expected_crc in self._compare_sectors(
+                address, data, method, hash_cache):
+            if crc == expected_crc:
+                continue
+            sectors.append(sector)
+            if crc != _zlib.crc32(b'\xff' * sector.size):
+                erase_sectors.append(sector)
+        uid = self.get_uid() if hash_cache is not None else None
+        if uid is not None:
+            hash_cache.invalidate(uid, sectors)
+        try:
+            self.erase_sectors(erase_sectors, progress=progress)
+            self._program_sectors(address, data, sectors, progress)
+            if verify and not self.verify(address, data):
+                raise FlashException("Verification failed")
+        except Exception:
+            if uid is not None:
+                hash_cache.invalidate(uid)
+                hash_cache.save()
+            raise
+        if uid is not None:
+            for sector, image in self._sector_images(address, data):
+                hash_cache.put(uid, sector, _zlib.crc32(image))
+            hash_cache.save()
+        return sectors
+
+    def _program_sectors(self, address, data, sectors, progress):
+        """Program part of data in sectors, continuous sectors at once"""
+        ranges = []
+        for sector in sectors:
+            start = max(address, sector.address)
+            end = min(address + len(data), sector.end)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        total = sum(end - start for start, end in ranges)
+        done = 0
+        for start, end in ranges:
+            range_progress = None
+            if progress is not None:
+                # padding to program size is not counted
+                def range_progress(
+                        operation, range_done, unused_total,
+                        done=done, size=end - start):
+                    progress(operation, done + min(range_done, size), total)
+            self.program(
+                start, data[start - address:end - address],
+                progress=range_progress)
+            done += end - start
+
+    def verify(self, address, data):
+        """Compare flash with data by CRC32 computed on MCU
+
+        Arguments:
+            address: start address in flash
+            data: bytes or any buffer of data
+
+        Return:
+            True if flash contains data
+        """
+        return self._cortexm.checksum(
+            address, len(data), scratch=self._scratch) == _zlib.crc32(data)
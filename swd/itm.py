@@ -0,0 +1,332 @@
+"""ITM and DWT trace packet decoder
+
+Decoder of SWO byte stream (e.g. from swd.swo.SwoCapture) into records.
+Headers are classified by table and runs of same source packets (e.g.
+printf on one stimulus port or periodic PC samples) are decoded by
+slicing with step of packet size, so bytes are not processed one by one.
+Incomplete packet at end of chunk is kept until next chunk.
+"""
+
+import array as _array
+import collections as _collections
+import sys as _sys
+
+STIMULUS = 'stimulus'
+PC_SAMPLE = 'pc_sample'
+SLEEP = 'sleep'
+EVENT_COUNTER = 'event_counter'
+EXCEPTION = 'exception'
+DATA_PC = 'data_pc'
+DATA_ADDRESS = 'data_address'
+DATA_READ = 'data_read'
+DATA_WRITE = 'data_write'
+HARDWARE = 'hardware'
+OVERFLOW = 'overflow'
+SYNC = 'sync'
+TIMESTAMP = 'timestamp'
+GLOBAL_TIMESTAMP = 'global_timestamp'
+EXTENSION = 'extension'
+UNKNOWN = 'unknown'
+
+ItmRecord = _collections.namedtuple('ItmRecord', 'kind address value')
+ItmRecord.__doc__ = """Decoded trace record
+
+kind: one of record kinds:
+    STIMULUS: address is port number, value are bytes written into
+        port, consecutive writes into same port are merged regardless
+        of their size (e.g. word writes of printf with byte tail)
+    PC_SAMPLE: value is array of sampled PC values
+    SLEEP: value is number of PC samples while core was sleeping
+    EVENT_COUNTER: value are bits of wrapped DWT counters
+    EXCEPTION: address is exception number, value is function
+        (1: entry, 2: exit, 3: return)
+    DATA_PC, DATA_ADDRESS, DATA_READ, DATA_WRITE: address is DWT
+        comparator, value is PC, address offset or data value
+    HARDWARE: address is discriminator ID of other hardware packet
+    OVERFLOW, SYNC: without address and value
+    TIMESTAMP: address is TC (relation to trace data), value is delta
+    GLOBAL_TIMESTAMP: address is 1 or 2 (GTS1 or GTS2 packet)
+    EXTENSION: address is SH bit, value is extension information
+    UNKNOWN: value is reserved header byte
+"""
+
+# header classes
+_SOURCE = 0
+_ZERO = 1
+_OVERFLOW = 2
+_LTS_SHORT = 3
+_LTS = 4
+_GTS = 5
+_EXTENSION = 6
+_RESERVED = 7
+
+_MAX_PAYLOAD = {_LTS: 4, _GTS: 6, _EXTENSION: 4}
+_SYNC_ZEROS = 5
+_SYNC_END = 0x80
+_SOURCE_SIZES = (0, 1, 2, 4)
+_DWT_EVENT_COUNTER = 0
+_DWT_EXCEPTION = 1
+_DWT_PC_SAMPLE = 2
+# first run check, then window is doubled until end of run
+_RUN_WINDOW = 16
+
+
+def _classify(header):
+    if header == 0x00:
+        return _ZERO
+    if header == 0x70:
+        return _OVERFLOW
+    if header & 0x03:
+        return _SOURCE
+    if header in (0x94, 0xb4):
+        return _GTS
+    if header & 0x0f == 0x00:
+        if header & 0x80:
+            return _LTS if header & 0x40 else _RESERVED
+        return _LTS_SHORT
+    if header & 0x04:
+        return _EXTENSION
+    return _RESERVED
+
+
+_HEADERS = bytes(_classify(header) for header in range(256))
+
+
+def _words(data):
+    """Convert little endian 32 bit words"""
+    words = _array.array('L' if _array.array('L').itemsize == 4 else 'I')
+    words.frombytes(data)
+    if _sys.byteorder != 'little':
+        words.byteswap()
+    return words
+
+
+class ItmDecoder:
+    """Incremental decoder of ITM and DWT packets
+
+    Usage:
+        decoder = ItmDecoder()
+        for chunk in swo.chunks():
+            for record in decoder.decode(chunk):
+                ...
+            print(decoder.read_port(0).decode(), end='')
+    """
+
+    def __init__(self, streams=True):
+        """ItmDecoder constructor
+
+        Arguments:
+            streams: if True, data of stimulus ports are also collected
+                into per port streams, see read_port()
+        """
+        self._streams = {} if streams else None
+        self._pending = b''
+        self._zeros = 0
+        self._overflows = 0
+
+    @property
+    def pending(self):
+        """Number of bytes of incomplete packet waiting for next chunk"""
+        return len(self._pending)
+
+    @property
+    def overflows(self):
+        """Number of overflow packets"""
+        return self._overflows
+
+    @property
+    def ports(self):
+        """List of stimulus ports with collected data"""
+        if self._streams is None:
+            return []
+        return sorted(
+            port for port, stream in self._streams.items() if stream)
+
+    def read_port(self, port):
+        """Read and remove collected data of stimulus port
+
+        Arguments:
+            port: stimulus port number
+
+        Return:
+            bytes of data written into port since last read
+        """
+        if self._streams is None:
+            return b''
+        stream = self._streams.pop(port, None)
+        return bytes(stream) if stream else b''
+
+    def records(self, chunks):
+        """Generator of records from iterable of chunks
+
+        Arguments:
+            chunks: iterable of bytes (e.g. SwoCapture.chunks())
+
+        Yield:
+            ItmRecord
+        """
+        for chunk in chunks:
+            yield from self.decode(chunk)
+
+    def decode(self, chunk):
+        """Decode next chunk of trace stream
+
+        Arguments:
+            chunk: bytes, bytearray or memoryview
+
+        Return:
+            list of ItmRecord
+        """
+        data = self._pending + bytes(chunk)
+        records = []
+        offset = self._decode(data, records)
+        self._pending = data[offset:]
+        return records
+
+    def _run_length(self, data, start, stride, header):
+        """Return number of consecutive packets with same header"""
+        available = (len(data) - start) // stride
+        header = bytes((header, ))
+        window = _RUN_WINDOW
+        while True:
+            count = min(window, available)
+            headers = data[start:start + count * stride:stride]
+            run = count - len(headers.lstrip(header))
+            if run < count or count == available:
+                return run
+            window *= 2
+
+    @staticmethod
+    def _payloads(data, start, run, size):
+        """Return payloads of run of packets without headers"""
+        stride = size + 1
+        end = start + run * stride
+        if size == 1:
+            return data[start + 1:end:stride]
+        payloads = bytearray(run * size)
+        for index in range(size):
+            payloads[index::size] = data[start + 1 + index:end:stride]
+        return bytes(payloads)
+
+    def _stimulus(self, records, port, payloads):
+        if records and records[-1].kind == STIMULUS and (
+                records[-1].address == port):
+            records[-1] = ItmRecord(
+                STIMULUS, port, records[-1].value + payloads)
+        else:
+            records.append(ItmRecord(STIMULUS, port, payloads))
+        if self._streams is not None:
+            stream = self._streams.get(port)
+            if stream is None:
+                stream = self._streams[port] = bytearray()
+            stream += payloads
+
+    @staticmethod
+    def _hardware(records, discriminator, size, payloads):
+        if discriminator == _DWT_PC_SAMPLE and size == 4:
+            records.append(ItmRecord(PC_SAMPLE, None, _words(payloads)))
+            return
+        if discriminator == _DWT_PC_SAMPLE and size == 1:
+            records.append(ItmRecord(SLEEP, None, len(payloads)))
+            return
+        for index in range(0, len(payloads), size):
+            value = int.from_bytes(payloads[index:index + size], 'little')
+            if discriminator == _DWT_EVENT_COUNTER:
+                records.append(ItmRecord(EVENT_COUNTER, None, value))
+            elif discriminator == _DWT_EXCEPTION:
+                records.append(ItmRecord(
+                    EXCEPTION, value & 0x1ff, (value >> 12) & 0x3))
+            elif 8 <= discriminator < 16:
+                comparator = (discriminator >> 1) & 0x3
+                records.append(ItmRecord(
+                    DATA_ADDRESS if discriminator & 1 else DATA_PC,
+                    comparator, value))
+            elif 16 <= discriminator < 24:
+                comparator = (discriminator >> 1) & 0x3
+                records.append(ItmRecord(
+                    DATA_WRITE if discriminator & 1 else DATA_READ,
+                    comparator, value))
+            else:
+                records.append(ItmRecord(HARDWARE, discriminator, value))
+
+    def _decode(self, data, records):
+        """Decode complete packets, return offset of incomplete packet"""
+        size_data = len(data)
+        offset = 0
+        while offset < size_data:
+            header = data[offset]
+            cls = _HEADERS[header]
+            if cls == _SOURCE:
+                self._zeros = 0
+                size = _SOURCE_SIZES[header & 0x03]
+                stride = size + 1
+                if offset + stride > size_data:
+                    return offset
+                run = 1
+                if (offset + 2 * stride <= size_data
+                        and data[offset + stride] == header):
+                    run = self._run_length(data, offset, stride, header)
+                payloads = self._payloads(data, offset, run, size)
+                if header & 0x04:
+                    self._hardware(records, header >> 3, size, payloads)
+                else:
+                    self._stimulus(records, header >> 3, payloads)
+                offset += run * stride
+            elif cls == _ZERO:
+                self._zeros += 1
+                offset += 1
+            elif header == _SYNC_END and self._zeros >= _SYNC_ZEROS:
+                self._zeros = 0
+                records.append(ItmRecord(SYNC, None, None))
+                offset += 1
+            elif cls == _OVERFLOW:
+                self._zeros = 0
+                self._overflows += 1
+                records.append(ItmRecord(OVERFLOW, None, None))
+                offset += 1
+            elif cls == _LTS_SHORT:
+                self._zeros = 0
+                records.append(ItmRecord(TIMESTAMP, 0, header >> 4))
+                offset += 1
+            elif cls in _MAX_PAYLOAD:
+                self._zeros = 0
+                end = offset + 1
+                if cls != _EXTENSION or header & 0x80:
+                    # payload bytes with continuation bit
+                    limit = min(offset + _MAX_PAYLOAD[cls], size_data)
+                    while end < limit and data[end] & 0x80:
+                        end += 1
+                    if end >= size_data:
+                        return offset
+                    end += 1
+                value = 0
+                for index, byte in enumerate(data[offset + 1:end]):
+                    value |= (byte & 0x7f) << (7 * index)
+                if cls == _LTS:
+                    records.append(ItmRecord(
+                        TIMESTAMP, (header >> 4) & 0x03, value))
+                elif cls == _GTS:
+                    records.append(ItmRecord(
+                        GLOBAL_TIMESTAMP, 1 if header == 0x94 else 2, value))
+                else:
+                    records.append(ItmRecord(
+                        EXTENSION, (header >> 3) & 0x01,
+                        (header >> 4) & 0x07 | value << 3))
+                offset = end
+            else:
+                self._zeros = 0
+                records.append(ItmRecord(UNKNOWN, None, header))
+                offset += 1
+        return offset
+
+
+def decode(data):
+    """Decode whole trace stream
+
+    Arguments:
+        data: bytes of trace data
+
+    Return:
+        list of ItmRecord
+    """
+    return ItmDecoder(streams=False).decode(data)
@@ -0,0 +1,180 @@
+"""Memory map with access properties of memory regions
+"""
+
+
+class MemoryMapException(Exception):
+    """MemoryMap general exception"""
+
+
+class MemoryRegion():
+    """Memory region with access properties"""
+
+    def __init__(
+            self, address, size, name='',
+            cacheable=False, word_access=False, ram=False):
+        """Memory region constructor
+
+        Arguments:
+            address: start address of region
+            size: size of region in bytes
+            name: name of region
+            cacheable: content is not changed by MCU itself (flash, ROM),
+                so it can be cached on host
+            word_access: 32 bit access can be used to read any byte
+                (reading of more bytes has no side effects)
+            ram: plain memory, where bytes can be read and written back
+                without side effects
+        """
+        self._address = address
+        self._size = size
+        self._name = name
+        self._cacheable = cacheable
+        self._word_access = word_access
+        self._ram = ram
+
+    def __repr__(self):
+        return "MemoryRegion(0x%08x, 0x%08x, %r)" % (
+            self._address, self._size, self._name)
+
+    @property
+    def address(self):
+        """Start address of region"""
+        return self._address
+
+    @property
+    def size(self):
+        """Size of region"""
+        return self._size
+
+    @property
+    def end(self):
+        """Address after end of region"""
+        return self._address + self._size
+
+    @property
+    def name(self):
+        """Name of region"""
+        return self._name
+
+    @property
+    def cacheable(self):
+        """Content of region can be cached"""
+        return self._cacheable
+
+    @property
+    def word_access(self):
+        """32 bit access is safe for any byte in region"""
+        return self._word_access
+
+    @property
+    def ram(self):
+        """Region is plain RAM"""
+        return self._ram
+
+    def contains(self, address, size=1):
+        """Check if whole range is in this region"""
+        return self._address <= address and address + size <= self.end
+
+
+class MemoryMap():
+    """Memory map of MCU
+
+    Ranges not covered by any region are volatile with exact byte access.
+    """
+
+    def __init__(self, regions=None):
+        """Memory map constructor
+
+        Arguments:
+            regions: list of MemoryRegion, default is Cortex-M memory map
+        """
+        self._regions = []
+        if regions is None:
+            regions = self.default_regions()
+        for region in regions:
+            self.add_region(region)
+
+    @staticmethod
+    def default_regions():
+        """Default regions of Cortex-M architecture
+
+        Code region (flash, system memory) is cacheable, SRAM and external
+        RAM are plain RAM, peripherals, external devices and private
+        peripheral bus are volatile. MCUs with RAM in code region (e.g.
+        CCM RAM) need own memory map.
+
+        Return:
+            list of MemoryRegion
+        """
+        return [
+            MemoryRegion(
+                0x00000000, 0x20000000, 'CODE',
+                cacheable=True, word_access=True),
+            MemoryRegion(
+                0x20000000, 0x20000000, 'SRAM',
+                word_access=True, ram=True),
+            MemoryRegion(0x40000000, 0x20000000, 'PERIPHERAL'),
+            MemoryRegion(
+                0x60000000, 0x40000000, 'EXTERNAL_RAM',
+                word_access=True, ram=True),
+            MemoryRegion(0xa0000000, 0x40000000, 'EXTERNAL_DEVICE'),
+            MemoryRegion(0xe0000000, 0x000ff000, 'PPB'),
+            MemoryRegion(
+                0xe00ff000, 0x00001000, 'ROM_TABLE',
+                cacheable=True, word_access=True),
+            MemoryRegion(0xe0100000, 0x1ff00000, 'VENDOR_SYSTEM'),
+        ]
+
+    @property
+    def regions(self):
+        """List of regions sorted by address"""
+        return list(self._regions)
+
+    def add_region(self, region):
+        """Add region into memory map
+
+        Arguments:
+            region: instance of MemoryRegion
+
+        Raises:
+            MemoryMapException: if region overlap other region
+        """
+        for other in self._regions:
+            if region.address < other.end and other.address < region.end:
+                raise MemoryMapException(
+                    "Region %s overlap region %s" % (region, other))
+        self._regions.append(region)
+        self._regions.sort(key=lambda region: region.address)
+
+    def find(self, address):
+        """Find region containing address
+
+        Return:
+            instance of MemoryRegion or None
+        """
+        for region in self._regions:
+            if region.contains(address):
+                return region
+        return None
+
+    def _check(self, address, size, attribute):
+        """Check if whole range is covered by regions with attribute"""
+        end = address + size
+        while address < end:
+            region = self.find(address)
+            if region is None or not getattr(region, attribute):
+                return False
+            address = region.end
+        return True
+
+    def is_cacheable(self, address, size=1):
+        """Check if whole range can be cached"""
+        return self._check(address, size, 'cacheable')
+
+    def is_word_access(self, address, size=1):
+        """Check if whole range can be read with 32 bit access"""
+        return self._check(address, size, 'word_access')
+
+    def is_ram(self, address, size=1):
+        """Check if whole range is plain RAM"""
+        return self._check(address, size, 'ram')
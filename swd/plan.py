@@ -0,0 +1,130 @@
+"""Transfer plans for memory operations
+
+Plan split memory operation into driver transfers with 8 or 32 bit access.
+Split of plan to head, body and tail depends only on alignment of address
+and maximum transfer sizes of driver, so it is compiled once and reused for
+all addresses and sizes.
+"""
+
+import functools as _functools
+
+# read_mem: 8 bit access for unaligned head and short tail
+READ = 'read'
+# write_mem: 8 bit access for unaligned head, data are split into chunks
+# of maximum 32 bit transfer and unaligned tail of chunk use 8 bit access
+WRITE = 'write'
+# fill_mem: as READ, but unaligned fill up to maximum 8 bit transfer is
+# written at once
+FILL = 'fill'
+
+
+def _tail_read(size, maximum_8bit_data):
+    if size < maximum_8bit_data and size % 4:
+        return ((8, 0, size),)
+    size32 = size & ~3
+    if size % 4:
+        return ((32, 0, size32), (8, size32, size % 4))
+    return ((32, 0, size),)
+
+
+def _tail_write(size, maximum_8bit_data):
+    if size % 4 and size > maximum_8bit_data:
+        size32 = size & ~3
+        return ((32, 0, size32), (8, size32, size % 4))
+    return ((8 if size % 4 else 32, 0, size),)
+
+
+_TAILS = {
+    READ: _tail_read,
+    WRITE: _tail_write,
+    FILL: _tail_read,
+}
+
+
+@_functools.lru_cache(maxsize=64)
+def compile_split(policy, alignment, maximum_8bit_data, maximum_32bit_data):
+    """Compile split of memory operation to head, body and tail
+
+    Arguments:
+        policy: READ, WRITE or FILL
+        alignment: address modulo 4
+        maximum_8bit_data: maximum size of 8 bit transfer
+        maximum_32bit_data: maximum size of 32 bit transfer
+
+    Return:
+        tuple with (head size, body chunk size, body chunk transfers),
+        head size is maximum size of unaligned head (zero if address is
+        aligned), body chunk transfers are tuple of tuples with
+        (access bits, offset, size) for one full body chunk
+    """
+    head_size = maximum_8bit_data - alignment if alignment else 0
+    body_size = maximum_32bit_data
+    if policy != WRITE:
+        # all 32 bit transfers are aligned also at end
+        body_size &= ~3
+    return (
+        head_size, body_size,
+        _TAILS[policy](body_size, maximum_8bit_data))
+
+
+def plan(policy, address, size, maximum_8bit_data, maximum_32bit_data):
+    """Transfer plan for memory operation
+
+    Split is memoized, number of body chunks and tail are computed from
+    size.
+
+    Arguments:
+        policy: READ, WRITE or FILL
+        address: address in memory
+        size: number of bytes
+        maximum_8bit_data: maximum size of 8 bit transfer
+        maximum_32bit_data: maximum size of 32 bit transfer
+
+    Return:
+        tuple of tuples with (access bits, offset, size), offset is
+        relative to address
+    """
+    head_size, body_size, body = compile_split(
+        policy, address % 4, maximum_8bit_data, maximum_32bit_data)
+    transfers = []
+    offset = 0
+    if head_size and size:
+        if (policy == READ and size == maximum_8bit_data
+                or policy == FILL and size <= maximum_8bit_data):
+            # whole operation fit into one 8 bit transfer
+            head_size = size
+        offset = min(size, head_size)
+        transfers.append((8, 0, offset))
+    count, tail_size = divmod(size - offset, body_size)
+    for _ in range(count):
+        transfers.extend(
+            (bits, offset + chunk_offset, chunk_size)
+            for bits, chunk_offset, chunk_size in body)
+        offset += body_size
+    if tail_size:
+        transfers.extend(
+            (bits, offset + chunk_offset, chunk_size)
+            for bits, chunk_offset, chunk_size in _TAILS[policy](
+                tail_size, maximum_8bit_data))
+    return tuple(transfers)
+
+
+def fixed(bits, size, maximum_data):
+    """Transfer plan for memory operation with one access size
+
+    Arguments:
+        bits: access bits (8, 16 or 32)
+        size: number of bytes
+        maximum_data: maximum size of transfer
+
+    Return:
+        tuple of tuples with (access bits, offset, size), offset is
+        relative to address
+    """
+    count, tail_size = divmod(size, maximum_data)
+    transfers = [
+        (bits, offset, maximum_data)
+        for offset in range(0, count * maximum_data, maximum_data)]
+    if tail_size:
+        transfers.append((bits, count * maximum_data, tail_size))
+    return tuple(transfers)
@@ -0,0 +1,186 @@
+"""Pool of ST-Link probes
+"""
+
+import concurrent.futures as _futures
+import swd.stlink as _stlink
+import swd.stlink.usb as _usb
+from swd.swd import Swd as _Swd
+
+
+class ProbePoolException(Exception):
+    """ProbePool general exception"""
+
+    def __init__(self, message, errors=None, results=None):
+        if errors:
+            message += ": " + ', '.join(sorted(map(str, errors)))
+        super().__init__(message)
+        self._errors = errors or {}
+        self._results = results or {}
+
+    @property
+    def errors(self):
+        """Dictionary with serial number as key and exception as value"""
+        return self._errors
+
+    @property
+    def results(self):
+        """Dictionary with results of successful probes"""
+        return self._results
+
+
+class ProbePool:
+    """Pool of ST-Link probes
+
+    Every probe is opened once and has own worker thread, so jobs on
+    different probes run concurrently (pyusb release GIL during USB
+    transfers) and jobs on one probe are always serialized.
+
+    Example:
+        with swd.ProbePool() as pool:
+            idcodes = pool.run(lambda dev: dev.get_idcode())
+    """
+
+    def __init__(
+            self,
+            serial_numbers=None,
+            swd_frequency=None,
+            debug=0,
+            deferred_check=False,
+            probes=None):
+        """ProbePool constructor
+
+        Arguments:
+            serial_numbers: list of serial numbers (or begin or end part)
+                of selected probes, default are all connected probes
+            swd_frequency: SWD frequency for all probes
+            debug: debug level
+            deferred_check: deferred checking of memory transfers for Swd
+            probes: list of USB devices (StlinkUsb or compatible) used
+                instead of all connected probes
+
+        Raises:
+            ProbePoolException: if any selected probe has no or not unique
+                serial number or if any probe can not be opened
+        """
+        if probes is None:
+            probes = _usb.StlinkUsb.find_all(debug=debug)
+        if serial_numbers is not None:
+            probes = [
+                probe for probe in probes
+                if any(
+                    _usb.compare_serial_no(probe.serial_no, serial_no)
+                    for serial_no in serial_numbers)]
+        # probes are identified by serial number
+        serials = [probe.serial_no for probe in probes]
+        if None in serials or '' in serials:
+            raise ProbePoolException("Probe without serial number")
+        duplicates = {
+            serial for serial in serials if serials.count(serial) > 1}
+        if duplicates:
+            raise ProbePoolException(
+                "Duplicate serial numbers: " + ', '.join(sorted(duplicates)))
+        self._probes = probes
+        self._executors = {}
+        self._swds = {}
+        for probe in probes:
+            self._executors[probe.serial_no] = _futures.ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f"probe-{probe.serial_no}")
+        # probes are opened concurrently in own worker threads
+        futures = {
+            probe.serial_no: self._executors[probe.serial_no].submit(
+                self._open_probe, probe, swd_frequency, debug, deferred_check)
+            for probe in probes}
+        try:
+            self._swds = self._wait(futures, "Error opening probes")
+        except ProbePoolException:
+            self.close()
+            raise
+
+    @staticmethod
+    def _open_probe(probe, swd_frequency, debug, deferred_check):
+        driver = _stlink.Stlink(
+            swd_frequency=swd_frequency,
+            debug=debug,
+            usb=probe)
+        return _Swd(driver=driver, deferred_check=deferred_check)
+
+    @staticmethod
+    def _wait(futures, message):
+        results = {}
+        errors = {}
+        for serial_no, future in futures.items():
+            try:
+                results[serial_no] = future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                errors[serial_no] = err
+        if errors:
+            raise ProbePoolException(message, errors, results)
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._swds)
+
+    def __iter__(self):
+        return iter(self._swds)
+
+    def __getitem__(self, serial_no):
+        """Return Swd instance for probe with serial number"""
+        return self._swds[serial_no]
+
+    @property
+    def serial_numbers(self):
+        """List of serial numbers of all probes in pool"""
+        return list(self._swds)
+
+    def items(self):
+        """Return tuples with serial number and Swd instance"""
+        return self._swds.items()
+
+    def submit(self, serial_no, job, *args, **kwargs):
+        """Submit job for one probe into its worker
+
+        Arguments:
+            serial_no: serial number of probe
+            job: callable, called as job(swd, *args, **kwargs)
+
+        Return:
+            concurrent.futures.Future with result of job
+        """
+        return self._executors[serial_no].submit(
+            job, self._swds[serial_no], *args, **kwargs)
+
+    def run(self, job, *args, **kwargs):
+        """Run job on all probes concurrently and wait for results
+
+        Arguments:
+            job: callable, called as job(swd, *args, **kwargs)
+
+        Return:
+            dictionary with serial number as key and result as value
+
+        Raises:
+            ProbePoolException: if job fails on any probe, contain errors
+                and results of other probes
+        """
+        futures = {
+            serial_no: self.submit(serial_no, job, *args, **kwargs)
+            for serial_no in self._swds}
+        return self._wait(futures, "Job failed on probes")
+
+    def close(self):
+        """Wait for all jobs, stop workers and release USB devices"""
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        self._executors = {}
+        for probe in self._probes:
+            close = getattr(probe, 'close', None)
+            if close is not None:
+                close()
+        self._probes = []
@@ -0,0 +1,205 @@
+"""Thumb routines executed on target by CortexM.call()
+
+All routines are position independent, use only ARMv6-M instructions
+(work on all Cortex-M cores) and are called as C functions (AAPCS).
+Data used by routine (tables) are appended after code and found by ADR,
+so routine must be loaded at address aligned to 4 Bytes.
+"""
+
+import struct as _struct
+
+# void crc32_sectors(
+#     const uint8_t *address, uint32_t sector_size,
+#     uint32_t count, uint32_t *results)
+# CRC32 (same as zlib.crc32) of each sector, 256 entries table follow code
+#
+#       push    {r4, r5, r6, r7}
+#       adr     r7, table
+# sector:
+#       movs    r4, #0
+#       mvns    r4, r4              @ crc = 0xffffffff
+#       mov     r5, r1
+# byte:
+#       ldrb    r6, [r0]
+#       adds    r0, #1
+#       eors    r6, r4
+#       lsls    r6, r6, #24
+#       lsrs    r6, r6, #22         @ ((crc ^ byte) & 0xff) * 4
+#       ldr     r6, [r7, r6]
+#       lsrs    r4, r4, #8
+#       eors    r4, r6
+#       subs    r5, #1
+#       bne     byte
+#       mvns    r4, r4
+#       stm     r3!, {r4}
+#       subs    r2, #1
+#       bne     sector
+#       pop     {r4, r5, r6, r7}
+#       bx      lr
+#       .align  2
+# table:
+CRC32_SECTORS = bytes.fromhex(
+    'f0b40aa70024e4430d460678013066403606b60d'
+    'be59240a7440013df5d1e44310c3013aeed1f0bc'
+    '704700bf')
+
+CRC32_POLYNOMIAL = 0xedb88320
+
+
+def crc32_table():
+    """Table for byte-wise CRC32 with reflected polynomial
+
+    Return:
+        bytes with 256 little endian 32 bit numbers
+    """
+    table = []
+    for index in range(256):
+        crc = index
+        for _ in range(8):
+            crc = (crc >> 1) ^ (CRC32_POLYNOMIAL if crc & 1 else 0)
+        table.append(crc)
+    return _struct.pack('<256L', *table)
+
+
+def crc32_sectors():
+    """CRC32 routine with table"""
+    return CRC32_SECTORS + crc32_table()
+
+
+# void blank_check(
+#     const uint32_t *address, uint32_t sector_size,
+#     uint32_t count, uint32_t *results)
+# Result of each sector is 1 if all words are 0xffffffff (erased flash)
+# otherwise 0, rest of sector is skipped after first programmed word
+#
+#       push    {r4, r5, r6}
+# sector:
+#       adds    r4, r0, r1          @ end of sector
+#       movs    r5, #1
+# word:
+#       ldr     r6, [r0]
+#       adds    r6, #1
+#       bne     programmed
+#       adds    r0, #4
+#       cmp     r0, r4
+#       bne     word
+#       b       store
+# programmed:
+#       movs    r5, #0
+#       mov     r0, r4
+# store:
+#       stm     r3!, {r5}
+#       subs    r2, #1
+#       bne     sector
+#       pop     {r4, r5, r6}
+#       bx      lr
+BLANK_CHECK = bytes.fromhex(
+    '70b4441801250668013603d10430a042f9d101e00025204620c3013af1d170bc'
+    '7047')
+
+# void fill(
+#     uint8_t *address, uint8_t *end,
+#     const uint8_t *pattern, const uint8_t *pattern_end)
+# Fill memory with repeated pattern, size of memory and pattern must be
+# multiple of access size, 8, 16 and 32 bit variant differ only by access
+#
+#       push    {r4, r5}
+#       mov     r4, r2
+# loop:
+#       ldr     r5, [r4]            @ ldrb / ldrh / ldr
+#       adds    r4, #4              @ 1 / 2 / 4
+#       str     r5, [r0]            @ strb / strh / str
+#       adds    r0, #4              @ 1 / 2 / 4
+#       cmp     r4, r3
+#       bne     next
+#       mov     r4, r2
+# next:
+#       cmp     r0, r1
+#       bne     loop
+#       pop     {r4, r5}
+#       bx      lr
+FILL = {
+    8: bytes.fromhex(
+        '30b4144625780134057001309c4200d114468842f6d130bc7047'),
+    16: bytes.fromhex(
+        '30b4144625880234058002309c4200d114468842f6d130bc7047'),
+    32: bytes.fromhex(
+        '30b4144625680434056004309c4200d114468842f6d130bc7047'),
+}
+
+
+# uint32_t flash_loader(struct buffer *buffers, const struct params *params)
+# Program flash from two buffers in RAM, host fill one buffer while other
+# one is programmed. Flash controller must be unlocked and in programming
+# mode. Buffer descriptor is {src, dest, size}, loader wait for non zero
+# size, program buffer and clear size. Size 0xffffffff end loader. Params
+# are {sr_address, busy_mask, error_mask, program_size, halfword}, every
+# program unit is written by words (or half-words) and loader wait while
+# (SR & busy_mask). Return 0 or value of SR with error.
+#
+#       push    {r4, r5, r6, r7}
+#       mov     r12, r0             @ first buffer
+# wait:
+#       ldr     r2, [r0, #8]        @ size
+#       cmp     r2, #0
+#       beq     wait
+#       adds    r3, r2, #1
+#       beq     done                @ size == 0xffffffff
+#       ldr     r3, [r0, #4]        @ dest
+#       ldr     r4, [r0, #0]        @ src
+# unit:
+#       ldr     r5, [r1, #12]       @ program_size
+#       ldr     r6, [r1, #16]       @ halfword
+#       cmp     r6, #0
+#       bne     half
+# word:
+#       ldr     r6, [r4]
+#       str     r6, [r3]
+#       adds    r4, #4
+#       adds    r3, #4
+#       subs    r5, #4
+#       bne     word
+#       b       busy_start
+# half:
+#       ldrh    r6, [r4]
+#       strh    r6, [r3]
+#       adds    r4, #2
+#       adds    r3, #2
+#       subs    r5, #2
+#       bne     half
+# busy_start:
+#       ldr     r6, [r1, #0]        @ sr_address
+#       ldr     r7, [r1, #4]        @ busy_mask
+# busy:
+#       ldr     r5, [r6]
+#       tst     r5, r7
+#       bne     busy
+#       ldr     r7, [r1, #8]        @ error_mask
+#       tst     r5, r7
+#       bne     error
+#       ldr     r5, [r1, #12]
+#       subs    r2, r2, r5
+#       bhi     unit
+#       movs    r5, #0
+#       str     r5, [r0, #8]        @ buffer is free
+#       mov     r5, r12
+#       cmp     r0, r5
+#       bne     first
+#       adds    r0, #12             @ second buffer
+#       b       wait
+# first:
+#       mov     r0, r5
+#       b       wait
+# error:
+#       mov     r0, r5
+#       pop     {r4, r5, r6, r7}
+#       bx      lr
+# done:
+#       movs    r0, #0
+#       pop     {r4, r5, r6, r7}
+#       bx      lr
+FLASH_LOADER = bytes.fromhex(
+    'f0b484468268002afcd0531c29d043680468cd680e69002e06d126681e60'
+    '04340433043df9d105e026881e8002340233023df9d10e684f6835683d42'
+    'fcd18f683d420bd1cd68521be3d8002585606546a84201d10c30d5e72846'
+    'd3e72846f0bc70470020f0bc7047')
@@ -0,0 +1,452 @@
+"""SEGGER RTT (Real Time Transfer) over SWD
+
+Target writes into ring buffers in RAM described by control block and
+host reads them by bulk memory reads, no other interface is needed.
+"""
+
+import io as _io
+import struct as _struct
+import time as _time
+
+
+class RttException(Exception):
+    """Rtt general exception"""
+
+
+# ID at start of control block
+RTT_ID = b'SEGGER RTT\x00'
+# addresses of found control blocks by (search_start, search_size)
+_ADDRESS_CACHE = {}
+
+
+class RttChannel():
+    """RTT ring buffer described in control block
+
+    Descriptor (SEGGER_RTT_BUFFER_UP/DOWN) is: sName, pBuffer,
+    SizeOfBuffer, WrOff, RdOff and Flags.
+    """
+
+    DESCRIPTOR_SIZE = 24
+    WR_OFF = 12
+    RD_OFF = 16
+
+    def __init__(self, swd, index, descriptor_address, descriptor):
+        """Channel constructor
+
+        Arguments:
+            swd: instance of swd.Swd
+            index: index of channel
+            descriptor_address: address of buffer descriptor
+            descriptor: bytes of buffer descriptor
+        """
+        self._swd = swd
+        self._index = index
+        self._descriptor_address = descriptor_address
+        (
+            self._name_address, self._buffer_address, self._size,
+            unused_wr_off, unused_rd_off, self._flags) = _struct.unpack(
+                '<6L', descriptor)
+        self._name = None
+
+    def __repr__(self):
+        return "%s(%d, %r, %d)" % (
+            self.__class__.__name__, self._index, self.name, self._size)
+
+    @property
+    def index(self):
+        """Index of channel"""
+        return self._index
+
+    @property
+    def name(self):
+        """Name of channel (read from target on first use)"""
+        if self._name is None:
+            self._name = ''
+            if self._name_address:
+                name = self._swd.read(self._name_address, 32)
+                self._name = name.split(b'\x00', 1)[0].decode(
+                    'ascii', 'replace')
+        return self._name
+
+    @property
+    def buffer_address(self):
+        """Address of ring buffer"""
+        return self._buffer_address
+
+    @property
+    def size(self):
+        """Size of ring buffer"""
+        return self._size
+
+    @property
+    def flags(self):
+        """Flags of channel (operating mode of target side)"""
+        return self._flags
+
+    @property
+    def descriptor_address(self):
+        """Address of buffer descriptor"""
+        return self._descriptor_address
+
+    def is_active(self):
+        """Check if channel has buffer"""
+        return bool(self._buffer_address and self._size)
+
+    def get_offsets(self):
+        """Read write and read offset
+
+        Return:
+            tuple with (WrOff, RdOff)
+        """
+        return _struct.unpack('<2L', self._swd.read(
+            self._descriptor_address + self.WR_OFF, 8))
+
+
+class RttUpChannel(RttChannel):
+    """Channel from target to host"""
+
+    def drain(self, wr_off, rd_off):
+        """Read data between offsets and move RdOff to wr_off
+
+        Arguments:
+            wr_off: WrOff of buffer
+            rd_off: RdOff of buffer
+
+        Return:
+            bytes of data
+        """
+        if wr_off == rd_off:
+            return b''
+        if wr_off >= self._size or rd_off >= self._size:
+            raise RttException(
+                "Wrong offsets of channel %d: %d, %d" % (
+                    self._index, wr_off, rd_off))
+        if wr_off > rd_off:
+            data = self._swd.read(
+                self._buffer_address + rd_off, wr_off - rd_off)
+        else:
+            # wrapped data are read by two reads
+            data = self._swd.read(
+                self._buffer_address + rd_off, self._size - rd_off)
+            if wr_off:
+                data += self._swd.read(self._buffer_address, wr_off)
+        self._swd.set_mem32(self._descriptor_address + self.RD_OFF, wr_off)
+        return data
+
+    def read_available(self):
+        """Read all new data without waiting
+
+        Return:
+            bytes of new data (can be empty)
+        """
+        return self.drain(*self.get_offsets())
+
+    def chunks(self, poll_interval=0.001, timeout=None):
+        """Generator of received data
+
+        Arguments:
+            poll_interval: time between polls of empty channel in seconds
+            timeout: generator stop when there is no new data for this
+                time in seconds, None wait forever
+
+        Yield:
+            non empty bytes
+        """
+        deadline = None if timeout is None else _time.monotonic() + timeout
+        while True:
+            data = self.read_available()
+            if data:
+                yield data
+                if timeout is not None:
+                    deadline = _time.monotonic() + timeout
+                continue
+            if deadline is not None and _time.monotonic() > deadline:
+                return
+            if poll_interval:
+                _time.sleep(poll_interval)
+
+    def open(self, poll_interval=0.001, timeout=None):
+        """Open channel as binary file-like stream
+
+        Arguments:
+            poll_interval: time between polls of empty channel in seconds
+            timeout: end of stream when there is no new data for this time
+                in seconds, None wait forever
+
+        Return:
+            io.BufferedReader
+        """
+        return _io.BufferedReader(_RttUpStream(
+            self.chunks(poll_interval=poll_interval, timeout=timeout)))
+
+
+class _RttUpStream(_io.RawIOBase):
+    """Raw stream over generator of chunks"""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = chunks
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._pending = next(self._chunks, b'')
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class RttDownChannel(RttChannel):
+    """Channel from host to target
+
+    WrOff is owned by host, so it is read only once and then it is kept
+    on host, RdOff is read only when known free space is not enough.
+    """
+
+    def __init__(self, swd, index, descriptor_address, descriptor):
+        super().__init__(swd, index, descriptor_address, descriptor)
+        self._wr_off = None
+        self._rd_off = None
+
+    def _free_space(self):
+        if not self._size:
+            raise RttException("Channel %d has no buffer" % self._index)
+        return (self._rd_off - self._wr_off - 1) % self._size
+
+    def _refresh(self):
+        """Read offsets, WrOff only first time"""
+        if not self._size:
+            raise RttException("Channel %d has no buffer" % self._index)
+        if self._wr_off is None:
+            self._wr_off, self._rd_off = self.get_offsets()
+            if self._wr_off >= self._size or self._rd_off >= self._size:
+                raise RttException(
+                    "Wrong offsets of channel %d: %d, %d" % (
+                        self._index, self._wr_off, self._rd_off))
+        else:
+            self._rd_off = self._swd.get_mem32(
+                self._descriptor_address + self.RD_OFF)
+
+    def _write_ring(self, data):
+        """Write data into free space and update WrOff once"""
+        first_size = min(len(data), self._size - self._wr_off)
+        self._swd.write_mem(
+            self._buffer_address + self._wr_off, data[:first_size])
+        if first_size < len(data):
+            self._swd.write_mem(self._buffer_address, data[first_size:])
+        self._wr_off = (self._wr_off + len(data)) % self._size
+        self._swd.set_mem32(
+            self._descriptor_address + self.WR_OFF, self._wr_off)
+
+    def write(
+            self, data, timeout=None, poll_interval=0.0001,
+            max_poll_interval=0.01):
+        """Write data into channel, wait while buffer is full
+
+        All free space is filled at once (by one or two writes) and WrOff
+        is updated after it. While buffer is full, RdOff is polled with
+        doubling interval.
+
+        Arguments:
+            data: bytes or any buffer of data
+            timeout: maximum time of waiting for free space in seconds,
+                None wait forever, 0 write only into current free space
+            poll_interval: first interval of polling of RdOff in seconds
+            max_poll_interval: maximum interval of polling in seconds
+
+        Return:
+            number of written bytes (less than size of data on timeout)
+        """
+        data = memoryview(data).cast('B')
+        deadline = None if timeout is None else _time.monotonic() + timeout
+        interval = poll_interval
+        written = 0
+        if self._wr_off is None:
+            self._refresh()
+        while written < len(data):
+            if self._free_space() < len(data) - written:
+                self._refresh()
+            free = self._free_space()
+            if not free:
+                if deadline is not None and _time.monotonic() >= deadline:
+                    break
+                _time.sleep(interval)
+                interval = min(interval * 2, max_poll_interval)
+                continue
+            interval = poll_interval
+            chunk = data[written:written + free]
+            self._write_ring(chunk)
+            written += len(chunk)
+        return written
+
+    def flush(
+            self, timeout=None, poll_interval=0.0001,
+            max_poll_interval=0.01):
+        """Wait until target read all data
+
+        Arguments:
+            timeout: maximum time of waiting in seconds, None wait forever
+            poll_interval: first interval of polling of RdOff in seconds
+            max_poll_interval: maximum interval of polling in seconds
+
+        Return:
+            True if buffer is empty, False on timeout
+        """
+        deadline = None if timeout is None else _time.monotonic() + timeout
+        interval = poll_interval
+        if self._wr_off is None:
+            self._refresh()
+        while True:
+            self._refresh()
+            if self._rd_off == self._wr_off:
+                return True
+            if deadline is not None and _time.monotonic() >= deadline:
+                return False
+            _time.sleep(interval)
+            interval = min(interval * 2, max_poll_interval)
+
+
+class Rtt():
+    """RTT control block on target
+
+    Control block (SEGGER_RTT_CB) is: acID[16], MaxNumUpBuffers,
+    MaxNumDownBuffers, up buffer descriptors and down buffer descriptors.
+    """
+
+    HEADER_SIZE = 24
+    SEARCH_CHUNK_SIZE = 8192
+
+    def __init__(
+            self, swd, address=None, search_start=0x20000000,
+            search_size=0x10000):
+        """RTT constructor
+
+        Control block is searched in RAM if address is not given, found
+        address is remembered for next instances with same search range
+        and it is only verified.
+
+        Arguments:
+            swd: instance of swd.Swd
+            address: address of control block (e.g. from map file)
+            search_start: start of searched RAM
+            search_size: size of searched RAM
+
+        Raises:
+            RttException: if control block is not found
+        """
+        self._swd = swd
+        if address is None:
+            key = (search_start, search_size)
+            address = _ADDRESS_CACHE.get(key)
+            if address is None or not self._check_id(address):
+                address = self.find_control_block(
+                    swd, search_start, search_size)
+                _ADDRESS_CACHE[key] = address
+        elif not self._check_id(address):
+            raise RttException(
+                "Control block not found at 0x%08x" % address)
+        self._address = address
+        self._up_channels = []
+        self._down_channels = []
+        self._parse()
+
+    @staticmethod
+    def find_control_block(swd, search_start, search_size):
+        """Find control block in RAM
+
+        Memory is read by bulk reads in chunks and searched by bytes.find.
+
+        Arguments:
+            swd: instance of swd.Swd
+            search_start: start of searched RAM aligned to 4 Bytes
+            search_size: size of searched RAM
+
+        Return:
+            address of control block
+
+        Raises:
+            RttException: if control block is not found
+        """
+        chunk = bytearray(Rtt.SEARCH_CHUNK_SIZE + 16)
+        offset = 0
+        while offset < search_size:
+            chunk_size = min(len(chunk), search_size - offset)
+            chunk_size -= chunk_size % 4
+            view = memoryview(chunk)[:chunk_size]
+            swd.readinto(search_start + offset, view)
+            position = chunk.find(RTT_ID, 0, chunk_size)
+            while position >= 0:
+                # control block is structure aligned to 4 Bytes
+                if not position % 4:
+                    return search_start + offset + position
+                position = chunk.find(RTT_ID, position + 1, chunk_size)
+            # chunks overlap to find ID on boundary of chunks
+            offset += Rtt.SEARCH_CHUNK_SIZE
+        raise RttException(
+            "Control block not found in 0x%08x - 0x%08x" % (
+                search_start, search_start + search_size))
+
+    def _check_id(self, address):
+        return self._swd.read(address, len(RTT_ID)) == RTT_ID
+
+    def _parse(self):
+        max_up, max_down = _struct.unpack(
+            '<2L', self._swd.read(self._address + 16, 8))
+        if max_up > 64 or max_down > 64:
+            raise RttException(
+                "Wrong number of buffers: %d, %d" % (max_up, max_down))
+        descriptors_address = self._address + self.HEADER_SIZE
+        size = RttChannel.DESCRIPTOR_SIZE
+        descriptors = self._swd.read(
+            descriptors_address, (max_up + max_down) * size)
+        for index in range(max_up + max_down):
+            descriptor = descriptors[index * size:(index + 1) * size]
+            address = descriptors_address + index * size
+            if index < max_up:
+                self._up_channels.append(RttUpChannel(
+                    self._swd, index, address, descriptor))
+            else:
+                self._down_channels.append(RttDownChannel(
+                    self._swd, index - max_up, address, descriptor))
+
+    @property
+    def address(self):
+        """Address of control block"""
+        return self._address
+
+    @property
+    def up_channels(self):
+        """List of RttUpChannel (target to host)"""
+        return list(self._up_channels)
+
+    @property
+    def down_channels(self):
+        """List of RttDownChannel (host to target)"""
+        return list(self._down_channels)
+
+    def poll(self):
+        """Read new data from all active up channels
+
+        Offsets of all channels are read by one transfer.
+
+        Return:
+            list of bytes for each up channel
+        """
+        if not self._up_channels:
+            return []
+        size = RttChannel.DESCRIPTOR_SIZE
+        descriptors = self._swd.read(
+            self._address + self.HEADER_SIZE, len(self._up_channels) * size)
+        result = []
+        for channel in self._up_channels:
+            if not channel.is_active():
+                result.append(b'')
+                continue
+            wr_off, rd_off = _struct.unpack_from(
+                '<2L', descriptors, channel.index * size + RttChannel.WR_OFF)
+            result.append(channel.drain(wr_off, rd_off))
+        return result
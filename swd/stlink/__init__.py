@@ -3,6 +3,7 @@
 
 import swd.stlink.com as _com
 import swd.stlink.usb as _usb
+import swd.stlink.pipeline as _pipeline
 
 
 class StlinkError(Exception):
@@ -13,6 +14,28 @@ class StlinkException(StlinkError):
     """StlinkCom general error"""
 
 
+class StlinkFaultException(StlinkException):
+    """Memory transfer fault"""
+    def __init__(self, message, fault_address, transfer=None):
+        msg = f"{message} at address: 0x{fault_address:08x}"
+        if transfer:
+            address, size = transfer
+            msg += f" (in transfer of {size} Bytes from 0x{address:08x})"
+        super().__init__(msg)
+        self._fault_address = fault_address
+        self._transfer = transfer
+
+    @property
+    def fault_address(self):
+        """Address where fault occurred"""
+        return self._fault_address
+
+    @property
+    def transfer(self):
+        """Tuple with (address, size) of failed transfer or None"""
+        return self._transfer
+
+
 class StlinkOutdatedFirmware(StlinkException):
     """StlinkCom general exception"""
     def __init__(self, current_version, minimal_version):
@@ -108,10 +131,25 @@ class Stlink:
             serial_no='',
             debug=0,
             usb=None,
-            com=None):
+            com=None,
+            pipeline_depth=0):
+        """Stlink constructor
+
+        Arguments:
+            swd_frequency: SWD frequency in Hz
+            serial_no: serial number or part (begin or end)
+            debug: debug level
+            usb: USB communication instance (default is StlinkUsb)
+            com: StlinkCom instance
+            pipeline_depth: if not zero, USB transfers are processed by
+                I/O thread with this number of queued transfers,
+                see StlinkPipeline
+        """
         self._debug = debug
         if not usb:
             usb = _usb.StlinkUsb(serial_no, debug=debug)
+        if pipeline_depth:
+            usb = _pipeline.StlinkPipeline(usb, depth=pipeline_depth)
         if not com:
             com = _com.StlinkCom(usb, debug=debug)
         self._com = com
@@ -312,14 +350,82 @@ class Stlink:
         status = self._com.set_mem32(address, value)
         _check_status(status)
 
-    def _check_last_rw_state(self):
+    @property
+    def maximum_trace_frequency(self):
+        """Maximum SWO frequency supported by ST-Link in Hz"""
+        if self._version.major >= 3:
+            return 24000000
+        return 2000000
+
+    def start_trace_rx(self, frequency):
+        """Start receiving of SWO trace data
+
+        Arguments:
+            frequency: SWO frequency (baud rate) in Hz
+        """
+        if self._version.major == 2 and self._version.jtag < 13:
+            raise StlinkOutdatedFirmware(self._version.str, "J13")
+        if frequency > self.maximum_trace_frequency:
+            raise StlinkException(
+                f'SWO frequency {frequency} Hz is over maximum '
+                f'{self.maximum_trace_frequency} Hz')
+        status = self._com.start_trace_rx(frequency)
+        _check_status(status)
+
+    def stop_trace_rx(self):
+        """Stop receiving of SWO trace data"""
+        status = self._com.stop_trace_rx()
+        _check_status(status)
+
+    def read_trace(self):
+        """Read all trace data waiting in ST-Link
+
+        Return:
+            bytes of data, empty if there are no data
+        """
+        count = self._com.get_trace_nb()
+        if not count:
+            return b''
+        return self._com.read_trace(count)
+
+    def sync(self):
+        """Wait until all queued transfers are finished
+
+        With pipelined USB, buffers of read_memX_into() are filled only
+        after this or any command with response.
+        """
+        flush = getattr(self._com.usb, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def check_last_rw_state(self, transfers=None):
+        """Check state of last memory transfers
+
+        Used after transfers with check_last_error_status=False, ST-Link
+        keep first error until state is read.
+
+        Arguments:
+            transfers: list of tuples (address, size) with not checked
+                transfers, on error is found transfer with fault address
+
+        Raise:
+            StlinkFaultException: on error with fault address
+            StlinkError: on unknown status
+        """
         status, fault_address = self._com.get_last_rw_state_ex()
         if status == self._com.STATUS.JTAG_OK:
             return
         if status in self._com.STATUS.MESSAGES:
-            msg = self._com.STATUS.MESSAGES[status]
-            msg = f"{msg} at address: 0x{fault_address:08x}"
-            raise StlinkException(msg)
+            failed_transfer = None
+            for transfer in transfers or ():
+                address, size = transfer
+                if address <= fault_address < address + size:
+                    failed_transfer = transfer
+                    break
+            raise StlinkFaultException(
+                self._com.STATUS.MESSAGES[status],
+                fault_address,
+                failed_transfer)
         raise StlinkError("Unknown status")
 
     def read_mem8(self, address, size, check_last_error_status=True):
@@ -340,9 +446,27 @@ class Stlink:
                 % self.maximum_8bit_data)
         data = self._com.read_mem8(address, size)
         if check_last_error_status:
-            self._check_last_rw_state()
+            self.check_last_rw_state()
         return data
 
+    def read_mem8_into(self, address, buffer, check_last_error_status=True):
+        """Read data from memory with 8 bit memory access into buffer.
+
+        Maximum number of bytes for read can be 64.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer of bytes (e.g. memoryview), size of
+                buffer is number of bytes to read from memory
+        """
+        if len(buffer) > self.maximum_8bit_data:
+            raise StlinkException(
+                'Too many Bytes to read (maximum is %d Bytes)'
+                % self.maximum_8bit_data)
+        self._com.read_mem8_into(address, buffer)
+        if check_last_error_status:
+            self.check_last_rw_state()
+
     def write_mem8(self, address, data, check_last_error_status=True):
         """Write data into memory with 8 bit memory access.
 
@@ -358,7 +482,7 @@ class Stlink:
                 % self.maximum_8bit_data)
         self._com.write_mem8(address, data)
         if check_last_error_status:
-            self._check_last_rw_state()
+            self.check_last_rw_state()
 
     def read_mem16(self, address, size, check_last_error_status=True):
         """Read data from memory with 16 bit memory access.
@@ -382,9 +506,31 @@ class Stlink:
                 % self.maximum_32bit_data)
         data = self._com.read_mem16(address, size)
         if check_last_error_status:
-            self._check_last_rw_state()
+            self.check_last_rw_state()
         return data
 
+    def read_mem16_into(self, address, buffer, check_last_error_status=True):
+        """Read data from memory with 16 bit memory access into buffer.
+
+        Maximum number of bytes for one read can be 1024.
+        Address and size must be aligned to 2 Bytes.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer of bytes (e.g. memoryview), size of
+                buffer is number of bytes to read from memory
+        """
+        if self._version.major <= 2 and self._version.jtag < 26:
+            raise StlinkOutdatedFirmware(self._version.str, "J26")
+        _check_alignment(2, address=address, size=len(buffer))
+        if len(buffer) > self.maximum_32bit_data:
+            raise StlinkException(
+                'Too many Bytes to read (maximum is %d Bytes)'
+                % self.maximum_32bit_data)
+        self._com.read_mem16_into(address, buffer)
+        if check_last_error_status:
+            self.check_last_rw_state()
+
     def write_mem16(self, address, data, check_last_error_status=True):
         """Write data into memory with 16 bit memory access.
 
@@ -404,7 +550,7 @@ class Stlink:
                 % self.maximum_32bit_data)
         self._com.write_mem16(address, data)
         if check_last_error_status:
-            self._check_last_rw_state()
+            self.check_last_rw_state()
 
     def read_mem32(self, address, size, check_last_error_status=True):
         """Read data from memory with 32 bit memory access.
@@ -426,9 +572,29 @@ class Stlink:
                 % self.maximum_32bit_data)
         data = self._com.read_mem32(address, size)
         if check_last_error_status:
-            self._check_last_rw_state()
+            self.check_last_rw_state()
         return data
 
+    def read_mem32_into(self, address, buffer, check_last_error_status=True):
+        """Read data from memory with 32 bit memory access into buffer.
+
+        Maximum number of bytes for one read can be 1024.
+        Address and size must be aligned to 4 Bytes.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer of bytes (e.g. memoryview), size of
+                buffer is number of bytes to read from memory
+        """
+        _check_alignment(4, address=address, size=len(buffer))
+        if len(buffer) > self.maximum_32bit_data:
+            raise StlinkException(
+                'Too many Bytes to read (maximum is %d Bytes)'
+                % self.maximum_32bit_data)
+        self._com.read_mem32_into(address, buffer)
+        if check_last_error_status:
+            self.check_last_rw_state()
+
     def write_mem32(self, address, data, check_last_error_status=True):
         """Write data into memory with 32 bit memory access.
 
@@ -446,4 +612,4 @@ class Stlink:
                 % self.maximum_32bit_data)
         self._com.write_mem32(address, data)
         if check_last_error_status:
-            self._check_last_rw_state()
+            self.check_last_rw_state()
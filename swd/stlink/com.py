@@ -70,9 +70,9 @@ class StlinkCom:
                 GET_LAST_RW_STATE = 0x3b  # _get_last_rw_state()
                 GET_LAST_RW_STATE_EX = 0x3e  # V2J15  # _get_last_rw_state_ex()
                 DRIVE_NRST = 0x3c
-                START_TRACE_RX = 0x40
-                STOP_TRACE_RX = 0x41
-                GET_TRACE_NB = 0x42
+                START_TRACE_RX = 0x40  # start_trace_rx()
+                STOP_TRACE_RX = 0x41  # stop_trace_rx()
+                GET_TRACE_NB = 0x42  # get_trace_nb()
                 SET_SWD_FREQ = 0x43  # V2J20  # _set_swd_freq()
                 SET_JTAG_FREQ = 0x44  # V2J24
                 READ_AP_REG = 0x45  # V2J24
@@ -193,6 +193,7 @@ class StlinkCom:
     )
 
     STLINK_MAXIMUM_8BIT_DATA = 64
+    STLINK_TRACE_BUFFER_SIZE = 4096
 
     def __init__(self, usb, debug=0):
         """Stlink constructor
@@ -209,6 +210,17 @@ class StlinkCom:
         """Read USB device name"""
         return self._usb
 
+    def _xfer_into(self, cmd, buffer):
+        """Transfer command and receive data into buffer
+
+        USB driver without xfer_into() support is used with copying data
+        """
+        xfer_into = getattr(self._usb, 'xfer_into', None)
+        if xfer_into is None:
+            buffer[:] = self._usb.xfer(cmd, rx_length=len(buffer))
+        else:
+            xfer_into(cmd, buffer)
+
     def get_version(self):
         """Get ST-Link version
 
@@ -568,6 +580,67 @@ class StlinkCom:
         status, fault_address = _struct.unpack('<HxxI4x', res)
         return status, fault_address
 
+    def start_trace_rx(self, frequency, buffer_size=None):
+        """Start receiving of SWO trace data by ST-Link
+
+        Arguments:
+            frequency: SWO frequency (baud rate) in Hz
+            buffer_size: size of trace buffer in ST-Link
+
+        Return:
+            status: command status
+        """
+        if buffer_size is None:
+            buffer_size = self.STLINK_TRACE_BUFFER_SIZE
+        cmd = _struct.pack(
+            '<BBHL',
+            self.CMD.DEBUG.COMMAND,
+            self.CMD.DEBUG.APIV2.START_TRACE_RX,
+            buffer_size,
+            frequency)
+        res = self._usb.xfer(cmd, rx_length=2)
+        status, = _struct.unpack('<H', res)
+        return status
+
+    def stop_trace_rx(self):
+        """Stop receiving of SWO trace data
+
+        Return:
+            status: command status
+        """
+        cmd = _struct.pack(
+            '<BB',
+            self.CMD.DEBUG.COMMAND,
+            self.CMD.DEBUG.APIV2.STOP_TRACE_RX)
+        res = self._usb.xfer(cmd, rx_length=2)
+        status, = _struct.unpack('<H', res)
+        return status
+
+    def get_trace_nb(self):
+        """Get number of trace bytes waiting in ST-Link
+
+        Return:
+            number of bytes ready on trace pipe
+        """
+        cmd = _struct.pack(
+            '<BB',
+            self.CMD.DEBUG.COMMAND,
+            self.CMD.DEBUG.APIV2.GET_TRACE_NB)
+        res = self._usb.xfer(cmd, rx_length=2)
+        count, = _struct.unpack('<H', res)
+        return count
+
+    def read_trace(self, size):
+        """Read trace data from trace pipe
+
+        Arguments:
+            size: number of bytes, returned by get_trace_nb()
+
+        Return:
+            bytes of data
+        """
+        return self._usb.read_trace(size)
+
     def read_mem8(self, address, size):
         """Read data from memory with 8 bit memory access.
 
@@ -588,6 +661,24 @@ class StlinkCom:
             size)
         return self._usb.xfer(cmd, rx_length=size)
 
+    def read_mem8_into(self, address, buffer):
+        """Read data from memory with 8 bit memory access into buffer.
+
+        Maximum number of bytes for read can be 64.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer of bytes, size of buffer is number
+                of bytes to read from memory
+        """
+        cmd = _struct.pack(
+            '<BBLL',
+            self.CMD.DEBUG.COMMAND,
+            self.CMD.DEBUG.READ_MEM_8BIT,
+            address,
+            len(buffer))
+        self._xfer_into(cmd, buffer)
+
     def write_mem8(self, address, data):
         """Write data into memory with 8 bit memory access.
 
@@ -626,6 +717,25 @@ class StlinkCom:
             size)
         return self._usb.xfer(cmd, rx_length=size)
 
+    def read_mem16_into(self, address, buffer):
+        """Read data from memory with 16 bit memory access into buffer.
+
+        Maximum number of bytes for one read can be 1024.
+        Address and size must be aligned to 2 Bytes.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer of bytes, size of buffer is number
+                of bytes to read from memory
+        """
+        cmd = _struct.pack(
+            '<BBLL',
+            self.CMD.DEBUG.COMMAND,
+            self.CMD.DEBUG.APIV2.READ_MEM_16BIT,
+            address,
+            len(buffer))
+        self._xfer_into(cmd, buffer)
+
     def write_mem16(self, address, data):
         """Write data into memory with 16 bit memory access.
 
@@ -665,6 +775,25 @@ class StlinkCom:
             size)
         return self._usb.xfer(cmd, rx_length=size)
 
+    def read_mem32_into(self, address, buffer):
+        """Read data from memory with 32 bit memory access into buffer.
+
+        Maximum number of bytes for one read can be 1024.
+        Address and size must be aligned to 4 Bytes.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer of bytes, size of buffer is number
+                of bytes to read from memory
+        """
+        cmd = _struct.pack(
+            '<BBLL',
+            self.CMD.DEBUG.COMMAND,
+            self.CMD.DEBUG.READ_MEM_32BIT,
+            address,
+            len(buffer))
+        self._xfer_into(cmd, buffer)
+
     def write_mem32(self, address, data):
         """Write data into memory with 32 bit memory access.
 
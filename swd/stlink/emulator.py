@@ -0,0 +1,639 @@
+"""ST-Link emulator
+
+Software ST-Link device which can replace StlinkUsb for testing and
+benchmarking without attached hardware.
+"""
+
+import struct as _struct
+import threading as _threading
+import time as _time
+from swd.stlink.com import StlinkCom as _StlinkCom
+
+
+class StlinkEmulatorError(Exception):
+    """StlinkEmulator general error"""
+
+
+class MemoryRegion:
+    """Region of simulated memory"""
+
+    PAGE_SIZE = 4096
+
+    def __init__(self, address, size, name='', fill=0x00, writable=True):
+        """Memory region constructor
+
+        Arguments:
+            address: start address of region
+            size: size of region in bytes
+            name: name of region
+            fill: value of not initialized bytes
+            writable: if False debugger write access cause fault
+        """
+        self._address = address
+        self._size = size
+        self._name = name
+        self._fill = fill
+        self._writable = writable
+        self._pages = {}
+
+    def __repr__(self):
+        return f"MemoryRegion({self._name}: 0x{self._address:08x}, {self._size})"
+
+    @property
+    def address(self):
+        """Start address of region"""
+        return self._address
+
+    @property
+    def size(self):
+        """Size of region"""
+        return self._size
+
+    @property
+    def name(self):
+        """Name of region"""
+        return self._name
+
+    @property
+    def writable(self):
+        """True if region is writable by debugger"""
+        return self._writable
+
+    def contains(self, address, size=1):
+        """Check if whole range is inside of this region"""
+        return (
+            self._address <= address
+            and address + size <= self._address + self._size)
+
+    def _page(self, index):
+        page = self._pages.get(index)
+        if page is None:
+            page = bytearray([self._fill]) * self.PAGE_SIZE
+            self._pages[index] = page
+        return page
+
+    def read(self, address, size):
+        """Read data from region
+
+        Not initialized pages are not allocated on read.
+        """
+        offset = address - self._address
+        data = bytearray()
+        while size:
+            index, page_offset = divmod(offset, self.PAGE_SIZE)
+            chunk_size = min(size, self.PAGE_SIZE - page_offset)
+            page = self._pages.get(index)
+            if page is None:
+                data += bytes([self._fill]) * chunk_size
+            else:
+                data += page[page_offset:page_offset + chunk_size]
+            offset += chunk_size
+            size -= chunk_size
+        return bytes(data)
+
+    def write(self, address, data):
+        """Write data into region"""
+        offset = address - self._address
+        data = memoryview(bytes(data))
+        while data:
+            index, page_offset = divmod(offset, self.PAGE_SIZE)
+            chunk_size = min(len(data), self.PAGE_SIZE - page_offset)
+            self._page(index)[page_offset:page_offset + chunk_size] = (
+                data[:chunk_size])
+            offset += chunk_size
+            data = data[chunk_size:]
+
+
+class Memory:
+    """Sparse simulated memory map"""
+
+    def __init__(self, regions=None):
+        """Memory constructor
+
+        Arguments:
+            regions: list of MemoryRegion, if None then default Cortex-M
+                memory map is created
+        """
+        if regions is None:
+            regions = self.default_regions()
+        self._regions = list(regions)
+
+    @staticmethod
+    def default_regions():
+        """Default memory map of STM32 like Cortex-M MCU"""
+        return [
+            MemoryRegion(0x08000000, 0x00100000, 'FLASH', 0xff, False),
+            MemoryRegion(0x1fff0000, 0x00010000, 'SYSTEM', 0xff, False),
+            MemoryRegion(0x20000000, 0x00020000, 'SRAM'),
+            MemoryRegion(0x40000000, 0x20000000, 'PERIPHERAL'),
+            MemoryRegion(0xe0000000, 0x00100000, 'PPB'),
+        ]
+
+    @property
+    def regions(self):
+        """List of memory regions"""
+        return self._regions
+
+    def add_region(self, region):
+        """Add new memory region"""
+        self._regions.append(region)
+
+    def find_fault(self, address, size, write=False):
+        """Find first address which is not accessible
+
+        Arguments:
+            address: start address of access
+            size: number of bytes
+            write: True for write access
+
+        Return:
+            fault address or None if whole range is accessible
+        """
+        end = address + size
+        while address < end:
+            for region in self._regions:
+                if region.contains(address):
+                    break
+            else:
+                return address
+            if write and not region.writable:
+                return address
+            address = min(end, region.address + region.size)
+        return None
+
+    def read(self, address, size):
+        """Read data from memory, not accessible bytes are read as zero"""
+        data = bytearray(size)
+        for region in self._regions:
+            start = max(address, region.address)
+            end = min(address + size, region.address + region.size)
+            if start < end:
+                data[start - address:end - address] = region.read(
+                    start, end - start)
+        return bytes(data)
+
+    def write(self, address, data):
+        """Write data into memory, not accessible bytes are ignored"""
+        data = bytes(data)
+        for region in self._regions:
+            start = max(address, region.address)
+            end = min(address + len(data), region.address + region.size)
+            if start < end:
+                region.write(start, data[start - address:end - address])
+
+
+class StlinkEmulator:
+    """Emulated ST-Link with attached Cortex-M target
+
+    Can be used instead of StlinkUsb:
+        swd.Swd(driver=swd.stlink.Stlink(usb=StlinkEmulator()))
+    """
+
+    STLINK_MAXIMUM_TRANSFER_SIZE = 6144
+    _STLINK_CMD_SIZE = 16
+    _REGISTERS_COUNT = 21
+    _DHCSR_REG = 0xe000edf0
+    _DHCSR_KEY = 0xa05f0000
+    _DHCSR_C_DEBUGEN = 0x00000001
+    _DHCSR_C_HALT = 0x00000002
+    _DHCSR_S_HALT = 0x00020000
+
+    def __init__(
+            self,
+            memory=None,
+            version=(2, 37, 7),
+            dev_name='V2',
+            serial_no='EMULATOR',
+            idcode=0x2ba01477,
+            voltage=3.3,
+            latency=0.0,
+            bandwidth=None,
+            sleep=True,
+            core=None):
+        """Emulator constructor
+
+        Arguments:
+            memory: instance of Memory, if None default memory is created
+            version: tuple with (major, jtag, swim/msc) versions
+            dev_name: emulated device name ('V2', 'V2-1', 'V3', ..)
+            serial_no: serial number of emulated device
+            idcode: IDCODE of emulated target
+            voltage: target voltage
+            latency: time of one USB transfer in seconds
+            bandwidth: USB throughput in Bytes per second (None is unlimited)
+            sleep: if True then latency is really waited, otherwise time
+                is only accumulated in elapsed property
+            core: callable which emulate execution of code, it is called
+                with emulator as argument after each transfer while core
+                is running (DHCSR C_DEBUGEN is set and C_HALT is cleared)
+                and if it return True, then core is halted again (e.g. on
+                BKPT instruction)
+        """
+        self._memory = memory if memory is not None else Memory()
+        self._version = version
+        self._dev_name = dev_name
+        self._serial_no = serial_no
+        self._idcode = idcode
+        self._voltage = voltage
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._sleep = sleep
+        self._core = core
+        self._mode = _StlinkCom.CMD.MODE.DFU
+        self._registers = [0] * self._REGISTERS_COUNT
+        self._last_rw_status = _StlinkCom.STATUS.JTAG_OK
+        self._last_rw_fault_address = 0
+        self._trace_frequency = None
+        self._trace_buffer_size = 0
+        self._trace = bytearray()
+        # transfers can come also from trace capture thread
+        self._lock = _threading.RLock()
+        self._commands = self._build_commands()
+        self.reset_statistics()
+
+    def _build_commands(self):
+        cmd = _StlinkCom.CMD
+        debug = cmd.DEBUG
+        apiv2 = debug.APIV2
+        return {
+            (cmd.GET_VERSION, ): self._cmd_get_version,
+            (cmd.GET_VERSION_EX, ): self._cmd_get_version_ex,
+            (cmd.GET_CURRENT_MODE, ): self._cmd_get_current_mode,
+            (cmd.GET_TARGET_VOLTAGE, ): self._cmd_get_target_voltage,
+            (cmd.DFU.COMMAND, cmd.DFU.EXIT): self._cmd_exit,
+            (cmd.SWIM.COMMAND, cmd.SWIM.EXIT): self._cmd_exit,
+            (debug.COMMAND, debug.EXIT): self._cmd_exit,
+            (debug.COMMAND, apiv2.ENTER): self._cmd_enter_debug,
+            (debug.COMMAND, apiv2.READ_IDCODES): self._cmd_read_idcodes,
+            (debug.COMMAND, apiv2.SET_SWD_FREQ): self._cmd_status,
+            (debug.COMMAND, apiv2.RESET_SYS): self._cmd_status,
+            (debug.COMMAND, apiv2.DRIVE_NRST): self._cmd_status,
+            (debug.COMMAND, apiv2.START_TRACE_RX): self._cmd_start_trace_rx,
+            (debug.COMMAND, apiv2.STOP_TRACE_RX): self._cmd_stop_trace_rx,
+            (debug.COMMAND, apiv2.GET_TRACE_NB): self._cmd_get_trace_nb,
+            (debug.COMMAND, debug.APIV3.GET_COM_FREQ): self._cmd_get_com_freq,
+            (debug.COMMAND, debug.APIV3.SET_COM_FREQ): self._cmd_set_com_freq,
+            (debug.COMMAND, apiv2.READ_REG): self._cmd_read_reg,
+            (debug.COMMAND, apiv2.WRITE_REG): self._cmd_write_reg,
+            (debug.COMMAND, apiv2.READ_ALL_REGS): self._cmd_read_all_regs,
+            (debug.COMMAND, apiv2.READ_DEBUG_REG): self._cmd_read_debug_reg,
+            (debug.COMMAND, apiv2.WRITE_DEBUG_REG): self._cmd_write_debug_reg,
+            (debug.COMMAND, apiv2.GET_LAST_RW_STATE):
+                self._cmd_get_last_rw_state,
+            (debug.COMMAND, apiv2.GET_LAST_RW_STATE_EX):
+                self._cmd_get_last_rw_state_ex,
+            (debug.COMMAND, debug.READ_MEM_8BIT): self._cmd_read_mem8,
+            (debug.COMMAND, debug.WRITE_MEM_8BIT): self._cmd_write_mem8,
+            (debug.COMMAND, apiv2.READ_MEM_16BIT): self._cmd_read_mem16,
+            (debug.COMMAND, apiv2.WRITE_MEM_16BIT): self._cmd_write_mem16,
+            (debug.COMMAND, debug.READ_MEM_32BIT): self._cmd_read_mem32,
+            (debug.COMMAND, debug.WRITE_MEM_32BIT): self._cmd_write_mem32,
+        }
+
+    @property
+    def dev_name(self):
+        """property with device name"""
+        return self._dev_name
+
+    @property
+    def serial_no(self):
+        """property with device serial number"""
+        return self._serial_no
+
+    @property
+    def memory(self):
+        """Emulated memory"""
+        return self._memory
+
+    @property
+    def registers(self):
+        """List with emulated core registers"""
+        return self._registers
+
+    @property
+    def xfer_count(self):
+        """Number of transfers since last reset_statistics()"""
+        return self._xfer_count
+
+    @property
+    def tx_bytes(self):
+        """Number of bytes sent to ST-Link (without commands)"""
+        return self._tx_bytes
+
+    @property
+    def rx_bytes(self):
+        """Number of bytes received from ST-Link"""
+        return self._rx_bytes
+
+    @property
+    def elapsed(self):
+        """Simulated time of all transfers in seconds"""
+        return self._elapsed
+
+    @property
+    def trace_frequency(self):
+        """SWO frequency of started trace receiving, None if stopped"""
+        return self._trace_frequency
+
+    def trace_write(self, data):
+        """Emulate data sent by target on SWO pin
+
+        Data are received only while trace receiving is started and
+        data over size of trace buffer are lost.
+
+        Arguments:
+            data: bytes of trace data
+        """
+        with self._lock:
+            if self._trace_frequency is None:
+                return
+            free = self._trace_buffer_size - len(self._trace)
+            self._trace += data[:max(free, 0)]
+
+    def read_trace(self, size, timeout=200):
+        """Read data from emulated trace pipe
+
+        Arguments:
+            size: number of bytes to read
+            timeout: ignored
+
+        Return:
+            received bytes
+        """
+        with self._lock:
+            data = bytes(self._trace[:size])
+            del self._trace[:size]
+            self._rx_bytes += len(data)
+        return data
+
+    def reset_statistics(self):
+        """Reset transfer counters and elapsed time"""
+        self._xfer_count = 0
+        self._tx_bytes = 0
+        self._rx_bytes = 0
+        self._elapsed = 0.0
+
+    def _wait(self, size):
+        duration = self._latency
+        if self._bandwidth:
+            duration += size / self._bandwidth
+        self._elapsed += duration
+        if self._sleep and duration > 0:
+            _time.sleep(duration)
+
+    def xfer(self, command, data=None, rx_length=0, timeout=200):
+        """Transfer command between emulated ST-Link
+
+        Arguments:
+            command: is an list of bytes with command (max 16 bytes)
+            data: data will be sent after command
+            rx_length: number of expected data to receive after command
+                and data transfer
+            timeout: ignored
+
+        Return:
+            received data
+
+        Raises:
+            StlinkEmulatorError
+        """
+        with self._lock:
+            return self._xfer(command, data, rx_length)
+
+    def _xfer(self, command, data, rx_length):
+        if len(command) > self._STLINK_CMD_SIZE:
+            raise StlinkEmulatorError(
+                "Error too many Bytes in command (maximum is %d Bytes)"
+                % self._STLINK_CMD_SIZE)
+        command = bytes(command)
+        command += b'\x00' * (self._STLINK_CMD_SIZE - len(command))
+        tx_length = len(data) if data else 0
+        self._xfer_count += 1
+        self._tx_bytes += tx_length
+        self._rx_bytes += rx_length
+        self._wait(len(command) + tx_length + rx_length)
+        handler = self._commands.get((command[0], command[1]))
+        if handler is None:
+            handler = self._commands.get((command[0], ))
+        if handler is None:
+            res = _struct.pack('<H', _StlinkCom.STATUS.JTAG_UNKNOWN_CMD)
+        else:
+            res = handler(command, data)
+        self._run_core()
+        if not rx_length:
+            return None
+        if res is None:
+            res = b''
+        res += b'\x00' * (rx_length - len(res))
+        return res[:rx_length]
+
+    def xfer_into(self, command, buffer, data=None, timeout=200):
+        """Transfer command and receive data into buffer
+
+        Arguments:
+            command: is an list of bytes with command (max 16 bytes)
+            buffer: writable buffer of bytes for received data, size of
+                buffer is expected data length
+            data: data will be sent after command
+            timeout: ignored
+
+        Return:
+            number of received bytes
+        """
+        buffer = memoryview(buffer).cast('B')
+        res = self.xfer(command, data, len(buffer), timeout)
+        if buffer:
+            buffer[:] = res
+        return len(buffer)
+
+    def _set_rw_status(self, status, fault_address=0):
+        # only first error is kept until status is read
+        if self._last_rw_status == _StlinkCom.STATUS.JTAG_OK:
+            self._last_rw_status = status
+            self._last_rw_fault_address = fault_address
+
+    def _access(self, address, size, write, alignment=1):
+        """Check memory access, return True if access is OK"""
+        if address % alignment or size % alignment:
+            self._set_rw_status(
+                _StlinkCom.STATUS.JTAG_ALIGNMENT_ERROR, address)
+            return False
+        fault_address = self._memory.find_fault(address, size, write)
+        if fault_address is not None:
+            self._set_rw_status(_StlinkCom.STATUS.SWD_AP_FAULT, fault_address)
+            return False
+        return True
+
+    def _read(self, address, size):
+        data = self._memory.read(address, size)
+        if address <= self._DHCSR_REG < address + size:
+            offset = self._DHCSR_REG - address
+            value, = _struct.unpack_from('<L', data, offset)
+            if value & self._DHCSR_C_HALT:
+                value |= self._DHCSR_S_HALT
+            else:
+                value &= ~self._DHCSR_S_HALT
+            data = bytearray(data)
+            _struct.pack_into('<L', data, offset, value)
+            data = bytes(data)
+        return data
+
+    def _write(self, address, data):
+        if address <= self._DHCSR_REG < address + len(data):
+            offset = self._DHCSR_REG - address
+            value, = _struct.unpack_from('<L', data, offset)
+            # DHCSR write is ignored without key
+            if (value & 0xffff0000) != self._DHCSR_KEY:
+                return
+            data = bytearray(data)
+            _struct.pack_into('<L', data, offset, value & 0x0000ffff)
+            self._memory.write(address, data)
+            return
+        self._memory.write(address, data)
+
+    def _run_core(self):
+        """Let emulated core run between transfers"""
+        if self._core is None:
+            return
+        value, = _struct.unpack(
+            '<L', self._memory.read(self._DHCSR_REG, 4))
+        if (value & self._DHCSR_C_DEBUGEN
+                and not value & self._DHCSR_C_HALT
+                and self._core(self)):
+            self._memory.write(self._DHCSR_REG, _struct.pack(
+                '<L', value | self._DHCSR_C_HALT))
+
+    def _cmd_status(self, unused_command, unused_data):
+        return _struct.pack('<H', _StlinkCom.STATUS.JTAG_OK)
+
+    def _cmd_get_version(self, unused_command, unused_data):
+        major, jtag, minor = self._version
+        ver = (major & 0x0f) << 12 | (jtag & 0x3f) << 6 | (minor & 0x3f)
+        return _struct.pack('>H', ver) + _struct.pack('<HH', 0x0483, 0x3748)
+
+    def _cmd_get_version_ex(self, unused_command, unused_data):
+        major, jtag, minor = self._version
+        return _struct.pack(
+            '<5B3xHH', major, 0, jtag, minor, 0, 0x0483, 0x374f)
+
+    def _cmd_get_current_mode(self, unused_command, unused_data):
+        return _struct.pack('<Bx', self._mode)
+
+    def _cmd_get_target_voltage(self, unused_command, unused_data):
+        # voltage = 2 * an1 * 1.2 / an0
+        an0 = 2400
+        return _struct.pack('<LL', an0, round(self._voltage * an0 / 2.4))
+
+    def _cmd_start_trace_rx(self, command, unused_data):
+        buffer_size, frequency = _struct.unpack_from('<HL', command, 2)
+        self._trace_buffer_size = buffer_size
+        self._trace_frequency = frequency
+        del self._trace[:]
+        return _struct.pack('<H', _StlinkCom.STATUS.JTAG_OK)
+
+    def _cmd_stop_trace_rx(self, unused_command, unused_data):
+        self._trace_frequency = None
+        return _struct.pack('<H', _StlinkCom.STATUS.JTAG_OK)
+
+    def _cmd_get_trace_nb(self, unused_command, unused_data):
+        return _struct.pack('<H', len(self._trace))
+
+    def _cmd_exit(self, unused_command, unused_data):
+        self._mode = _StlinkCom.CMD.MODE.DFU
+
+    def _cmd_enter_debug(self, unused_command, unused_data):
+        self._mode = _StlinkCom.CMD.MODE.DEBUG
+        return _struct.pack('<H', _StlinkCom.STATUS.JTAG_OK)
+
+    def _cmd_read_idcodes(self, unused_command, unused_data):
+        return _struct.pack('<HxxL4x', _StlinkCom.STATUS.JTAG_OK, self._idcode)
+
+    def _cmd_get_com_freq(self, unused_command, unused_data):
+        frequencies = [24000, 8000, 3300, 1000, 200, 50, 5]
+        return _struct.pack(
+            '<HxxLL10L', _StlinkCom.STATUS.JTAG_OK, frequencies[0],
+            len(frequencies), *(frequencies + [0] * (10 - len(frequencies))))
+
+    def _cmd_set_com_freq(self, command, unused_data):
+        freq_khz, = _struct.unpack_from('<L', command, 4)
+        return _struct.pack('<HxxL', _StlinkCom.STATUS.JTAG_OK, freq_khz)
+
+    def _cmd_read_reg(self, command, unused_data):
+        register = command[2]
+        if register >= self._REGISTERS_COUNT:
+            return _struct.pack('<HxxL', _StlinkCom.STATUS.JTAG_CMD_ERROR, 0)
+        return _struct.pack(
+            '<HxxL', _StlinkCom.STATUS.JTAG_OK, self._registers[register])
+
+    def _cmd_write_reg(self, command, unused_data):
+        register, value = _struct.unpack_from('<BL', command, 2)
+        if register >= self._REGISTERS_COUNT:
+            return _struct.pack('<H', _StlinkCom.STATUS.JTAG_CMD_ERROR)
+        self._registers[register] = value
+        return _struct.pack('<H', _StlinkCom.STATUS.JTAG_OK)
+
+    def _cmd_read_all_regs(self, unused_command, unused_data):
+        return _struct.pack(
+            '<Hxx21L', _StlinkCom.STATUS.JTAG_OK, *self._registers)
+
+    def _cmd_read_debug_reg(self, command, unused_data):
+        address, = _struct.unpack_from('<L', command, 2)
+        if address % 4:
+            return _struct.pack(
+                '<HxxL', _StlinkCom.STATUS.JTAG_ALIGNMENT_ERROR, 0)
+        if self._memory.find_fault(address, 4) is not None:
+            return _struct.pack('<HxxL', _StlinkCom.STATUS.SWD_AP_FAULT, 0)
+        value, = _struct.unpack('<L', self._read(address, 4))
+        return _struct.pack('<HxxL', _StlinkCom.STATUS.JTAG_OK, value)
+
+    def _cmd_write_debug_reg(self, command, unused_data):
+        address, value = _struct.unpack_from('<LL', command, 2)
+        if address % 4:
+            return _struct.pack('<H', _StlinkCom.STATUS.JTAG_ALIGNMENT_ERROR)
+        if self._memory.find_fault(address, 4, write=True) is not None:
+            return _struct.pack('<H', _StlinkCom.STATUS.SWD_AP_FAULT)
+        self._write(address, _struct.pack('<L', value))
+        return _struct.pack('<H', _StlinkCom.STATUS.JTAG_OK)
+
+    def _cmd_get_last_rw_state(self, unused_command, unused_data):
+        status = self._last_rw_status
+        self._last_rw_status = _StlinkCom.STATUS.JTAG_OK
+        return _struct.pack('<H', status)
+
+    def _cmd_get_last_rw_state_ex(self, unused_command, unused_data):
+        status = self._last_rw_status
+        fault_address = self._last_rw_fault_address
+        self._last_rw_status = _StlinkCom.STATUS.JTAG_OK
+        self._last_rw_fault_address = 0
+        return _struct.pack('<HxxI4x', status, fault_address)
+
+    def _read_mem(self, command, alignment):
+        address, size = _struct.unpack_from('<LL', command, 2)
+        if not self._access(address, size, False, alignment):
+            return bytes(size)
+        return self._read(address, size)
+
+    def _write_mem(self, command, data, alignment):
+        address, size = _struct.unpack_from('<LL', command, 2)
+        if data is None or len(data) != size:
+            raise StlinkEmulatorError("Size of data not match command")
+        if self._access(address, size, True, alignment):
+            self._write(address, data)
+
+    def _cmd_read_mem8(self, command, unused_data):
+        return self._read_mem(command, 1)
+
+    def _cmd_write_mem8(self, command, data):
+        self._write_mem(command, data, 1)
+
+    def _cmd_read_mem16(self, command, unused_data):
+        return self._read_mem(command, 2)
+
+    def _cmd_write_mem16(self, command, data):
+        self._write_mem(command, data, 2)
+
+    def _cmd_read_mem32(self, command, unused_data):
+        return self._read_mem(command, 4)
+
+    def _cmd_write_mem32(self, command, data):
+        self._write_mem(command, data, 4)
@@ -0,0 +1,164 @@
+"""Pipelined ST-Link USB communication
+"""
+
+import queue as _queue
+import threading as _threading
+
+
+class StlinkPipelineException(Exception):
+    """StlinkPipeline general exception"""
+
+
+class _Transfer:
+    """One queued transfer"""
+
+    def __init__(self, command, data, rx_length, timeout, buffer=None):
+        self.command = command
+        self.data = data
+        self.rx_length = rx_length
+        self.timeout = timeout
+        self.buffer = buffer
+        self.result = None
+        self.thread = _threading.get_ident()
+        self.done = _threading.Event()
+
+
+class StlinkPipeline:
+    """Pipelined communication with ST-Link over dedicated I/O thread
+
+    Wraps StlinkUsb (or any object with same xfer() interface).
+    Transfers without received data (memory writes) and transfers into
+    buffer (xfer_into) are only queued and method return immediately,
+    so host can prepare next chunk while previous is on USB.
+    Transfers with received data (xfer with rx_length) wait until all
+    previous transfers are finished, so command with response (e.g. last
+    RW state) is also synchronization point. Error of queued transfer is
+    raised from next synchronous call of thread which submitted it, next
+    transfers of this thread are skipped until error is raised.
+    Transfers of other threads (e.g. SWO capture) are not affected.
+
+    Data received by xfer_into are valid after next synchronous call
+    or after flush().
+    """
+
+    def __init__(self, usb, depth=4):
+        """Pipeline constructor
+
+        Arguments:
+            usb: instance of StlinkUsb
+            depth: maximum number of queued transfers
+        """
+        self._usb = usb
+        self._queue = _queue.Queue(maxsize=depth)
+        # last transfers and errors are per submitting thread
+        self._last_transfers = {}
+        self._errors = {}
+        # synchronous transfers can come also from trace capture thread
+        self._lock = _threading.Lock()
+        self._thread = _threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        # other attributes (dev_name, STLINK_MAXIMUM_TRANSFER_SIZE, ..)
+        # are from wrapped USB device
+        if name == '_usb':
+            raise AttributeError(name)
+        return getattr(self._usb, name)
+
+    def _worker(self):
+        while True:
+            transfer = self._queue.get()
+            if transfer is None:
+                return
+            if transfer.thread not in self._errors:
+                try:
+                    if transfer.buffer is None:
+                        transfer.result = self._usb.xfer(
+                            transfer.command,
+                            data=transfer.data,
+                            rx_length=transfer.rx_length,
+                            timeout=transfer.timeout)
+                    else:
+                        self._usb.xfer_into(
+                            transfer.command,
+                            transfer.buffer,
+                            data=transfer.data,
+                            timeout=transfer.timeout)
+                except Exception as err:  # pylint: disable=broad-except
+                    # error is raised in caller thread
+                    self._errors[transfer.thread] = err
+            transfer.done.set()
+
+    def _submit(self, transfer):
+        if not self._thread.is_alive():
+            raise StlinkPipelineException("Pipeline is closed")
+        self._queue.put(transfer)
+        self._last_transfers[transfer.thread] = transfer
+        return transfer
+
+    def flush(self):
+        """Wait until all transfers queued by calling thread are finished
+
+        Raises:
+            exception of first failed transfer of calling thread
+        """
+        thread = _threading.get_ident()
+        transfer = self._last_transfers.pop(thread, None)
+        if transfer is not None:
+            transfer.done.wait()
+        err = self._errors.pop(thread, None)
+        if err is not None:
+            raise err
+
+    def xfer(self, command, data=None, rx_length=0, timeout=200):
+        """Transfer command between ST-Link
+
+        Arguments:
+            command: is an list of bytes with command (max 16 bytes)
+            data: data will be sent after command
+            rx_length: number of expected data to receive after command
+                and data transfer, if zero then transfer is only queued
+            timeout: maximum waiting time for received data in ms
+
+        Return:
+            received data
+        """
+        if data is not None and not isinstance(data, bytes):
+            # queued data can not reference buffer of caller, which can be
+            # changed before transfer
+            data = bytes(data)
+        with self._lock:
+            transfer = self._submit(
+                _Transfer(command, data, rx_length, timeout))
+            if rx_length:
+                self.flush()
+                return transfer.result
+        return None
+
+    def xfer_into(self, command, buffer, data=None, timeout=200):
+        """Queue transfer of command and receiving data into buffer
+
+        Buffer is filled after next synchronous call or flush().
+
+        Arguments:
+            command: is an list of bytes with command (max 16 bytes)
+            buffer: writable buffer of bytes for received data, size of
+                buffer is expected data length
+            data: data will be sent after command
+            timeout: maximum waiting time for received data in ms
+
+        Return:
+            number of expected bytes
+        """
+        if data is not None and not isinstance(data, bytes):
+            data = bytes(data)
+        with self._lock:
+            self._submit(_Transfer(command, data, 0, timeout, buffer))
+        return len(buffer)
+
+    def close(self):
+        """Finish all queued transfers and stop I/O thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.flush()
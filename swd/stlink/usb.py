@@ -2,6 +2,9 @@
 """
 
 import sys as _sys
+import array as _array
+import threading as _threading
+import ctypes as _ctypes
 import usb as _usb
 
 
@@ -30,35 +33,54 @@ class MoreDevicesException(StlinkUsbException):
         return self._serial_numbers
 
 
+def compare_serial_no(serial, serial_no):
+    """Compare serial number of device with selected serial number
+
+    Arguments:
+        serial: serial number of device, None if it can not be read
+        serial_no: selected serial number or part (begin or end)
+
+    Return:
+        True if serial number match
+    """
+    if not serial:
+        return False
+    return serial.startswith(serial_no) or serial.endswith(serial_no)
+
+
+class _BufferInfo:
+    """Adapter of writable buffer for pyusb backend
+
+    pyusb backends access read buffer only by buffer_info() and itemsize
+    like array.array, this allow to receive data directly into any writable
+    buffer (bytearray, memoryview, mmap, numpy array, ..)
+    """
+    itemsize = 1
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._data = (_ctypes.c_ubyte * len(self._view)).from_buffer(
+            self._view)
+
+    def buffer_info(self):
+        """Return address and length of buffer"""
+        return _ctypes.addressof(self._data), len(self._view)
+
+
 class StlinkUsbBase:
     """ST link comm base class"""
     ID_VENDOR = None
     ID_PRODUCT = None
     PIPE_OUT = None
     PIPE_IN = None
+    PIPE_TRACE = None
     DEV_NAME = None
 
     def __init__(self, dev):
         self._dev = dev
+        self._serial_no = None
 
-    @classmethod
-    def find_all(cls):
-        """return all devices with this idVendor and idProduct"""
-        devices = []
-        try:
-            usb_devices = _usb.core.find(
-                idVendor=cls.ID_VENDOR,
-                idProduct=cls.ID_PRODUCT,
-                find_all=True)
-            for device in usb_devices:
-                devices.append(cls(device))
-        except _usb.core.NoBackendError as err:
-            raise StlinkUsbException("USB Error: %s" % err)
-        return devices
-
-    @property
-    def serial_no(self):
-        """Return device serial number"""
+    def _read_serial_no(self):
         try:
             serial_no = self._dev.serial_number
         except ValueError:
@@ -70,13 +92,19 @@ class StlinkUsbBase:
         except NotImplementedError:
             return None
 
+    @property
+    def serial_no(self):
+        """Return device serial number
+
+        Serial number is read from string descriptor only once
+        """
+        if self._serial_no is None:
+            self._serial_no = self._read_serial_no()
+        return self._serial_no
+
     def compare_serial_no(self, serial_no):
         """Compare device serial no with selected serial number"""
-        if self.serial_no.startswith(serial_no):
-            return True
-        if self.serial_no.endswith(serial_no):
-            return True
-        return False
+        return compare_serial_no(self.serial_no, serial_no)
 
     def write(self, data, timeout=200):
         """Write data to USB pipe"""
@@ -97,9 +125,73 @@ class StlinkUsbBase:
             raise StlinkUsbException("USB Error: %s" % err)
         return data
 
-    def __del__(self):
+    def read_into(self, buffer, timeout=200):
+        """Read data from USB pipe directly into buffer
+
+        Arguments:
+            buffer: writable buffer, size of buffer is size of read data
+            timeout: maximum waiting time for received data in ms
+
+        Return:
+            number of received bytes
+        """
+        try:
+            if isinstance(buffer, _array.array):
+                return self._dev.read(self.PIPE_IN, buffer, timeout)
+            count = self._backend_read_into(buffer, timeout)
+            if count is None:
+                data = _array.array('B', bytes(len(memoryview(buffer))))
+                count = self._dev.read(self.PIPE_IN, data, timeout)
+                memoryview(buffer).cast('B')[:count] = data[:count]
+            return count
+        except _usb.USBError as err:
+            self._dev = None
+            raise StlinkUsbException("USB Error: %s" % err)
+
+    def _backend_read_into(self, buffer, timeout):
+        """Read data directly into buffer using pyusb backend
+
+        pyusb accept only array.array as buffer for reading, so other
+        buffers are passed directly to backend, this use pyusb internals
+
+        Return:
+            number of received bytes or None if pyusb internals are not
+            available (other pyusb version or backend)
+        """
+        # pylint: disable=protected-access
+        ctx = getattr(self._dev, '_ctx', None)
+        setup_request = getattr(ctx, 'setup_request', None)
+        bulk_read = getattr(getattr(ctx, 'backend', None), 'bulk_read', None)
+        if setup_request is None or bulk_read is None:
+            return None
+        try:
+            intf, endpoint = setup_request(self._dev, self.PIPE_IN)
+            return bulk_read(
+                ctx.handle,
+                endpoint.bEndpointAddress,
+                intf.bInterfaceNumber,
+                _BufferInfo(buffer),
+                timeout)
+        except (AttributeError, TypeError, NotImplementedError):
+            return None
+
+    def read_trace(self, size, timeout=200):
+        """Read SWO trace data from trace USB pipe"""
+        try:
+            data = self._dev.read(self.PIPE_TRACE, size, timeout).tobytes()
+        except _usb.USBError as err:
+            self._dev = None
+            raise StlinkUsbException("USB Error: %s" % err)
+        return data
+
+    def close(self):
+        """Release USB device"""
         if self._dev is not None:
             self._dev.finalize()
+            self._dev = None
+
+    def __del__(self):
+        self.close()
 
 
 class StlinkUsbV2(StlinkUsbBase):
@@ -108,6 +200,7 @@ class StlinkUsbV2(StlinkUsbBase):
     ID_PRODUCT = 0x3748
     PIPE_OUT = 0x02
     PIPE_IN = 0x81
+    PIPE_TRACE = 0x83
     DEV_NAME = "V2"
 
 
@@ -117,6 +210,7 @@ class StlinkUsbV21M(StlinkUsbBase):
     ID_PRODUCT = 0x374b
     PIPE_OUT = 0x01
     PIPE_IN = 0x81
+    PIPE_TRACE = 0x82
     DEV_NAME = "V2-1"
 
 
@@ -126,6 +220,7 @@ class StlinkUsbV21(StlinkUsbBase):
     ID_PRODUCT = 0x3752
     PIPE_OUT = 0x01
     PIPE_IN = 0x81
+    PIPE_TRACE = 0x82
     DEV_NAME = "V2-1"
 
 
@@ -135,15 +230,17 @@ class StlinkUsbV3E(StlinkUsbBase):
     ID_PRODUCT = 0x374e
     PIPE_OUT = 0x01
     PIPE_IN = 0x81
+    PIPE_TRACE = 0x82
     DEV_NAME = "V3E"
 
 
-class StlinkUsbV3(StlinkUsbBase):
+class StlinkUsbV3M(StlinkUsbBase):
     """ST-Link/V3 USB communication"""
     ID_VENDOR = 0x0483
     ID_PRODUCT = 0x374f
     PIPE_OUT = 0x01
     PIPE_IN = 0x81
+    PIPE_TRACE = 0x82
     DEV_NAME = "V3"
 
 
@@ -153,6 +250,7 @@ class StlinkUsbV3(StlinkUsbBase):
     ID_PRODUCT = 0x3753
     PIPE_OUT = 0x01
     PIPE_IN = 0x81
+    PIPE_TRACE = 0x82
     DEV_NAME = "V3"
 
 
@@ -160,31 +258,35 @@ class StlinkUsb:
     """ST-Link communication class"""
     STLINK_MAXIMUM_TRANSFER_SIZE = 6144
     _STLINK_CMD_SIZE = 16
+    _ID_VENDOR = 0x0483
     _COM_CLASSES = [
         StlinkUsbV2,
         StlinkUsbV21M,
         StlinkUsbV21,
         StlinkUsbV3E,
+        StlinkUsbV3M,
         StlinkUsbV3
     ]
 
     @classmethod
     def _find_all_devices(cls):
-        devices = []
-        for com_cls in cls._COM_CLASSES:
-            devices.extend(com_cls.find_all())
-        return devices
+        """Find all ST-Link devices with one USB bus scan"""
+        com_classes = {
+            com_cls.ID_PRODUCT: com_cls for com_cls in cls._COM_CLASSES}
+        try:
+            usb_devices = _usb.core.find(
+                idVendor=cls._ID_VENDOR,
+                find_all=True,
+                custom_match=lambda dev: dev.idProduct in com_classes)
+            return [
+                com_classes[device.idProduct](device)
+                for device in usb_devices]
+        except _usb.core.NoBackendError as err:
+            raise StlinkUsbException("USB Error: %s" % err)
 
     @staticmethod
     def _filter_devices(devices, serial_no):
-        filtered_devices = []
-        for dev in devices:
-            serial = dev.serial_no
-            if serial and (serial.startswith(serial_no) or serial.endswith(serial_no)):
-                filtered_devices.append(dev)
-            else:
-                del dev
-        return filtered_devices
+        return [dev for dev in devices if dev.compare_serial_no(serial_no)]
 
     def print_debug(self, msg, level=0):
         """Print info string"""
@@ -200,39 +302,84 @@ class StlinkUsb:
                 _sys.stderr.write(
                     f"{msg}: {' '.join([f'{i:02x}' for i in data])}\n")
 
-    def __init__(self, serial_no='', debug=0):
+    def __init__(self, serial_no='', debug=0, dev=None):
+        """StlinkUsb constructor
+
+        Arguments:
+            serial_no: serial number or part (begin or end)
+            debug: debug level
+            dev: already found device (StlinkUsbBase instance),
+                then serial_no is ignored
+        """
         self._dev = None
         self._debug = debug
-        devices = StlinkUsb._find_all_devices()
+        # commands can be sent also from trace capture thread
+        self._lock = _threading.RLock()
+        if dev is None:
+            devices = StlinkUsb._find_all_devices()
+            if serial_no:
+                devices = StlinkUsb._filter_devices(devices, serial_no)
+            if not devices:
+                raise NoDeviceFoundException()
+            if len(devices) > 1:
+                raise MoreDevicesException(devices)
+            dev = devices[0]
+        self._dev = dev
+
+    @classmethod
+    def find_all(cls, serial_no='', debug=0):
+        """Open all connected ST-Link devices
+
+        Arguments:
+            serial_no: serial number or part (begin or end)
+            debug: debug level
+
+        Return:
+            list of StlinkUsb instances
+        """
+        devices = cls._find_all_devices()
         if serial_no:
-            devices = StlinkUsb._filter_devices(devices, serial_no)
-        if not devices:
-            raise NoDeviceFoundException()
-        if len(devices) > 1:
-            raise MoreDevicesException(devices)
-        self._dev = devices[0]
+            devices = cls._filter_devices(devices, serial_no)
+        return [cls(debug=debug, dev=dev) for dev in devices]
+
+    def close(self):
+        """Release USB device"""
+        with self._lock:
+            if self._dev is not None:
+                self._dev.close()
 
     @property
     def dev_name(self):
         """property with device name"""
         return self._dev.DEV_NAME
 
-    def xfer(self, command, data=None, rx_length=0, timeout=200):
-        """Transfer command between ST-Link
+    @property
+    def serial_no(self):
+        """property with device serial number"""
+        return self._dev.serial_no
 
-        Arguments:
-            command: is an list of bytes with command (max 16 bytes)
-            data: data will be sent after command
-            rx_length: number of expected data to receive after command
-                and data transfer
-            timeout: maximum waiting time for received data in ms
+    @staticmethod
+    def _as_array(data):
+        """Convert data for USB write
 
-        Return:
-            received data
+        pyusb use array as is, but other objects (bytearray, memoryview)
+        are copied byte by byte, array.frombytes() copy whole buffer at once
 
         Raises:
-            StlinkUsbException
+            StlinkUsbError: if data are not bytes
         """
+        buffer = _array.array('B')
+        try:
+            buffer.frombytes(data)
+        except TypeError:
+            # list or other sequence of bytes
+            try:
+                buffer.frombytes(bytes(data))
+            except (TypeError, ValueError) as err:
+                raise StlinkUsbError("data are not type of bytes") from err
+        return buffer
+
+    def _send(self, command, data, timeout):
         if not isinstance(command, bytes):
             raise StlinkUsbError("command is not type of bytes")
         self.print_debug_data("command", command, level=3)
@@ -245,15 +392,89 @@ class StlinkUsb:
         self.print_debug_data("USB:WR", command, level=4)
         self._dev.write(command, timeout)
         if data:
-            if not isinstance(data, bytes):
-                raise StlinkUsbError("data are not type of bytes")
+            if not isinstance(data, (bytes, _array.array)):
+                data = self._as_array(data)
             self.print_debug_data("USB:WR", data, level=4)
             self._dev.write(data, timeout)
-        if rx_length:
-            # minimum read length is 2 bytes
-            data = self._dev.read(max(2, rx_length))
-            self.print_debug_data("USB:RD", data, level=4)
-            if len(data) != rx_length:
-                data = data[:rx_length]
-            return data
+
+    def xfer(self, command, data=None, rx_length=0, timeout=200):
+        """Transfer command between ST-Link
+
+        Arguments:
+            command: is an list of bytes with command (max 16 bytes)
+            data: data will be sent after command
+            rx_length: number of expected data to receive after command
+                and data transfer
+            timeout: maximum waiting time for received data in ms
+
+        Return:
+            received data
+
+        Raises:
+            StlinkUsbException
+        """
+        with self._lock:
+            self._send(command, data, timeout)
+            if rx_length:
+                # minimum read length is 2 bytes
+                data = self._dev.read(max(2, rx_length))
+                self.print_debug_data("USB:RD", data, level=4)
+                if len(data) != rx_length:
+                    data = data[:rx_length]
+                return data
         return None
+
+    def xfer_into(self, command, buffer, data=None, timeout=200):
+        """Transfer command between ST-Link and receive data into buffer
+
+        Received data are written by USB backend directly into buffer
+        without any intermediate copy.
+
+        Arguments:
+            command: is an list of bytes with command (max 16 bytes)
+            buffer: writable buffer of bytes (memoryview, bytearray, ..)
+                for received data, size of buffer is expected data length
+            data: data will be sent after command
+            timeout: maximum waiting time for received data in ms
+
+        Return:
+            number of received bytes
+
+        Raises:
+            StlinkUsbException
+        """
+        buffer = memoryview(buffer).cast('B')
+        rx_length = len(buffer)
+        if rx_length < 2:
+            # minimum read length is 2 bytes
+            data = self.xfer(command, data, rx_length, timeout)
+            if rx_length:
+                buffer[:] = data
+            return rx_length
+        with self._lock:
+            self._send(command, data, timeout)
+            count = self._dev.read_into(buffer, timeout)
+        self.print_debug_data("USB:RD", buffer[:count], level=4)
+        if count != rx_length:
+            raise StlinkUsbException("Error receiving data")
+        return count
+
+    def read_trace(self, size, timeout=200):
+        """Read SWO trace data from trace pipe of ST-Link
+
+        Trace pipe is independent on command pipes, so it is not locked
+        against transfers from other threads.
+
+        Arguments:
+            size: number of bytes to read (from get_trace_nb command)
+            timeout: maximum waiting time for received data in ms
+
+        Return:
+            received bytes
+
+        Raises:
+            StlinkUsbException
+        """
+        data = self._dev.read_trace(size, timeout)
+        self.print_debug_data("USB:TRACE", data, level=4)
+        return data
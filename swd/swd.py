@@ -1,14 +1,47 @@
 """SWD protocol
 """
 
-import itertools as _itertools
+import contextlib as _contextlib
+import swd.cache as _cache
+import swd.memmap as _memmap
+import swd.plan as _plan
 from swd.stlink import Stlink as _Stlink
 
 
+class SwdException(Exception):
+    """Swd general exception"""
+
+
 class Swd():
     """Swd class"""
 
-    def __init__(self, swd_frequency=None, driver=None, serial_no='', debug=0):
+    # Debug Halting Control and Status Register of Cortex-M core
+    _DHCSR_REG = 0xe000edf0
+    _DHCSR_S_HALT = 0x00020000
+
+    def __init__(
+            self,
+            swd_frequency=None,
+            driver=None,
+            serial_no='',
+            debug=0,
+            deferred_check=False,
+            memory_map=None,
+            cache_size=0):
+        """Swd constructor
+
+        Arguments:
+            swd_frequency: SWD frequency for default driver
+            driver: SWD driver, default is Stlink
+            serial_no: serial number of ST-Link for default driver
+            debug: debug level
+            deferred_check: check state of memory transfers only once
+                at end of each memory operation (not for read generators)
+            memory_map: instance of swd.memmap.MemoryMap
+            cache_size: number of cached memory blocks, zero disable cache,
+                only cacheable regions of memory map are cached (default
+                is Cortex-M memory map)
+        """
         self._debug = debug
         if driver is None:
             # default SWD driver is Stlink
@@ -17,6 +50,213 @@ class Swd():
                 serial_no=serial_no,
                 debug=debug)
         self._drv = driver
+        self._deferred_check = deferred_check
+        self._transfers = None
+        self._memory_map = memory_map
+        self._write_buffer = None
+        self._fill_backend = None
+        self._cache = None
+        if cache_size:
+            # blocks are read by one transfer, power of two size keeps
+            # blocks aligned with boundaries of real memories
+            self._cache = _cache.MemoryCache(
+                memory_map or _memmap.MemoryMap(),
+                block_size=1 << (self._drv.maximum_32bit_data.bit_length() - 1),
+                max_blocks=cache_size)
+
+    @property
+    def deferred_check(self):
+        """Deferred checking of memory transfers
+
+        If True, state of memory transfers is checked only once at end of
+        each memory operation (read, readinto, write_mem, fill_mem, ..)
+        instead of after each chunk. On error exception contain exact fault
+        address and failing chunk.
+
+        Generators read_mem and read_mem8/16/32 still check each chunk
+        before it is yielded: ST-Link keep only one state of unchecked
+        transfers, so operation can not stay open between yields, while
+        other operation can be done (e.g. interleaved generators).
+        """
+        return self._deferred_check
+
+    @deferred_check.setter
+    def deferred_check(self, value):
+        self._deferred_check = value
+
+    @property
+    def memory_map(self):
+        """Memory map (swd.memmap.MemoryMap) or None"""
+        return self._memory_map
+
+    @property
+    def cache(self):
+        """Memory cache (swd.cache.MemoryCache) or None if disabled"""
+        return self._cache
+
+    def invalidate_cache(self, address=None, size=0):
+        """Invalidate cached memory
+
+        Must be called after memory was changed by MCU or other way than
+        by this instance (e.g. flash erase by flash controller).
+
+        Arguments:
+            address: start of invalidated range, None invalidate whole cache
+            size: size of invalidated range
+        """
+        if self._cache is not None:
+            self._cache.invalidate(address, size)
+
+    @property
+    def fill_backend(self):
+        """Backend for filling memory on target
+
+        Callable backend(address, pattern, size, bits) which fill range
+        aligned to access size and return True, or return False if memory
+        must be filled by host (e.g. core can not be halted). It is used by
+        fill_mem, fill_mem8, fill_mem16 and fill_mem32, None disable it
+        (see CortexM.enable_target_fill()).
+        """
+        return self._fill_backend
+
+    @fill_backend.setter
+    def fill_backend(self, backend):
+        self._fill_backend = backend
+
+    def _fill_by_backend(self, address, pattern, size, bits):
+        """Fill memory by fill backend
+
+        Return:
+            True if memory was filled
+        """
+        width = bits // 8
+        if self._fill_backend is None or not size:
+            return False
+        if address % width or size % width:
+            return False
+        return self._fill_backend(address, pattern, size, bits)
+
+    @staticmethod
+    def _rotate_pattern(pattern, offset):
+        """Pattern which start at offset of original pattern"""
+        offset %= len(pattern)
+        return pattern[offset:] + pattern[:offset]
+
+    @_contextlib.contextmanager
+    def write_combining(self):
+        """Context manager for combining of 32 bit writes
+
+        Writes by set_mem32 and write_mem32 are collected and continuous
+        writes (and overlapping writes in RAM regions of memory map) are
+        merged and written by bulk 32 bit transfers. Pending writes are
+        flushed in original order by read of same range, by any other
+        write or core register access, by flush() (called also by CortexM
+        run, step, halt and resets) and at exit.
+        """
+        if self._write_buffer is not None:
+            yield
+            return
+        self._write_buffer = []
+        try:
+            yield
+        finally:
+            try:
+                self.flush()
+            finally:
+                self._write_buffer = None
+
+    def _combine_write(self, address, data):
+        """Append write into write buffer, merge it with last write
+
+        Overlapping writes are merged only in RAM regions of memory map,
+        repeated writes into peripheral register must all be done.
+        """
+        if self._write_buffer:
+            last_address, last_data = self._write_buffer[-1]
+            offset = address - last_address
+            if offset == len(last_data) or (
+                    0 <= offset < len(last_data)
+                    and self._memory_map is not None
+                    and self._memory_map.is_ram(address, len(data))):
+                last_data[offset:offset + len(data)] = data
+                return
+        self._write_buffer.append((address, bytearray(data)))
+
+    def flush(self, address=None, size=0):
+        """Write all pending combined writes
+
+        Arguments:
+            address: flush only if any pending write overlap range,
+                None flush always
+            size: size of range
+        """
+        if not self._write_buffer:
+            return
+        if address is not None and not any(
+                address < write_address + len(write_data)
+                and write_address < address + size
+                for write_address, write_data in self._write_buffer):
+            return
+        write_buffer = self._write_buffer
+        self._write_buffer = []
+        with self._memory_operation():
+            for write_address, write_data in write_buffer:
+                if len(write_data) == 4:
+                    self._drv.set_mem32(
+                        write_address, int.from_bytes(write_data, 'little'))
+                else:
+                    self._write_mem32(write_address, write_data)
+
+    @_contextlib.contextmanager
+    def _memory_operation(self):
+        """Collect transfers of one memory operation and check them at end"""
+        if not self._deferred_check or self._transfers is not None:
+            # nested operation is checked by outer operation
+            yield
+            return
+        self._transfers = []
+        try:
+            yield
+            transfers = self._transfers
+        finally:
+            self._transfers = None
+        if transfers:
+            try:
+                self._drv.check_last_rw_state(transfers)
+            except Exception:
+                # cached blocks from failed operation are not valid
+                self.invalidate_cache()
+                raise
+
+    def _sync(self):
+        """Wait until buffers of queued reads are filled by driver
+
+        Needed before data read into buffer are used inside memory
+        operation, driver without sync() fill buffers immediately.
+        """
+        sync = getattr(self._drv, 'sync', None)
+        if sync is not None:
+            sync()
+
+    def _xfer(self, fnc, address, data):
+        """Call driver memory transfer
+
+        Arguments:
+            fnc: driver function (read_mem8, write_mem32, ..)
+            address: address in memory
+            data: size for read or data for write
+        """
+        if self._transfers is None:
+            return fnc(address, data)
+        size = data if isinstance(data, int) else len(data)
+        self._transfers.append((address, size))
+        return fnc(address, data, check_last_error_status=False)
+
+    def _write(self, fnc, address, data):
+        """Call driver memory write and invalidate cached blocks"""
+        if self._cache is not None:
+            self._cache.invalidate(address, len(data))
+        self._xfer(fnc, address, data)
 
     def get_version(self):
         """Get SWD driver version
@@ -55,6 +295,7 @@ class Swd():
         Return:
             32 bit number
         """
+        self.flush()
         return self._drv.get_reg(register)
 
     def get_reg_all(self):
@@ -67,6 +308,7 @@ class Swd():
         Return:
             list of 32 bit numbers
         """
+        self.flush()
         return self._drv.get_reg_all()
 
     def set_reg(self, register, data):
@@ -80,6 +322,7 @@ class Swd():
             register: register ID
             data: 32 bit number
         """
+        self.flush()
         self._drv.set_reg(register, data)
 
     def get_mem32(self, address):
@@ -93,6 +336,10 @@ class Swd():
         Return:
             return 32 bit number
         """
+        self.flush(address, 4)
+        if self._cache is not None and self._cache.is_cacheable(
+                address - address % self._cache.block_size):
+            return int.from_bytes(self.read(address, 4), 'little')
         return self._drv.get_mem32(address)
 
     def set_mem32(self, address, data):
@@ -104,24 +351,217 @@ class Swd():
             address: address in memory
             data: 32 bit number
         """
+        self.invalidate_cache(address, 4)
+        if self._write_buffer is not None:
+            self._combine_write(address, data.to_bytes(4, 'little'))
+            return
         self._drv.set_mem32(address, data)
 
-    def _get_chunk_size_to_align_size(self, address, size):
-        if size > self._drv.maximum_8bit_data:
-            return min(size, self._drv.maximum_8bit_data - (address % 4))
-        return size
+    def start_trace(self, frequency):
+        """Start receiving of SWO trace data by debugger
+
+        Target must be configured to send trace data (see swd.swo)
+
+        Arguments:
+            frequency: SWO frequency (baud rate) in Hz
+        """
+        self.flush()
+        self._drv.start_trace_rx(frequency)
+
+    def stop_trace(self):
+        """Stop receiving of SWO trace data"""
+        self._drv.stop_trace_rx()
+
+    def read_trace(self):
+        """Read received SWO trace data
+
+        Can be called from other thread than memory operations.
+
+        Return:
+            bytes of data, empty if there are no data
+        """
+        return self._drv.read_trace()
+
+    def _group_addresses(self, addresses, gap):
+        """Group sorted aligned addresses into ranges for bulk reads
+
+        Arguments:
+            addresses: sorted list of unique aligned addresses
+            gap: maximum number of not requested bytes read between
+                two addresses, gaps are bridged only in regions with
+                safe 32 bit access of memory map, without memory map
+                only continuous addresses are grouped
+
+        Return:
+            iterable of tuples with (address, size)
+        """
+        group_address = None
+        group_end = None
+        for address in addresses:
+            if group_address is not None and (
+                    address - group_end <= gap
+                    and address + 4 - group_address
+                    <= self._drv.maximum_32bit_data
+                    and (
+                        address == group_end
+                        or self._memory_map is not None
+                        and self._memory_map.is_word_access(
+                            group_end, address - group_end))):
+                group_end = address + 4
+                continue
+            if group_address is not None:
+                yield group_address, group_end - group_address
+            group_address = address
+            group_end = address + 4
+        if group_address is not None:
+            yield group_address, group_end - group_address
+
+    def get_mem32_many(self, addresses, gap=32):
+        """Get many 32 bit memory registers
+
+        Near addresses are grouped and read by bulk 32 bit transfers.
+
+        Arguments:
+            addresses: iterable of addresses aligned to 4 Bytes
+            gap: maximum number of not requested bytes read between two
+                addresses in one transfer, gaps are read only in regions
+                with safe 32 bit access of memory map, zero or no memory
+                map group only continuous addresses
+
+        Return:
+            list of 32 bit numbers in order of addresses
+        """
+        addresses = list(addresses)
+        for address in addresses:
+            if address % 4:
+                raise SwdException(
+                    "Address 0x%08x is not aligned to 4 Bytes" % address)
+        groups = []
+        self.flush()
+        with self._memory_operation():
+            for group_address, group_size in self._group_addresses(
+                    sorted(set(addresses)), gap):
+                data = bytearray(group_size)
+                self._readinto(group_address, memoryview(data))
+                groups.append((group_address, data))
+            self._sync()
+        values = {}
+        for group_address, data in groups:
+            for offset in range(0, len(data), 4):
+                values[group_address + offset] = int.from_bytes(
+                    data[offset:offset + 4], 'little')
+        return [values[address] for address in addresses]
+
+    def sample_mem32(self, address, count):
+        """Read one 32 bit register many times
+
+        Every read is own transfer (e.g. sampling of DWT_PCSR), reads are
+        not cached. Without deferred_check every read is one transfer
+        with status, with deferred_check state of all reads is checked
+        only once and with pipelined driver reads are only queued.
+
+        Arguments:
+            address: address aligned to 4 Bytes
+            count: number of reads
 
-    def _get_chunk_size_to_align_address(self, address, size):
+        Return:
+            list of 32 bit numbers
+        """
         if address % 4:
-            if size == self._drv.maximum_8bit_data:
-                return size
-            return min(size, self._drv.maximum_8bit_data - (address % 4))
-        return 0
+            raise SwdException(
+                "Address 0x%08x is not aligned to 4 Bytes" % address)
+        self.flush(address, 4)
+        if not self._deferred_check and self._transfers is None:
+            # value and status are returned by one transfer
+            return [self._drv.get_mem32(address) for _ in range(count)]
+        data = bytearray(4 * count)
+        view = memoryview(data)
+        with self._memory_operation():
+            for offset in range(0, len(data), 4):
+                self._read_chunk_into(32, address, view[offset:offset + 4])
+            self._sync()
+        return [
+            int.from_bytes(data[offset:offset + 4], 'little')
+            for offset in range(0, len(data), 4)]
+
+    def set_mem32_many(self, pairs):
+        """Set many 32 bit memory registers
+
+        Continuous addresses are written by bulk 32 bit transfers, order
+        of writes is kept, only if all addresses are in RAM regions of
+        memory map, writes are sorted by address.
+
+        Arguments:
+            pairs: iterable of tuples with (address, 32 bit number)
+        """
+        pairs = list(pairs)
+        if self._memory_map is not None and all(
+                self._memory_map.is_ram(address, 4)
+                for address, _ in pairs):
+            pairs.sort(key=lambda pair: pair[0])
+        with self.write_combining():
+            for address, data in pairs:
+                self.set_mem32(address, data)
+
+    @staticmethod
+    def _sliceable(data):
+        """Prepare data for splitting into chunks
+
+        Objects with buffer protocol (bytes, bytearray, memoryview, array,
+        ..) are sliced by memoryview without copying, other sequences
+        are sliced directly and generic iterables are collected into bytes.
+
+        Arguments:
+            data: data to write
+
+        Return:
+            object which support len() and slicing
+        """
+        try:
+            return memoryview(data).cast('B')
+        except TypeError:
+            pass
+        if hasattr(data, '__getitem__') and hasattr(data, '__len__'):
+            return data
+        return bytes(data)
+
+    def _plan(self, policy, address, size):
+        """Transfer plan of memory operation
+
+        Arguments:
+            policy: swd.plan.READ, swd.plan.WRITE or swd.plan.FILL
+            address: address in memory
+            size: number of bytes
+
+        Return:
+            tuple of tuples with (access bits, offset, size)
+        """
+        return _plan.plan(
+            policy, address, size,
+            self._drv.maximum_8bit_data, self._drv.maximum_32bit_data)
+
+    def _read_chunk(self, bits, address, size):
+        if bits == 8:
+            return self._xfer(self._drv.read_mem8, address, size)
+        return self._xfer(self._drv.read_mem32, address, size)
+
+    def _read_chunk_into(self, bits, address, buffer):
+        """Read chunk into memoryview
+
+        Driver without read_memX_into() is used with copying data
+        """
+        read_into = getattr(self._drv, f'read_mem{bits}_into', None)
+        if read_into is None:
+            buffer[:] = self._read_chunk(bits, address, len(buffer))
+        else:
+            self._xfer(read_into, address, buffer)
 
     def read_mem(self, address, size):
         """Read bytes memory
 
         Automatically use 8 and 32 bit access read which depends on alignment
+        (with memory map, unaligned ranges in regions with safe 32 bit
+        access are read as aligned 32 bit superset)
 
         Arguments:
             address: address in memory
@@ -130,57 +570,176 @@ class Swd():
         Return:
             iterable of read data
         """
-        chunk_size = self._get_chunk_size_to_align_address(address, size)
-        if chunk_size:
-            yield from self._drv.read_mem8(address, chunk_size)
-            address += chunk_size
-            size -= chunk_size
-        while size:
-            chunk_size = size
-            if chunk_size < self._drv.maximum_8bit_data and chunk_size % 4:
-                yield from self._drv.read_mem8(address, chunk_size)
+        self.flush(address, size)
+        if self._cache is not None or self._memory_map is not None:
+            yield from self.read(address, size)
+            return
+        # each chunk is checked before it is yielded, so abandoned or
+        # interleaved generator does not leave operation open
+        for bits, offset, chunk_size in self._plan(_plan.READ, address, size):
+            with self._memory_operation():
+                data = self._read_chunk(bits, address + offset, chunk_size)
+            yield from data
+
+    def readinto(self, address, buffer):
+        """Read memory directly into buffer
+
+        Same access as read_mem, each chunk is received directly into
+        slice of buffer without intermediate copies.
+
+        Arguments:
+            address: address in memory
+            buffer: writable buffer (bytearray, memoryview, mmap,
+                numpy array, ..), size of buffer in bytes is number
+                of bytes to read
+
+        Return:
+            number of read bytes
+        """
+        view = memoryview(buffer).cast('B')
+        self.flush(address, len(view))
+        with self._memory_operation():
+            self._readinto(address, view)
+            self._sync()
+        return len(view)
+
+    def _readinto(self, address, view):
+        """Read memory into memoryview, buffer is filled after _sync()"""
+        if self._cache is not None:
+            self._read_cached_into(address, view)
+        else:
+            self._read_uncached_into(address, view)
+
+    def _read_uncached_into(self, address, view):
+        if self._memory_map is not None and (address % 4 or len(view) % 4):
+            # unaligned range is read by aligned 32 bit superset, if it is
+            # safe in this region, instead of many small 8 bit transfers
+            start = address - address % 4
+            end = (address + len(view) + 3) & ~3
+            if self._memory_map.is_word_access(start, end - start):
+                data = bytearray(end - start)
+                self._read_uncached_into(start, memoryview(data))
+                self._sync()
+                view[:] = data[address - start:address - start + len(view)]
+                return
+        for bits, offset, chunk_size in self._plan(
+                _plan.READ, address, len(view)):
+            self._read_chunk_into(
+                bits, address + offset, view[offset:offset + chunk_size])
+
+    def _read_cached_into(self, address, view):
+        """Read memory through cache
+
+        Cacheable blocks are read whole with 32 bit access, continuous
+        ranges of other blocks are read directly.
+        """
+        block_size = self._cache.block_size
+        offset = 0
+        uncached_offset = None
+        # blocks are copied after all queued reads are finished
+        copies = []
+        while offset < len(view):
+            chunk_address = address + offset
+            block_address = chunk_address - chunk_address % block_size
+            block_offset = chunk_address - block_address
+            chunk_size = min(len(view) - offset, block_size - block_offset)
+            block = self._cache.get(block_address)
+            if block is None and self._cache.is_cacheable(block_address):
+                block = bytearray(block_size)
+                self._read_chunk_into(32, block_address, memoryview(block))
+                self._cache.put(block_address, block)
+            if block is None:
+                if uncached_offset is None:
+                    uncached_offset = offset
             else:
-                chunk_size = min(chunk_size, self._drv.maximum_32bit_data)
-                chunk_size -= chunk_size % 4
-                yield from self._drv.read_mem32(address, chunk_size)
-            address += chunk_size
-            size -= chunk_size
+                if uncached_offset is not None:
+                    self._read_uncached_into(
+                        address + uncached_offset,
+                        view[uncached_offset:offset])
+                    uncached_offset = None
+                copies.append((
+                    offset, chunk_size, block, block_offset))
+            offset += chunk_size
+        if uncached_offset is not None:
+            self._read_uncached_into(
+                address + uncached_offset, view[uncached_offset:])
+        if copies:
+            self._sync()
+        for offset, chunk_size, block, block_offset in copies:
+            view[offset:offset + chunk_size] = block[
+                block_offset:block_offset + chunk_size]
+
+    def read(self, address, size):
+        """Read memory into bytes
+
+        Same access as read_mem, but all chunks are joined into one
+        preallocated buffer instead of yielding each byte.
+
+        Arguments:
+            address: address in memory
+            size: number of bytes to read
+
+        Return:
+            bytes of read data
+        """
+        data = bytearray(size)
+        self.readinto(address, data)
+        return bytes(data)
 
     def write_mem(self, address, data):
         """Write memory
 
         Automatically use 8 and 32 bit access write which depends on alignment
+        (with memory map, unaligned data in RAM regions are merged with
+        partial boundary words and written with 32 bit access)
 
         Arguments:
             address: address in memory
-            data: list or iterable of bytes to write into memory
+            data: bytes like object, list or iterable of bytes to write
+                into memory
         """
-        data = iter(data)
-        # first chunk to align address
-        if address % 4:
-            chunk_size_max = self._drv.maximum_8bit_data - (address % 4)
-            chunk = bytes(_itertools.islice(data, 0, chunk_size_max))
-            if not chunk:
-                return
-            self._drv.write_mem8(address, chunk)
-            address += len(chunk)
-        # write remained data, here is address always aligned
-        while True:
-            chunk = bytes(
-                _itertools.islice(data, 0, self._drv.maximum_32bit_data))
-            if not chunk:
-                return
-            if len(chunk) % 4 == 0:
-                self._drv.write_mem32(address, chunk)
-                address += len(chunk)
-                continue
-            if len(chunk) > self._drv.maximum_8bit_data:
-                chunk_size32 = len(chunk) & 0xfffffffc
-                self._drv.write_mem32(address, chunk[:chunk_size32])
-                del chunk[:chunk_size32]
-                address += chunk_size32
-            self._drv.write_mem8(address, chunk)
-            return
+        self.flush()
+        with self._memory_operation():
+            data = self._sliceable(data)
+            if self._memory_map is not None:
+                start = address - address % 4
+                end = (address + len(data) + 3) & ~3
+                if data and (start != address or end != address + len(data)) \
+                        and self._memory_map.is_ram(start, end - start) \
+                        and self._is_halted():
+                    self._write_mem_merged(address, data)
+                    return
+            for bits, offset, chunk_size in self._plan(
+                    _plan.WRITE, address, len(data)):
+                self._write(
+                    self._drv.write_mem8 if bits == 8
+                    else self._drv.write_mem32,
+                    address + offset, data[offset:offset + chunk_size])
+
+    def _is_halted(self):
+        """Check if core is halted, so it can not change memory"""
+        return bool(
+            self._drv.get_mem32(self._DHCSR_REG) & self._DHCSR_S_HALT)
+
+    def _write_mem_merged(self, address, data):
+        """Write unaligned data into RAM with 32 bit access
+
+        Partial boundary words are read and merged with data, so whole
+        range is written by aligned 32 bit transfers. This is not atomic,
+        so it is used only while core is halted.
+        """
+        start = address - address % 4
+        end = (address + len(data) + 3) & ~3
+        buffer = bytearray(end - start)
+        view = memoryview(buffer)
+        if start != address:
+            self._readinto(start, view[:4])
+        if address + len(data) != end and (
+                end - 4 > start or start == address):
+            self._readinto(end - 4, view[-4:])
+        self._sync()
+        buffer[address - start:address - start + len(data)] = data
+        self._write_mem32(start, buffer)
 
     def fill_mem(self, address, pattern, size):
         """Fill memory with pattern
@@ -192,22 +751,46 @@ class Swd():
             pattern: list of bytes to fill
             size: number of bytes to fill
         """
-        index = 0
-        data = pattern * (
-            (min(size, self._drv.maximum_32bit_data) // len(pattern)) + 1)
-        while size:
-            chunk_size = size
-            if address % 4 or (chunk_size < self._drv.maximum_8bit_data and chunk_size % 4):
-                if chunk_size > self._drv.maximum_8bit_data:
-                    chunk_size = min(chunk_size, self._drv.maximum_8bit_data - (address % 4))
-                self._drv.write_mem8(address, data[index:index + chunk_size])
-            else:
-                chunk_size = min(chunk_size, self._drv.maximum_32bit_data)
-                chunk_size -= chunk_size % 4
-                self._drv.write_mem32(address, data[index:index + chunk_size])
-            index = (index + chunk_size) % len(pattern)
-            address += chunk_size
-            size -= chunk_size
+        self.flush()
+        if self._fill_backend is not None:
+            # aligned part is filled on target, unaligned head and tail
+            # by host
+            head = min(-address % 4, size)
+            middle = (size - head) & ~3
+            if middle and self._fill_by_backend(
+                    address + head, self._rotate_pattern(pattern, head),
+                    middle, 32):
+                self._fill_mem_host(address, pattern, head)
+                offset = head + middle
+                self._fill_mem_host(
+                    address + offset, self._rotate_pattern(pattern, offset),
+                    size - offset)
+                return
+        self._fill_mem_host(address, pattern, size)
+
+    def _fill_mem_host(self, address, pattern, size):
+        self._fill_transfers(
+            address, pattern, self._plan(_plan.FILL, address, size))
+
+    def _fill_transfers(self, address, pattern, transfers):
+        """Fill memory with pattern by transfers of plan"""
+        if not transfers:
+            return
+        writes = {
+            8: self._drv.write_mem8,
+            16: self._drv.write_mem16,
+            32: self._drv.write_mem32,
+        }
+        with self._memory_operation():
+            index = 0
+            data = pattern * (
+                max(chunk_size for _, _, chunk_size in transfers)
+                // len(pattern) + 2)
+            for bits, offset, chunk_size in transfers:
+                self._write(
+                    writes[bits],
+                    address + offset, data[index:index + chunk_size])
+                index = (index + chunk_size) % len(pattern)
 
     def read_mem8(self, address, size):
         """Read memory with 8 bit access
@@ -219,9 +802,12 @@ class Swd():
         Return:
             iterable of read data
         """
+        self.flush(address, size)
         while size:
             chunk_size = min(size, self._drv.maximum_8bit_data)
-            yield from self._drv.read_mem8(address, chunk_size)
+            with self._memory_operation():
+                data = self._xfer(self._drv.read_mem8, address, chunk_size)
+            yield from data
             address += chunk_size
             size -= chunk_size
 
@@ -230,16 +816,17 @@ class Swd():
 
         Arguments:
             address: address in memory
-            data: list or iterable of bytes to write into memory
+            data: bytes like object, list or iterable of bytes to write
+                into memory
         """
-        data = iter(data)
-        while True:
-            chunk = bytes(
-                _itertools.islice(data, 0, self._drv.maximum_8bit_data))
-            if not chunk:
-                return
-            self._drv.write_mem8(address, chunk)
-            address += len(chunk)
+        self.flush()
+        with self._memory_operation():
+            data = self._sliceable(data)
+            chunk_size = self._drv.maximum_8bit_data
+            for offset in range(0, len(data), chunk_size):
+                self._write(
+                    self._drv.write_mem8,
+                    address + offset, data[offset:offset + chunk_size])
 
     def fill_mem8(self, address, pattern, size):
         """Fill memory with pattern using 8 bit access
@@ -249,14 +836,11 @@ class Swd():
             pattern: list of bytes to fill
             size: number of bytes to fill
         """
-        index = 0
-        data = pattern * ((min(size, self._drv.maximum_8bit_data) // len(pattern)) + 1)
-        while size:
-            chunk_size = min(size, self._drv.maximum_8bit_data)
-            self._drv.write_mem8(address, data[index:index + chunk_size])
-            index = (index + chunk_size) % len(pattern)
-            address += chunk_size
-            size -= chunk_size
+        self.flush()
+        if self._fill_by_backend(address, pattern, size, 8):
+            return
+        self._fill_transfers(address, pattern, _plan.fixed(
+            8, size, self._drv.maximum_8bit_data))
 
     def read_mem16(self, address, size):
         """Read memory with 16 bit access
@@ -268,9 +852,12 @@ class Swd():
         Return:
             iterable of read data
         """
+        self.flush(address, size)
         while size:
             chunk_size = min(size, self._drv.maximum_16bit_data)
-            yield from self._drv.read_mem16(address, chunk_size)
+            with self._memory_operation():
+                data = self._xfer(self._drv.read_mem16, address, chunk_size)
+            yield from data
             address += chunk_size
             size -= chunk_size
 
@@ -279,16 +866,17 @@ class Swd():
 
         Arguments:
             address: address in memory
-            data: list or iterable of bytes to write into memory
+            data: bytes like object, list or iterable of bytes to write
+                into memory
         """
-        data = iter(data)
-        while True:
-            chunk = bytes(
-                _itertools.islice(data, 0, self._drv.maximum_16bit_data))
-            if not chunk:
-                return
-            self._drv.write_mem16(address, chunk)
-            address += len(chunk)
+        self.flush()
+        with self._memory_operation():
+            data = self._sliceable(data)
+            chunk_size = self._drv.maximum_16bit_data
+            for offset in range(0, len(data), chunk_size):
+                self._write(
+                    self._drv.write_mem16,
+                    address + offset, data[offset:offset + chunk_size])
 
     def fill_mem16(self, address, pattern, size):
         """Fill memory with pattern using 16 bit access
@@ -298,14 +886,11 @@ class Swd():
             pattern: list of bytes to fill
             size: number of bytes to fill
         """
-        index = 0
-        data = pattern * ((min(size, self._drv.maximum_16bit_data) // len(pattern)) + 1)
-        while size:
-            chunk_size = min(size, self._drv.maximum_16bit_data)
-            self._drv.write_mem16(address, data[index:index + chunk_size])
-            index = (index + chunk_size) % len(pattern)
-            address += chunk_size
-            size -= chunk_size
+        self.flush()
+        if self._fill_by_backend(address, pattern, size, 16):
+            return
+        self._fill_transfers(address, pattern, _plan.fixed(
+            16, size, self._drv.maximum_16bit_data))
 
     def read_mem32(self, address, size):
         """Read memory with 32 bit access
@@ -317,9 +902,12 @@ class Swd():
         Return:
             iterable of read data
         """
+        self.flush(address, size)
         while size:
             chunk_size = min(size, self._drv.maximum_32bit_data)
-            yield from self._drv.read_mem32(address, chunk_size)
+            with self._memory_operation():
+                data = self._xfer(self._drv.read_mem32, address, chunk_size)
+            yield from data
             address += chunk_size
             size -= chunk_size
 
@@ -328,16 +916,24 @@ class Swd():
 
         Arguments:
             address: address in memory
-            data: list or iterable of bytes to write into memory
+            data: bytes like object, list or iterable of bytes to write
+                into memory
         """
-        data = iter(data)
-        while True:
-            chunk = bytes(
-                _itertools.islice(data, 0, self._drv.maximum_32bit_data))
-            if not chunk:
-                return
-            self._drv.write_mem32(address, chunk)
-            address += len(chunk)
+        if self._write_buffer is not None:
+            data = bytes(data)
+            self.invalidate_cache(address, len(data))
+            self._combine_write(address, data)
+            return
+        self._write_mem32(address, data)
+
+    def _write_mem32(self, address, data):
+        with self._memory_operation():
+            data = self._sliceable(data)
+            chunk_size = self._drv.maximum_32bit_data
+            for offset in range(0, len(data), chunk_size):
+                self._write(
+                    self._drv.write_mem32,
+                    address + offset, data[offset:offset + chunk_size])
 
     def fill_mem32(self, address, pattern, size):
         """Fill memory with pattern using 32 bit access
@@ -347,11 +943,8 @@ class Swd():
             pattern: list of bytes to fill
             size: number of bytes to fill
         """
-        index = 0
-        data = pattern * ((min(size, self._drv.maximum_32bit_data) // len(pattern)) + 1)
-        while size:
-            chunk_size = min(size, self._drv.maximum_32bit_data)
-            self._drv.write_mem32(address, data[index:index + chunk_size])
-            index = (index + chunk_size) % len(pattern)
-            address += chunk_size
-            size -= chunk_size
+        self.flush()
+        if self._fill_by_backend(address, pattern, size, 32):
+            return
+        self._fill_transfers(address, pattern, _plan.fixed(
+            32, size, self._drv.maximum_32bit_data))
@@ -0,0 +1,360 @@
+"""SWO trace capture
+
+Target is configured over SWD (TPIU in asynchronous NRZ mode, ITM and
+optionally DWT PC sampling) and ST-Link receive trace data from SWO pin.
+Data are drained from trace pipe by background thread, so target is never
+halted and memory is not polled.
+"""
+
+import threading as _threading
+
+
+class SwoException(Exception):
+    """Swo general exception"""
+
+
+class TraceBuffer:
+    """Thread safe ring buffer of trace data
+
+    When buffer is full, oldest data are dropped.
+    """
+
+    def __init__(self, size):
+        """TraceBuffer constructor
+
+        Arguments:
+            size: maximum number of buffered bytes
+        """
+        if size <= 0:
+            raise SwoException("Size of trace buffer must be positive")
+        self._size = size
+        # deleting from begin of bytearray only move start of data
+        self._data = bytearray()
+        self._dropped = 0
+        self._condition = _threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._data)
+
+    @property
+    def size(self):
+        """Maximum number of buffered bytes"""
+        return self._size
+
+    @property
+    def dropped(self):
+        """Number of bytes dropped because buffer was full"""
+        return self._dropped
+
+    def write(self, data):
+        """Append data and wake up waiting readers
+
+        Arguments:
+            data: bytes of trace data
+        """
+        with self._condition:
+            if len(data) >= self._size:
+                self._dropped += len(self._data) + len(data) - self._size
+                self._data[:] = data[-self._size:]
+            else:
+                overflow = len(self._data) + len(data) - self._size
+                if overflow > 0:
+                    self._dropped += overflow
+                    del self._data[:overflow]
+                self._data += data
+            self._condition.notify_all()
+
+    def read(self, size=-1, timeout=0):
+        """Read and remove data from buffer
+
+        Arguments:
+            size: maximum number of bytes, negative is all buffered data
+            timeout: maximum waiting time in seconds for any data,
+                None is wait until any data
+
+        Return:
+            bytes of data, empty on timeout
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._data, timeout)
+            if size < 0:
+                size = len(self._data)
+            data = bytes(self._data[:size])
+            del self._data[:size]
+        return data
+
+
+class SwoCapture:
+    """Capture of SWO trace data
+
+    Usage:
+        with SwoCapture(dev, cpu_frequency=168000000) as swo:
+            data = swo.read(timeout=1.0)
+    """
+
+    DEMCR = 0xe000edfc
+    DEMCR_TRCENA = 0x01000000
+    TPIU_CSPSR = 0xe0040004
+    TPIU_ACPR = 0xe0040010
+    TPIU_SPPR = 0xe00400f0
+    TPIU_SPPR_NRZ = 0x00000002
+    TPIU_FFCR = 0xe0040304
+    TPIU_FFCR_TRIGIN = 0x00000100
+    ITM_TER = 0xe0000e00
+    ITM_TPR = 0xe0000e40
+    ITM_TCR = 0xe0000e80
+    ITM_TCR_ITMENA = 0x00000001
+    ITM_TCR_TSENA = 0x00000002
+    ITM_TCR_SYNCENA = 0x00000004
+    ITM_TCR_TXENA = 0x00000008
+    ITM_TCR_TRACE_BUS_ID = 0x00010000
+    ITM_LAR = 0xe0000fb0
+    ITM_LAR_KEY = 0xc5acce55
+    DWT_CTRL = 0xe0001000
+    DWT_CTRL_CYCCNTENA = 0x00000001
+    DWT_CTRL_POSTPRESET = 0x0000001e
+    DWT_CTRL_CYCTAP = 0x00000200
+    DWT_CTRL_SYNCTAP = 0x00000400
+    DWT_CTRL_PCSAMPLENA = 0x00001000
+    # DBGMCU_CR of STM32 (F1, F2, F3, F4, L1, ..) with TRACE_IOEN
+    STM32_DBGMCU_CR = 0xe0042004
+    DBGMCU_CR_TRACE_IOEN = 0x00000020
+    # maximum error of SWO frequency given by integer prescaler
+    FREQUENCY_TOLERANCE = 0.03
+
+    def __init__(
+            self,
+            swd,
+            cpu_frequency,
+            swo_frequency=2000000,
+            ports=0xffffffff,
+            timestamps=False,
+            pc_sampling=False,
+            buffer_size=1024 * 1024,
+            output=None,
+            poll_interval=0.001,
+            dbgmcu_cr=None):
+        """SwoCapture constructor
+
+        Arguments:
+            swd: instance of Swd
+            cpu_frequency: frequency of trace clock (core clock) in Hz
+            swo_frequency: SWO frequency (baud rate) in Hz
+            ports: bit mask of enabled ITM stimulus ports
+            timestamps: enable ITM local timestamps
+            pc_sampling: enable periodic DWT PC sampling packets
+            buffer_size: size of ring buffer in bytes
+            output: file name or binary file object, where all received
+                data are also written
+            poll_interval: waiting time in seconds when there are no data
+            dbgmcu_cr: address of vendor debug register where TRACE_IOEN
+                bit enable trace pin (e.g. STM32_DBGMCU_CR for STM32),
+                None is not written
+
+        Raises:
+            SwoException: if SWO frequency can not be derived from CPU
+                frequency
+        """
+        self._swd = swd
+        self._prescaler = self.prescaler(cpu_frequency, swo_frequency)
+        self._swo_frequency = swo_frequency
+        self._ports = ports
+        self._timestamps = timestamps
+        self._pc_sampling = pc_sampling
+        self._buffer = TraceBuffer(buffer_size)
+        self._output = output
+        self._file = None
+        self._poll_interval = poll_interval
+        self._dbgmcu_cr = dbgmcu_cr
+        self._received = 0
+        self._error = None
+        self._stop = _threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @classmethod
+    def prescaler(cls, cpu_frequency, swo_frequency):
+        """Compute value of TPIU_ACPR for SWO frequency
+
+        Arguments:
+            cpu_frequency: frequency of trace clock in Hz
+            swo_frequency: required SWO frequency in Hz
+
+        Return:
+            prescaler value
+
+        Raises:
+            SwoException: if SWO frequency is not reachable
+        """
+        prescaler = max(round(cpu_frequency / swo_frequency) - 1, 0)
+        frequency = cpu_frequency / (prescaler + 1)
+        if abs(frequency - swo_frequency) > (
+                swo_frequency * cls.FREQUENCY_TOLERANCE):
+            raise SwoException(
+                f"SWO frequency {swo_frequency} Hz can not be derived "
+                f"from {cpu_frequency} Hz")
+        return prescaler
+
+    @property
+    def buffer(self):
+        """TraceBuffer with received data"""
+        return self._buffer
+
+    @property
+    def received(self):
+        """Number of all received bytes"""
+        return self._received
+
+    @property
+    def running(self):
+        """True while capture thread is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def configure(self):
+        """Configure target to send trace data over SWO pin
+
+        Is called by start()
+        """
+        swd = self._swd
+        demcr = swd.get_mem32(self.DEMCR)
+        swd.set_mem32(self.DEMCR, demcr | self.DEMCR_TRCENA)
+        if self._dbgmcu_cr is not None:
+            dbgmcu_cr = swd.get_mem32(self._dbgmcu_cr)
+            swd.set_mem32(
+                self._dbgmcu_cr, dbgmcu_cr | self.DBGMCU_CR_TRACE_IOEN)
+        # one bit port in asynchronous NRZ (UART) mode without formatter
+        swd.set_mem32(self.TPIU_CSPSR, 1)
+        swd.set_mem32(self.TPIU_ACPR, self._prescaler)
+        swd.set_mem32(self.TPIU_SPPR, self.TPIU_SPPR_NRZ)
+        swd.set_mem32(self.TPIU_FFCR, self.TPIU_FFCR_TRIGIN)
+        swd.set_mem32(self.ITM_LAR, self.ITM_LAR_KEY)
+        tcr = (
+            self.ITM_TCR_ITMENA
+            | self.ITM_TCR_SYNCENA
+            | self.ITM_TCR_TXENA
+            | self.ITM_TCR_TRACE_BUS_ID)
+        if self._timestamps:
+            tcr |= self.ITM_TCR_TSENA
+        swd.set_mem32(self.ITM_TCR, tcr)
+        # stimulus ports are accessible also from unprivileged code
+        swd.set_mem32(self.ITM_TPR, 0xf)
+        swd.set_mem32(self.ITM_TER, self._ports)
+        if self._pc_sampling:
+            dwt_ctrl = swd.get_mem32(self.DWT_CTRL)
+            swd.set_mem32(self.DWT_CTRL, (
+                dwt_ctrl
+                | self.DWT_CTRL_CYCCNTENA
+                | self.DWT_CTRL_POSTPRESET
+                | self.DWT_CTRL_CYCTAP
+                | self.DWT_CTRL_SYNCTAP
+                | self.DWT_CTRL_PCSAMPLENA))
+
+    def start(self):
+        """Configure target, start trace receiving and capture thread"""
+        if self.running:
+            raise SwoException("Capture is already running")
+        self.configure()
+        if self._output is not None:
+            if hasattr(self._output, 'write'):
+                self._file = self._output
+            else:
+                # closed in stop()
+                self._file = open(  # pylint: disable=consider-using-with
+                    self._output, 'wb')
+        self._error = None
+        self._stop.clear()
+        self._swd.start_trace(self._swo_frequency)
+        self._thread = _threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        data = self._swd.read_trace()
+        if data:
+            self._received += len(data)
+            self._buffer.write(data)
+            if self._file is not None:
+                self._file.write(data)
+        return data
+
+    def _worker(self):
+        try:
+            while not self._stop.is_set():
+                if not self._drain():
+                    self._stop.wait(self._poll_interval)
+        except Exception as err:  # pylint: disable=broad-except
+            # error is raised in caller thread
+            self._error = err
+
+    def _check_error(self):
+        if self._error is not None:
+            err = self._error
+            self._error = None
+            raise err
+
+    def stop(self):
+        """Stop capture thread and trace receiving
+
+        Data still waiting in debugger are drained into buffer.
+
+        Raises:
+            exception from capture thread
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            if self._error is None:
+                self._drain()
+            self._swd.stop_trace()
+        finally:
+            if self._file is not None:
+                if self._file is not self._output:
+                    self._file.close()
+                else:
+                    self._file.flush()
+                self._file = None
+        self._check_error()
+
+    def read(self, size=-1, timeout=0):
+        """Read captured data
+
+        Arguments:
+            size: maximum number of bytes, negative is all buffered data
+            timeout: maximum waiting time in seconds for any data
+
+        Return:
+            bytes of data, empty if there are no data until timeout
+
+        Raises:
+            exception from capture thread
+        """
+        data = self._buffer.read(size, timeout)
+        if not data:
+            self._check_error()
+        return data
+
+    def chunks(self, timeout=None):
+        """Generator of captured data
+
+        Arguments:
+            timeout: stop when there are no data for this time in seconds,
+                None is wait until capture is stopped
+
+        Yield:
+            bytes of data
+        """
+        while True:
+            data = self.read(timeout=0.1 if timeout is None else timeout)
+            if data:
+                yield data
+            elif timeout is not None or not self.running:
+                return
@@ -0,0 +1,292 @@
+"""Unit tests for cortexm.py
+"""
+
+import unittest
+import zlib
+import swd
+import swd.elf
+import swd.stlink
+import swd.stlink.emulator
+
+
+def _add_routine(emu):
+    """Emulated routine: R0 = R0 + R1 and return to LR
+
+    Core is running freely if PC is not routine loaded by load_routine()
+    """
+    registers = emu.registers
+    if registers[15] != (registers[14] & ~1) + 4:
+        return False
+    registers[0] = (registers[0] + registers[1]) & 0xffffffff
+    registers[15] = registers[14] & ~1
+    return True
+
+
+class TestExecute(unittest.TestCase):
+    """Tests for CortexM.execute with emulated core"""
+
+    def _create(self, core):
+        emu = swd.stlink.emulator.StlinkEmulator(core=core)
+        dev = swd.Swd(driver=swd.stlink.Stlink(usb=emu))
+        return emu, swd.CortexM(dev)
+
+    def test_execute(self):
+        """test calling routine, result and restoring registers"""
+        emu, cortexm = self._create(_add_routine)
+        cortexm.halt()
+        cortexm.set_reg('R0', 0x11111111)
+        cortexm.set_reg('PC', 0x08000100)
+        result = cortexm.execute(
+            b'\x40\x18\x70\x47', (5, 7), address=0x20010000)
+        self.assertEqual(result, 12)
+        self.assertEqual(cortexm.get_reg('R0'), 0x11111111)
+        self.assertEqual(cortexm.get_reg('PC'), 0x08000100)
+        self.assertTrue(cortexm.is_halted())
+        self.assertEqual(
+            bytes(emu.memory.read(0x20010000, 8)),
+            b'\x00\xbe\x00\xbe\x40\x18\x70\x47')
+
+    def test_running_core(self):
+        """test that running core is resumed after call"""
+        _, cortexm = self._create(_add_routine)
+        cortexm.run()
+        self.assertEqual(cortexm.execute(b'\x40\x18\x70\x47', (1, 2)), 3)
+        self.assertFalse(cortexm.is_halted())
+
+    def test_timeout(self):
+        """test routine which does not finish"""
+        _, cortexm = self._create(lambda emu: False)
+        cortexm.halt()
+        with self.assertRaises(swd.cortexm.CortexMException) as context:
+            cortexm.execute(b'\xfe\xe7', timeout=0.01)
+        self.assertEqual(str(context.exception), 'Routine timeout')
+        self.assertTrue(cortexm.is_halted())
+
+    def test_fault(self):
+        """test routine halted on other address (e.g. HardFault)"""
+
+        def fault(emu):
+            emu.registers[15] = 0x08000200
+            return True
+
+        _, cortexm = self._create(fault)
+        cortexm.halt()
+        with self.assertRaises(swd.cortexm.CortexMException) as context:
+            cortexm.execute(b'\x70\x47')
+        self.assertEqual(
+            str(context.exception), 'Routine stopped at address: 0x08000200')
+
+    def test_no_return_address(self):
+        """test call without return address"""
+        _, cortexm = self._create(_add_routine)
+        cortexm.halt()
+        with self.assertRaises(swd.cortexm.CortexMException) as context:
+            cortexm.start_call(0x20000004, (1, 2))
+        self.assertEqual(
+            str(context.exception), 'Return address is required')
+
+    def test_load_routine_running(self):
+        """test that routine is not uploaded while core is running"""
+        emu, cortexm = self._create(_add_routine)
+        cortexm.run()
+        with self.assertRaises(swd.cortexm.CortexMException):
+            cortexm.load_routine(b'\x40\x18\x70\x47', 0x20000000)
+        self.assertEqual(bytes(emu.memory.read(0x20000000, 8)), bytes(8))
+
+
+def _crc32_routine(emu):
+    """Emulated crc32_sectors routine"""
+    registers = emu.registers
+    if registers[15] != (registers[14] & ~1) + 4:
+        return False
+    address, sector_size, count, results = registers[:4]
+    for _ in range(count):
+        crc = zlib.crc32(emu.memory.read(address, sector_size))
+        emu.memory.write(results, crc.to_bytes(4, 'little'))
+        address += sector_size
+        results += 4
+    registers[15] = registers[14] & ~1
+    return True
+
+
+class TestChecksum(unittest.TestCase):
+    """Tests for CortexM.checksum with emulated routine"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator(core=_crc32_routine)
+        self._cortexm = swd.CortexM(
+            swd.Swd(driver=swd.stlink.Stlink(usb=self._emu)))
+        self._data = bytes(range(256)) * 100 + b'abc'
+        self._emu.memory.write(0x08000000, self._data)
+
+    def test_checksum(self):
+        """test checksum of whole range"""
+        self.assertEqual(
+            self._cortexm.checksum(0x08000000, len(self._data)),
+            zlib.crc32(self._data))
+        self.assertEqual(self._cortexm.checksum(0x08000000, 0), 0)
+
+    def test_checksum_sectors(self):
+        """test checksums of sectors with shorter last sector"""
+        crcs = self._cortexm.checksum_sectors(
+            0x08000000, len(self._data), 1024)
+        self.assertEqual(len(crcs), 26)
+        self.assertEqual(crcs[3], zlib.crc32(self._data[3072:4096]))
+        self.assertEqual(crcs[-1], zlib.crc32(self._data[25600:]))
+
+    def test_scratch_restored(self):
+        """test that running core is halted and scratch area restored"""
+        self._emu.memory.write(0x20000000, b'firmware data' * 100)
+        self._cortexm.run()
+        self._cortexm.checksum(0x08000000, len(self._data))
+        self.assertEqual(
+            bytes(self._emu.memory.read(0x20000000, 1300)),
+            b'firmware data' * 100)
+        self.assertFalse(self._cortexm.is_halted())
+
+    def test_scratch_overlap(self):
+        """test range over scratch area"""
+        with self.assertRaises(swd.cortexm.CortexMException) as context:
+            self._cortexm.checksum(0x20000000, 4096, scratch=0x20000800)
+        self.assertEqual(
+            str(context.exception), 'Memory range overlap scratch area')
+        self.assertEqual(
+            bytes(self._emu.memory.read(0x20000800, 8)), bytes(8))
+
+
+def _fill_routine(emu):
+    """Emulated fill routine"""
+    registers = emu.registers
+    if registers[15] != (registers[14] & ~1) + 4:
+        return False
+    address, end, pattern_address, pattern_end = registers[:4]
+    pattern = emu.memory.read(pattern_address, pattern_end - pattern_address)
+    size = end - address
+    emu.memory.write(address, (pattern * (size // len(pattern) + 1))[:size])
+    registers[15] = registers[14] & ~1
+    return True
+
+
+class TestTargetFill(unittest.TestCase):
+    """Tests for Swd.fill_mem with fill on target"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator(core=_fill_routine)
+        self._swd = swd.Swd(driver=swd.stlink.Stlink(usb=self._emu))
+        self._cortexm = swd.CortexM(self._swd)
+        self._cortexm.enable_target_fill(scratch=0x20000000, min_size=64)
+
+    def test_fill_mem(self):
+        """test fill with unaligned head and tail filled by host"""
+        self._emu.reset_statistics()
+        self._swd.fill_mem(0x20010001, b'\x01\x02\x03', 50001)
+        self.assertLess(self._emu.tx_bytes, 1000)
+        self.assertEqual(
+            self._swd.read(0x20010000, 50003),
+            b'\x00' + (b'\x01\x02\x03' * 16667) + b'\x00')
+
+    def test_fill_mem16(self):
+        """test fill with 16 bit access"""
+        self._swd.fill_mem16(0x20010002, b'\xaa\xbb\xcc', 60000)
+        self.assertEqual(
+            self._swd.read(0x20010002, 60000), b'\xaa\xbb\xcc' * 20000)
+
+    def test_scratch_overlap(self):
+        """test that range over scratch area is filled by host"""
+        self._emu.reset_statistics()
+        self._swd.fill_mem32(0x20000000, b'\x55', 8192)
+        self.assertGreaterEqual(self._emu.tx_bytes, 8192)
+        self.assertEqual(self._swd.read(0x20000000, 8192), b'\x55' * 8192)
+
+    def test_scratch_restored(self):
+        """test that running core is halted and scratch area restored"""
+        self._emu.memory.write(0x20000000, b'firmware data' * 20)
+        self._cortexm.run()
+        self._swd.fill_mem(0x20010000, b'\x55', 8192)
+        self.assertEqual(
+            bytes(self._emu.memory.read(0x20000000, 260)),
+            b'firmware data' * 20)
+        self.assertEqual(self._swd.read(0x20010000, 8192), b'\x55' * 8192)
+        self.assertFalse(self._cortexm.is_halted())
+
+    def test_not_halted(self):
+        """test that nothing is uploaded if core can not be halted"""
+        self._emu.memory.write(0x20000000, b'firmware data' * 20)
+        self._cortexm.run()
+        self._cortexm.wait_for_halt = lambda timeout=1.0: False
+        self.assertFalse(
+            self._cortexm.fill_mem(0x20010000, b'\x55', 8192))
+        self.assertEqual(
+            bytes(self._emu.memory.read(0x20000000, 260)),
+            b'firmware data' * 20)
+        self.assertEqual(
+            bytes(self._emu.memory.read(0x20010000, 4)), bytes(4))
+        self.assertFalse(self._cortexm.is_halted())
+
+    def test_disable(self):
+        """test fill by host"""
+        self._cortexm.disable_target_fill()
+        self._emu.reset_statistics()
+        self._swd.fill_mem(0x20010000, b'\x55', 8192)
+        self.assertGreaterEqual(self._emu.tx_bytes, 8192)
+
+
+class _PcSampler():
+    """Emulated core, which change DWT_PCSR after each transfer"""
+
+    PCS = (0x08000100, 0x08000104, 0x08000108, 0x08000120)
+
+    def __init__(self):
+        self._index = 0
+
+    def __call__(self, emu):
+        pc = self.PCS[self._index % len(self.PCS)]
+        self._index += 1
+        emu.memory.write(0xe000101c, pc.to_bytes(4, 'little'))
+        return False
+
+
+class TestProfile(unittest.TestCase):
+    """Tests for CortexM.profile with emulated core"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator(core=_PcSampler())
+        self._swd = swd.Swd(
+            driver=swd.stlink.Stlink(usb=self._emu), deferred_check=True)
+        self._cortexm = swd.CortexM(self._swd)
+        self._cortexm.run()
+
+    def test_profile(self):
+        """test histogram of functions"""
+        symbols = swd.elf.SymbolTable([
+            (0x08000100, 0x20, 'main'), (0x08000120, 0x10, 'loop')])
+        profile = self._cortexm.profile(0.05, symbols=symbols, batch=4)
+        self.assertGreater(profile.count, 100)
+        self.assertEqual(profile.invalid, 0)
+        self.assertEqual(set(profile.samples), set(_PcSampler.PCS))
+        functions = profile.functions()
+        self.assertEqual([name for name, _, _ in functions], ['main', 'loop'])
+        self.assertAlmostEqual(functions[0][2], 75.0, delta=2.0)
+        self.assertIn('main', profile.report())
+        # TRCENA is restored
+        self.assertFalse(
+            self._swd.get_mem32(0xe000edfc) & swd.CortexM.DEMCR_TRCENA_BIT)
+
+    def test_rate(self):
+        """test limited sample rate"""
+        profile = self._cortexm.profile(0.1, rate=200)
+        self.assertLessEqual(profile.count, 21)
+        self.assertGreater(profile.rate, 100)
+        self.assertEqual(profile.functions()[0][0][:2], '0x')
+
+    def test_halted(self):
+        """test samples while core is halted"""
+        self._cortexm.halt()
+        self._emu.memory.write(0xe000101c, b'\xff\xff\xff\xff')
+        profile = self._cortexm.profile(0.01, batch=4)
+        self.assertEqual(profile.invalid, profile.count)
+        self.assertEqual(profile.functions(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
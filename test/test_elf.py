@@ -0,0 +1,98 @@
+"""Tests for ELF symbol table reader"""
+
+import os
+import struct
+import tempfile
+import unittest
+import swd.elf
+
+
+def _build_elf(symbols):
+    """Build minimal ELF with symbol table
+
+    Arguments:
+        symbols: list of tuples with (name, value, size, info)
+    """
+    strtab = b'\x00'
+    symtab = bytes(16)
+    for name, value, size, info in symbols:
+        symtab += struct.pack('<3LBBH', len(strtab), value, size, info, 0, 1)
+        strtab += name.encode() + b'\x00'
+    symtab_offset = 52
+    strtab_offset = symtab_offset + len(symtab)
+    shoff = (strtab_offset + len(strtab) + 3) & ~3
+    header = struct.pack(
+        '<16sHHLLLLLHHHHHH', b'\x7fELF\x01\x01\x01', 2, 40, 1, 0, 0,
+        shoff, 0, 52, 0, 0, 40, 3, 0)
+    sections = bytes(40)
+    sections += struct.pack(
+        '<10L', 0, 2, 0, 0, symtab_offset, len(symtab), 2, 1, 4, 16)
+    sections += struct.pack(
+        '<10L', 0, 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0)
+    data = header + symtab + strtab
+    return data + bytes(shoff - len(data)) + sections
+
+
+class TestSymbolTable(unittest.TestCase):
+    """Tests for parsing and lookup"""
+
+    SYMBOLS = [
+        ('main', 0x08000101, 0x20, 0x12),
+        ('loop', 0x08000121, 0x10, 0x12),
+        ('counter', 0x20000000, 4, 0x11),
+        ('Reset_Handler', 0x08000201, 0, 0x12)]
+
+    def test_parse(self):
+        """test reading of function symbols"""
+        table = swd.elf.SymbolTable.from_elf(_build_elf(self.SYMBOLS))
+        self.assertEqual(table.symbols, [
+            (0x08000100, 0x20, 'main'),
+            (0x08000120, 0x10, 'loop'),
+            (0x08000200, 0, 'Reset_Handler')])
+
+    def test_file(self):
+        """test reading from file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'firmware.elf')
+            with open(path, 'wb') as elf_file:
+                elf_file.write(_build_elf(self.SYMBOLS))
+            self.assertEqual(len(swd.elf.SymbolTable.from_elf(path)), 3)
+
+    def test_lookup(self):
+        """test mapping of addresses to functions"""
+        table = swd.elf.SymbolTable.from_elf(_build_elf(self.SYMBOLS))
+        self.assertEqual(table.lookup(0x08000100), 'main')
+        self.assertEqual(table.lookup(0x0800011e), 'main')
+        self.assertEqual(table.lookup(0x08000124), 'loop')
+        self.assertIsNone(table.lookup(0x08000130))
+        self.assertIsNone(table.lookup(0x08000000))
+        self.assertEqual(table.lookup(0x08000300), 'Reset_Handler')
+
+    def test_invalid(self):
+        """test not supported files"""
+        with self.assertRaises(swd.elf.ElfException):
+            swd.elf.SymbolTable.from_elf(b'not elf file')
+        data = bytearray(_build_elf(self.SYMBOLS))
+        data[4] = 2
+        with self.assertRaises(swd.elf.ElfException):
+            swd.elf.SymbolTable.from_elf(data)
+
+    def test_corrupted(self):
+        """test truncated section headers and symbol table"""
+        data = _build_elf(self.SYMBOLS)
+        with self.assertRaises(swd.elf.ElfException) as context:
+            swd.elf.SymbolTable.from_elf(data[:-8])
+        self.assertIsInstance(context.exception.__cause__, struct.error)
+        # size of symbol table over end of file
+        symtab_header = len(data) - 80
+        data = (
+            data[:symtab_header + 20] + struct.pack('<L', 0x10000)
+            + data[symtab_header + 24:])
+        with self.assertRaises(swd.elf.ElfException) as context:
+            swd.elf.SymbolTable.from_elf(data)
+        self.assertEqual(str(context.exception), 'Corrupted symbol table')
+        self.assertIsInstance(context.exception.__cause__, struct.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Unit tests for stlink/emulator.py
+"""
+
+import unittest
+import swd
+import swd.stlink
+import swd.stlink.emulator
+
+
+class _TestEmulator(unittest.TestCase):
+    """Base class for testing Swd with StlinkEmulator"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator()
+        self._stlink = swd.stlink.Stlink(usb=self._emu)
+        self._swd = swd.Swd(driver=self._stlink)
+        self._emu.reset_statistics()
+
+
+class TestEmulatorInfo(_TestEmulator):
+    """Tests for identification commands"""
+
+    def test_version(self):
+        """test version string"""
+        self.assertEqual(self._swd.get_version().str, 'ST-Link/V2 V2J37S7')
+
+    def test_idcode(self):
+        """test IDCODE"""
+        self.assertEqual(self._swd.get_idcode(), 0x2ba01477)
+
+    def test_target_voltage(self):
+        """test target voltage"""
+        self.assertEqual(self._swd.get_target_voltage(), 3.3)
+
+
+class TestEmulatorRegisters(_TestEmulator):
+    """Tests for core registers"""
+
+    def test_set_get_reg(self):
+        """test core register write and read"""
+        self._swd.set_reg(3, 0x12345678)
+        self.assertEqual(self._swd.get_reg(3), 0x12345678)
+        self.assertEqual(self._swd.get_reg_all()[3], 0x12345678)
+
+    def test_halt(self):
+        """test DHCSR halt status"""
+        cortexm = swd.CortexM(self._swd)
+        self.assertFalse(cortexm.is_halted())
+        cortexm.halt()
+        self.assertTrue(cortexm.is_halted())
+        cortexm.run()
+        self.assertFalse(cortexm.is_halted())
+
+
+class TestEmulatorMemory(_TestEmulator):
+    """Tests for memory access"""
+
+    def test_mem32(self):
+        """test 32 bit register access"""
+        self._swd.set_mem32(0x20000010, 0xdeadbeef)
+        self.assertEqual(self._swd.get_mem32(0x20000010), 0xdeadbeef)
+
+    def test_read_write_mem(self):
+        """test unaligned read and write"""
+        data = bytes(i & 0xff for i in range(10001))
+        self._swd.write_mem(0x20000003, data)
+        self.assertEqual(bytes(self._swd.read_mem(0x20000003, 10001)), data)
+
+    def test_flash_default(self):
+        """test erased flash"""
+        self.assertEqual(
+            bytes(self._swd.read_mem(0x08000000, 8)), b'\xff' * 8)
+
+    def test_read_fault(self):
+        """test reading not mapped memory"""
+        with self.assertRaises(swd.stlink.StlinkException) as context:
+            list(self._swd.read_mem(0x2001fff0, 32))
+        self.assertEqual(
+            str(context.exception), 'AP fault at address: 0x20020000')
+
+    def test_write_fault(self):
+        """test writing into read only memory"""
+        with self.assertRaises(swd.stlink.StlinkException) as context:
+            self._swd.write_mem32(0x08000000, bytes(4))
+        self.assertEqual(
+            str(context.exception), 'AP fault at address: 0x08000000')
+
+    def test_xfer_count(self):
+        """test counting of transfers, each bulk read check last state"""
+        list(self._swd.read_mem32(0x20000000, 3 * 6144))
+        self.assertEqual(self._emu.xfer_count, 6)
+        self.assertEqual(self._emu.rx_bytes, 3 * 6144 + 3 * 12)
+
+
+class TestEmulatorTrace(_TestEmulator):
+    """Tests for SWO trace receiving"""
+
+    def test_read_trace(self):
+        """test data received only while trace is started"""
+        self._emu.trace_write(b'lost')
+        self._swd.start_trace(2000000)
+        self.assertEqual(self._emu.trace_frequency, 2000000)
+        self.assertEqual(self._swd.read_trace(), b'')
+        self._emu.trace_write(b'abc')
+        self._emu.trace_write(b'def')
+        self.assertEqual(self._swd.read_trace(), b'abcdef')
+        self._swd.stop_trace()
+        self.assertIsNone(self._emu.trace_frequency)
+
+    def test_buffer_overflow(self):
+        """test data over size of ST-Link trace buffer"""
+        self._swd.start_trace(2000000)
+        self._emu.trace_write(bytes(5000))
+        self.assertEqual(len(self._swd.read_trace()), 4096)
+
+    def test_maximum_frequency(self):
+        """test SWO frequency over limit of ST-Link/V2"""
+        with self.assertRaises(swd.stlink.StlinkException):
+            self._swd.start_trace(4000000)
+
+
+class TestEmulatorLatency(unittest.TestCase):
+    """Tests for latency model"""
+
+    def test_elapsed(self):
+        """test accumulated time without sleeping"""
+        emu = swd.stlink.emulator.StlinkEmulator(
+            latency=0.001, bandwidth=1000000, sleep=False)
+        emu.xfer(bytes([0xf2, 0x07, 0, 0, 0, 0x20, 0, 0x10]), rx_length=4096)
+        self.assertAlmostEqual(emu.elapsed, 0.001 + (16 + 4096) / 1000000)
+        self.assertEqual(emu.xfer_count, 1)
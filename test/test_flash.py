@@ -0,0 +1,570 @@
+"""Tests for flash programming"""
+
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+import swd
+import swd.flash
+import swd.routines
+import swd.stlink
+import swd.stlink.emulator
+
+
+class _FlashController(swd.stlink.emulator.MemoryRegion):
+    """Emulated flash controller with one bank"""
+
+    def __init__(self, driver, memory):
+        super().__init__(driver.REGISTERS, 0x100, 'FLASH_CONTROLLER')
+        self._driver = driver
+        self._memory = memory
+        self._keys = []
+        self._address = driver.REGISTERS
+        self.locked = True
+        self.status = 0
+        self.erased = []
+        self._store(driver.CR, driver.CR_LOCK)
+
+    def _store(self, offset, value):
+        super().write(self.address + offset, struct.pack('<L', value))
+
+    def _load(self, offset):
+        return struct.unpack(
+            '<L', super().read(self.address + offset, 4))[0]
+
+    def read(self, address, size):
+        self._store(self._driver.SR, self.status)
+        return super().read(address, size)
+
+    def write(self, address, data):
+        driver = self._driver
+        offset = address - self.address
+        value, = struct.unpack('<L', data)
+        if offset == driver.KEYR:
+            self._keys.append(value)
+            if self._keys[-2:] == [driver.KEY1, driver.KEY2]:
+                self.locked = False
+                self._store(driver.CR, 0)
+            return
+        if offset == driver.SR:
+            self.status &= ~value
+            return
+        if offset != driver.CR:
+            super().write(address, data)
+            return
+        if self.locked:
+            return
+        if value & driver.CR_LOCK:
+            self.locked = True
+        elif value & driver.CR_START:
+            self._erase(value & ~driver.CR_START)
+        self._store(driver.CR, value)
+
+    def _erase(self, command):
+        for sector in self._driver.sectors():
+            if self._driver.erase_command(sector) != command:
+                continue
+            if (self._driver.AR is not None
+                    and self._load(self._driver.AR) != sector.address):
+                continue
+            self._memory.write(sector.address, b'\xff' * sector.size)
+            self.erased.append(sector)
+
+    def is_programming(self):
+        """Check if flash is unlocked and in programming mode"""
+        return not self.locked and (
+            self._load(self._driver.CR) == self._driver.CR_PROGRAM)
+
+
+class _LoaderCore():
+    """Emulated flash loader, buffers are programmed between transfers
+
+    CRC32 and blank check routines are emulated too.
+    """
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._buffer = None
+        self.programmed = []
+        # status set by controller during programming
+        self.error = 0
+
+    def __call__(self, emu):
+        registers = emu.registers
+        entry = (registers[14] & ~1) + 4
+        if registers[15] == entry and emu.memory.read(entry, 8) == (
+                swd.routines.CRC32_SECTORS[:8]):
+            return self._crc32_sectors(emu)
+        if registers[15] == entry and emu.memory.read(entry, 8) == (
+                swd.routines.BLANK_CHECK[:8]):
+            return self._blank_check(emu)
+        if registers[15] == entry:
+            # first buffer, running loader is marked by PC after entry
+            self._buffer = registers[0]
+            registers[12] = registers[0]
+            registers[15] = entry + 2
+        if registers[15] != entry + 2:
+            return False
+        params = struct.unpack('<5L', emu.memory.read(registers[1], 20))
+        program_size = params[3]
+        src, dest, size = struct.unpack(
+            '<3L', emu.memory.read(self._buffer, 12))
+        if not size:
+            return False
+        if size == 0xffffffff:
+            return self._stop(registers, 0)
+        if self.error:
+            self._controller.status = self.error
+            return self._stop(registers, self.error)
+        assert self._controller.is_programming()
+        assert dest % program_size == 0 and size % program_size == 0
+        old = emu.memory.read(dest, size)
+        data = emu.memory.read(src, size)
+        # flash cells can only be cleared
+        emu.memory.write(
+            dest, bytes(byte & new for byte, new in zip(old, data)))
+        self.programmed.append((dest, size))
+        emu.memory.write(self._buffer + 8, bytes(4))
+        if self._buffer == registers[12]:
+            self._buffer += 12
+        else:
+            self._buffer = registers[12]
+        return False
+
+    def _crc32_sectors(self, emu):
+        registers = emu.registers
+        address, sector_size, count, results = registers[:4]
+        for _ in range(count):
+            crc = zlib.crc32(emu.memory.read(address, sector_size))
+            emu.memory.write(results, crc.to_bytes(4, 'little'))
+            address += sector_size
+            results += 4
+        return self._stop(registers, registers[0])
+
+    def _blank_check(self, emu):
+        registers = emu.registers
+        address, sector_size, count, results = registers[:4]
+        for _ in range(count):
+            blank = emu.memory.read(address, sector_size) == (
+                b'\xff' * sector_size)
+            emu.memory.write(results, struct.pack('<L', blank))
+            address += sector_size
+            results += 4
+        return self._stop(registers, registers[0])
+
+    @staticmethod
+    def _stop(registers, result):
+        registers[0] = result
+        registers[15] = registers[14] & ~1
+        return True
+
+
+class TestFlashDrivers(unittest.TestCase):
+    """Tests for layout of sectors and erase commands"""
+
+    def test_f0(self):
+        """test F0 pages"""
+        driver = swd.flash.FlashDriverF0(64 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 64)
+        self.assertEqual(
+            sectors[3], swd.flash.FlashSector(0x08000c00, 1024, 3))
+        self.assertEqual(driver.registers(sectors[3]), 0x40022000)
+
+    def test_f1_xl(self):
+        """test F1 XL-density with second bank"""
+        driver = swd.flash.FlashDriverF1(1024 * 1024, page_size=2048)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 512)
+        self.assertEqual(
+            sectors[256], swd.flash.FlashSector(0x08080000, 2048, 0, 1))
+        self.assertEqual(driver.registers(sectors[255]), 0x40022000)
+        self.assertEqual(driver.registers(sectors[256]), 0x40022040)
+
+    def test_f4(self):
+        """test F4 sectors"""
+        driver = swd.flash.FlashDriverF4(512 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(
+            [sector.size // 1024 for sector in sectors],
+            [16, 16, 16, 16, 64, 128, 128, 128])
+        self.assertEqual(sectors[5].address, 0x08020000)
+        self.assertEqual(driver.erase_command(sectors[5]), 0x0000022a)
+
+    def test_f4_dual_bank(self):
+        """test F4 with 2 MB flash"""
+        driver = swd.flash.FlashDriverF4(2048 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 24)
+        self.assertEqual(
+            sectors[12], swd.flash.FlashSector(0x08100000, 16384, 12, 1))
+        # SNB of sector 12 is 0b10000
+        self.assertEqual(driver.erase_command(sectors[12]), 0x00000282)
+        self.assertEqual(driver.registers(sectors[12]), 0x40023c00)
+
+    def test_f4_single_bank(self):
+        """test F413 with 1.5 MB flash in one bank"""
+        driver = swd.flash.FlashDriverF4(1536 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 16)
+        self.assertEqual(
+            sectors[15], swd.flash.FlashSector(0x08160000, 131072, 15, 0))
+        self.assertEqual(driver.erase_command(sectors[15]), 0x0000027a)
+
+    def test_l4_dual_bank_512k(self):
+        """test L47x with 512 KB flash, second bank start at half"""
+        driver = swd.flash.FlashDriverL4(512 * 1024, dual_bank=True)
+        sectors = driver.sectors()
+        self.assertEqual(
+            sectors[128], swd.flash.FlashSector(0x08040000, 2048, 0, 1))
+        self.assertEqual(driver.erase_command(sectors[128]), 0x00000802)
+
+    def test_l4_dual_bank(self):
+        """test L4 with 1 MB flash"""
+        driver = swd.flash.FlashDriverL4(1024 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 512)
+        self.assertEqual(
+            sectors[257], swd.flash.FlashSector(0x08080800, 2048, 1, 1))
+        self.assertEqual(driver.erase_command(sectors[2]), 0x00000012)
+        self.assertEqual(driver.erase_command(sectors[257]), 0x0000080a)
+
+    def test_g0(self):
+        """test G0 pages"""
+        driver = swd.flash.FlashDriverG0(128 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 64)
+        self.assertEqual(driver.erase_command(sectors[63]), 0x000001fa)
+
+    def test_h7(self):
+        """test H7 with two banks"""
+        driver = swd.flash.FlashDriverH7(2048 * 1024)
+        sectors = driver.sectors()
+        self.assertEqual(len(sectors), 16)
+        self.assertEqual(
+            sectors[9], swd.flash.FlashSector(0x08120000, 131072, 1, 1))
+        self.assertEqual(driver.erase_command(sectors[9]), 0x00000134)
+        self.assertEqual(driver.registers(sectors[9]), 0x52002100)
+
+    def test_find_driver_class(self):
+        """test driver by device ID"""
+        self.assertIs(
+            swd.flash.find_driver_class(0x413), swd.flash.FlashDriverF4)
+        self.assertIs(
+            swd.flash.find_driver_class(0x450), swd.flash.FlashDriverH7)
+        self.assertIsNone(swd.flash.find_driver_class(0x123))
+
+
+class _TestFlash(unittest.TestCase):
+    """Base class with emulated MCU with flash controller"""
+
+    DRIVER = swd.flash.FlashDriverF1(64 * 1024)
+
+    def setUp(self):
+        regions = [
+            swd.stlink.emulator.MemoryRegion(
+                0x08000000, 0x00010000, 'FLASH', 0xff, False),
+            swd.stlink.emulator.MemoryRegion(
+                0x1fff0000, 0x00010000, 'SYSTEM', 0xff, False),
+            swd.stlink.emulator.MemoryRegion(0x20000000, 0x00020000, 'SRAM'),
+            swd.stlink.emulator.MemoryRegion(0x40015800, 0x00000400, 'DBG'),
+            swd.stlink.emulator.MemoryRegion(0xe0000000, 0x00100000, 'PPB'),
+        ]
+        self._memory = swd.stlink.emulator.Memory(regions)
+        self._controller = _FlashController(self.DRIVER, self._memory)
+        self._memory.add_region(self._controller)
+        self._loader = _LoaderCore(self._controller)
+        self._emu = swd.stlink.emulator.StlinkEmulator(
+            memory=self._memory, core=self._loader)
+        self._swd = swd.Swd(driver=swd.stlink.Stlink(usb=self._emu))
+        self._cortexm = swd.CortexM(self._swd)
+
+
+class TestFlashDetect(_TestFlash):
+    """Tests for detection of flash driver"""
+
+    def test_detect_f1(self):
+        """test detection of F1 high-density"""
+        self._memory.write(0xe0042000, struct.pack('<L', 0x10036414))
+        self._memory.write(0x1ffff7e0, struct.pack('<H', 512))
+        driver = swd.flash.detect_driver(self._swd)
+        self.assertIsInstance(driver, swd.flash.FlashDriverF1)
+        self.assertEqual(driver.flash_size, 512 * 1024)
+        self.assertEqual(driver.sectors()[1].address, 0x08000800)
+
+    def test_detect_l4(self):
+        """test detection of L4 banks by device ID"""
+        self._memory.write(0xe0042000, struct.pack('<L', 0x10076415))
+        self._memory.write(0x1fff75e0, struct.pack('<H', 512))
+        driver = swd.flash.detect_driver(self._swd)
+        self.assertIsInstance(driver, swd.flash.FlashDriverL4)
+        self.assertEqual(driver.sectors()[128].bank, 1)
+        self._memory.write(0xe0042000, struct.pack('<L', 0x10076462))
+        driver = swd.flash.detect_driver(self._swd)
+        self.assertEqual(driver.sectors()[128].bank, 0)
+
+    def test_detect_f0(self):
+        """test detection of Cortex-M0 part"""
+        self._memory.write(0x40015800, struct.pack('<L', 0x20006440))
+        self._memory.write(0x1ffff7cc, struct.pack('<H', 32))
+        flash = swd.flash.Flash(self._cortexm)
+        self.assertIsInstance(flash.driver, swd.flash.FlashDriverF0)
+        self.assertEqual(len(flash.sectors()), 32)
+
+    def test_not_supported(self):
+        """test unknown MCU"""
+        with self.assertRaises(swd.flash.FlashException):
+            swd.flash.detect_driver(self._swd)
+
+
+class TestFlashErase(_TestFlash):
+    """Tests for erase of flash"""
+
+    def setUp(self):
+        super().setUp()
+        self._memory.write(0x08000000, bytes(0x10000))
+        self._flash = swd.flash.Flash(self._cortexm, driver=self.DRIVER)
+
+    def test_erase_plan(self):
+        """test sectors overlapping range"""
+        self.assertEqual(
+            [sector.number for sector in self._flash.erase_plan(
+                0x080003ff, 0x402)],
+            [0, 1, 2])
+        with self.assertRaises(swd.flash.FlashException):
+            self._flash.erase_plan(0x0800fc00, 0x800)
+
+    def test_erase(self):
+        """test erase of pages with progress"""
+        progress = []
+        sectors = self._flash.erase(
+            0x08000400, 0x800,
+            progress=lambda *args: progress.append(args))
+        self.assertEqual(self._controller.erased, sectors)
+        self.assertEqual(
+            progress, [('erase', 1024, 2048), ('erase', 2048, 2048)])
+        self.assertEqual(
+            self._swd.read(0x08000000, 0x1000),
+            bytes(0x400) + b'\xff' * 0x800 + bytes(0x400))
+        self.assertTrue(self._controller.locked)
+
+    def test_erase_cached(self):
+        """test that cached flash is invalidated by erase"""
+        self._swd = swd.Swd(
+            driver=swd.stlink.Stlink(usb=self._emu), cache_size=4)
+        self._flash = swd.flash.Flash(
+            swd.CortexM(self._swd), driver=self.DRIVER)
+        self.assertEqual(self._swd.read(0x08000000, 16), bytes(16))
+        self._flash.erase(0x08000000, 1)
+        self.assertEqual(self._swd.read(0x08000000, 16), b'\xff' * 16)
+
+
+class TestFlashProgram(_TestFlash):
+    """Tests for programming by loader"""
+
+    def setUp(self):
+        super().setUp()
+        self._flash = swd.flash.Flash(
+            self._cortexm, driver=self.DRIVER, buffer_size=1024)
+        self._cortexm.halt()
+
+    def test_program(self):
+        """test programming of unaligned data with double buffering"""
+        data = bytes(range(251)) * 40
+        progress = []
+        self._flash.program(
+            0x08000101, data, progress=lambda *args: progress.append(args))
+        self.assertEqual(self._swd.read(0x08000101, len(data)), data)
+        self.assertEqual(self._swd.read(0x08000100, 1), b'\xff')
+        # data are padded to half-words
+        self.assertEqual(self._loader.programmed[0], (0x08000100, 1024))
+        self.assertEqual(len(self._loader.programmed), 10)
+        self.assertEqual(progress[-1], ('program', 10042, 10042))
+        self.assertTrue(self._controller.locked)
+        self.assertTrue(self._cortexm.is_halted())
+
+    def test_program_restore_core(self):
+        """test that registers are restored after programming"""
+        self._cortexm.set_reg('PC', 0x08000200)
+        self._cortexm.set_reg('R0', 0x12345678)
+        self._flash.program(0x08000000, b'\x01\x02\x03\x04')
+        self.assertEqual(self._cortexm.get_reg('PC'), 0x08000200)
+        self.assertEqual(self._cortexm.get_reg('R0'), 0x12345678)
+
+    def test_write(self):
+        """test erase and program"""
+        self._memory.write(0x08001000, b'\x55' * 0x400)
+        self._flash.write(0x08001000, b'\xaa' * 0x300, verify=False)
+        self.assertEqual(
+            self._swd.read(0x08001000, 0x400),
+            b'\xaa' * 0x300 + b'\xff' * 0x100)
+
+    def test_error(self):
+        """test error reported by flash controller"""
+        self._loader.error = 0x10
+        with self.assertRaises(swd.flash.FlashException):
+            self._flash.program(0x08000000, bytes(4096))
+        self.assertTrue(self._controller.locked)
+        self.assertEqual(self._controller.status, 0)
+
+    def test_buffer_size(self):
+        """test wrong size of buffer"""
+        with self.assertRaises(swd.flash.FlashException):
+            swd.flash.Flash(self._cortexm, driver=self.DRIVER, buffer_size=100)
+
+
+class TestFlashUpdate(_TestFlash):
+    """Tests for incremental programming"""
+
+    UID = bytes(range(12))
+
+    def setUp(self):
+        super().setUp()
+        self._memory.write(0x1ffff7e8, self.UID)
+        self._flash = swd.flash.Flash(self._cortexm, driver=self.DRIVER)
+        self._cortexm.halt()
+        self._image = bytes(range(256)) * 128
+
+    def test_get_uid(self):
+        """test unique ID"""
+        self.assertEqual(self._flash.get_uid(), self.UID)
+
+    def test_update(self):
+        """test that only changed sector is reprogrammed"""
+        self._emu.reset_statistics()
+        sectors = self._flash.update(0x08000000, self._image)
+        full_tx_bytes = self._emu.tx_bytes
+        self.assertEqual(len(sectors), 32)
+        image = bytearray(self._image)
+        image[5000] ^= 0xff
+        self._emu.reset_statistics()
+        sectors = self._flash.update(0x08000000, image)
+        self.assertEqual(sectors, [self.DRIVER.sectors()[4]])
+        self.assertEqual(self._controller.erased[-1], sectors[0])
+        self.assertEqual(self._swd.read(0x08000000, len(image)), image)
+        self.assertLess(self._emu.tx_bytes, full_tx_bytes / 4)
+
+    def test_unchanged(self):
+        """test update with same image"""
+        self._flash.update(0x08000000, self._image)
+        erased = len(self._controller.erased)
+        self.assertEqual(self._flash.update(0x08000000, self._image), [])
+        self.assertEqual(len(self._controller.erased), erased)
+
+    def test_erased_outside_data(self):
+        """test that sector with other data outside of image is changed"""
+        self._flash.update(0x08000000, self._image)
+        self._memory.write(0x08007ff0, bytes(16))
+        self.assertEqual(
+            self._flash.changed_sectors(0x08000000, self._image[:-16]),
+            [self.DRIVER.sectors()[31]])
+
+    def test_read_method(self):
+        """test comparing by read back"""
+        self._flash.update(0x08000000, self._image)
+        self._memory.write(0x08001234, b'\x00')
+        self.assertEqual(
+            self._flash.changed_sectors(
+                0x08000000, self._image,
+                method=swd.flash.CHECKSUM_READ),
+            [self.DRIVER.sectors()[4]])
+
+    def test_hash_cache(self):
+        """test that flash is not checked when sectors are cached"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hashes.json')
+            self._flash.update(
+                0x08000000, self._image,
+                hash_cache=swd.flash.FlashHashCache(path))
+            hash_cache = swd.flash.FlashHashCache(path)
+            sector = self.DRIVER.sectors()[2]
+            self.assertEqual(
+                hash_cache.get(self.UID, sector),
+                zlib.crc32(self._image[2048:3072]))
+            # change behind cache is not detected
+            self._memory.write(0x08000800, bytes(16))
+            self._emu.reset_statistics()
+            self.assertEqual(self._flash.update(
+                0x08000000, self._image, verify=False,
+                hash_cache=hash_cache), [])
+            self.assertLess(self._emu.tx_bytes, 100)
+            hash_cache.invalidate(self.UID, [sector])
+            self.assertEqual(self._flash.update(
+                0x08000000, self._image, hash_cache=hash_cache), [sector])
+
+    def test_update_blank(self):
+        """test that erased sectors are only programmed"""
+        self._flash.update(0x08000000, self._image)
+        self.assertEqual(self._controller.erased, [])
+        self.assertEqual(
+            self._swd.read(0x08000000, len(self._image)), self._image)
+
+
+class TestFlashBlankCheck(_TestFlash):
+    """Tests for blank check of sectors"""
+
+    def setUp(self):
+        super().setUp()
+        self._flash = swd.flash.Flash(self._cortexm, driver=self.DRIVER)
+        self._cortexm.halt()
+        self._memory.write(0x08000800, b'\x01' * 0x400)
+        self._memory.write(0x08000c00, b'\x02' * 0x10)
+        self._memory.write(0x08001600, b'\x00')
+        self._sectors = self.DRIVER.sectors()
+
+    def test_blank_sectors(self):
+        """test blank check on target"""
+        self.assertEqual(
+            self._flash.blank_sectors(self._sectors[:8]),
+            [True, True, False, False, True, False, True, True])
+
+    def test_blank_sectors_sampled(self):
+        """test coarse blank check by host"""
+        self.assertEqual(
+            self._flash.blank_sectors(self._sectors[:8], samples=2),
+            [True, True, False, False, True, False, True, True])
+        # programmed byte between samples is not found
+        self.assertEqual(
+            self._flash.blank_sectors(self._sectors[5:6], samples=1),
+            [True])
+
+    def test_blank_sectors_unaligned(self):
+        """test that unaligned sector is not checked on target"""
+        with self.assertRaises(swd.flash.FlashException):
+            self._flash.blank_sectors([swd.flash.FlashSector(
+                0x08000000, 0x3fe, 0, 0)])
+        with self.assertRaises(swd.cortexm.CortexMException):
+            self._cortexm.blank_check_sectors(0x08000000, 0x800, 0x3fe)
+
+    def test_read_sparse(self):
+        """test dump without erased sectors"""
+        self._emu.reset_statistics()
+        progress = []
+        segments = self._flash.read_sparse(
+            0x08000000, 0x10000,
+            progress=lambda *args: progress.append(args))
+        self.assertEqual(
+            [(address, len(data)) for address, data in segments],
+            [(0x08000800, 0x800), (0x08001400, 0x400)])
+        self.assertEqual(segments[0][1][:0x401], b'\x01' * 0x400 + b'\x02')
+        self.assertEqual(segments[1][1][0x200], 0)
+        self.assertLess(self._emu.rx_bytes, 0x2000)
+        self.assertEqual(progress[-1], ('read', 0x10000, 0x10000))
+
+    def test_read_sparse_partial(self):
+        """test dump of range starting inside of sector"""
+        segments = self._flash.read_sparse(0x08000bf0, 0x20)
+        self.assertEqual(
+            segments, [(0x08000bf0, b'\x01' * 0x10 + b'\x02' * 0x10)])
+
+    def test_erase_skip_blank(self):
+        """test that erased sectors are not erased again"""
+        sectors = self._flash.erase(0x08000000, 0x2000, skip_blank=True)
+        self.assertEqual(
+            sectors, [self._sectors[2], self._sectors[3], self._sectors[5]])
+        self.assertEqual(self._controller.erased, sectors)
+
+
+if __name__ == "__main__":
+    unittest.main()
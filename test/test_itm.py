@@ -0,0 +1,127 @@
+"""Tests for ITM and DWT packet decoder"""
+
+import random
+import struct
+import unittest
+import swd.itm
+
+
+def _flatten(records):
+    """Split merged records into single packets"""
+    result = []
+    for record in records:
+        if record.kind == swd.itm.STIMULUS:
+            result += [(record.kind, record.address, byte)
+                       for byte in record.value]
+        elif record.kind == swd.itm.PC_SAMPLE:
+            result += [(record.kind, None, pc) for pc in record.value]
+        elif record.kind == swd.itm.SLEEP:
+            result += [(record.kind, None, 1)] * record.value
+        else:
+            result.append(tuple(record))
+    return result
+
+
+class TestItmDecoder(unittest.TestCase):
+    """Tests for decoding of packets"""
+
+    def test_stimulus(self):
+        """test merging of writes into stimulus ports"""
+        data = b''.join(b'\x01' + bytes([char]) for char in b'hello')
+        data += b'\x0b' + b'abcd' + b'\x09x'
+        decoder = swd.itm.ItmDecoder()
+        self.assertEqual(decoder.decode(data), [
+            swd.itm.ItmRecord(swd.itm.STIMULUS, 0, b'hello'),
+            swd.itm.ItmRecord(swd.itm.STIMULUS, 1, b'abcdx')])
+        self.assertEqual(decoder.ports, [0, 1])
+        self.assertEqual(decoder.read_port(0), b'hello')
+        self.assertEqual(decoder.read_port(0), b'')
+        self.assertEqual(decoder.read_port(1), b'abcdx')
+
+    def test_stimulus_mixed_sizes(self):
+        """test merging of 1 and 4 byte writes into same port"""
+        data = b'\x01>' + b'\x03abcd' + b'\x03efgh' + b'\x01\n'
+        data += b'\x0a\x01\x02' + b'\x01<'
+        self.assertEqual(swd.itm.decode(data), [
+            swd.itm.ItmRecord(swd.itm.STIMULUS, 0, b'>abcdefgh\n'),
+            swd.itm.ItmRecord(swd.itm.STIMULUS, 1, b'\x01\x02'),
+            swd.itm.ItmRecord(swd.itm.STIMULUS, 0, b'<')])
+
+    def test_pc_samples(self):
+        """test run of PC sample packets"""
+        pcs = [0x08000100 + 2 * index for index in range(100)]
+        data = b''.join(b'\x17' + struct.pack('<L', pc) for pc in pcs)
+        data += b'\x15\x00' * 3
+        records = swd.itm.decode(data)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0].kind, swd.itm.PC_SAMPLE)
+        self.assertEqual(list(records[0].value), pcs)
+        self.assertEqual(records[1], (swd.itm.SLEEP, None, 3))
+
+    def test_protocol_packets(self):
+        """test sync, overflow and timestamp packets"""
+        data = (
+            b'\x00\x00\x00\x00\x00\x80'
+            b'\x70'
+            b'\x30'
+            b'\xd0\x81\x01'
+            b'\x94\x85\x01'
+            b'\x8c\x83\x01')
+        decoder = swd.itm.ItmDecoder()
+        self.assertEqual(decoder.decode(data), [
+            (swd.itm.SYNC, None, None),
+            (swd.itm.OVERFLOW, None, None),
+            (swd.itm.TIMESTAMP, 0, 3),
+            (swd.itm.TIMESTAMP, 1, 129),
+            (swd.itm.GLOBAL_TIMESTAMP, 1, 133),
+            (swd.itm.EXTENSION, 1, 131 << 3)])
+        self.assertEqual(decoder.overflows, 1)
+
+    def test_hardware_packets(self):
+        """test DWT exception, event counter and data trace packets"""
+        data = (
+            b'\x0e\x13\x10'
+            b'\x05\x01'
+            b'\x47\x00\x01\x00\x08'
+            b'\x86\x10\x00'
+            b'\x8f\x78\x56\x34\x12')
+        self.assertEqual(swd.itm.decode(data), [
+            (swd.itm.EXCEPTION, 19, 1),
+            (swd.itm.EVENT_COUNTER, None, 1),
+            (swd.itm.DATA_PC, 0, 0x08000100),
+            (swd.itm.DATA_READ, 0, 0x10),
+            (swd.itm.DATA_WRITE, 0, 0x12345678)])
+
+    def test_chunks(self):
+        """test packets split over chunk boundaries"""
+        packets = [
+            b'\x00\x00\x00\x00\x00\x80', b'\x01a', b'\x09b', b'\x0ab\x00',
+            b'\x0b1234', b'\x17\x00\x01\x00\x08', b'\x15\x00', b'\x70',
+            b'\x30', b'\xd0\x81\x81\x01', b'\xb4\x81\x81\x81\x81\x81\x01',
+            b'\x0e\x13\x10', b'\x8c\x83\x01']
+        rnd = random.Random(0)
+        data = b''.join(rnd.choice(packets) for _ in range(2000))
+        expected = _flatten(swd.itm.decode(data))
+        decoder = swd.itm.ItmDecoder()
+        records = []
+        offset = 0
+        while offset < len(data):
+            size = rnd.randint(1, 20)
+            records += decoder.decode(memoryview(data)[offset:offset + size])
+            offset += size
+        self.assertEqual(_flatten(records), expected)
+        self.assertEqual(decoder.pending, 0)
+
+    def test_pending(self):
+        """test incomplete packet at end of chunk"""
+        decoder = swd.itm.ItmDecoder()
+        self.assertEqual(decoder.decode(b'\x01a\x0b12'), [
+            (swd.itm.STIMULUS, 0, b'a')])
+        self.assertEqual(decoder.pending, 3)
+        self.assertEqual(decoder.decode(b'34'), [
+            (swd.itm.STIMULUS, 1, b'1234')])
+        self.assertEqual(decoder.pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
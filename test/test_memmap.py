@@ -0,0 +1,41 @@
+"""Unit tests for memmap.py
+"""
+
+import unittest
+import swd.memmap
+
+
+class TestMemoryMap(unittest.TestCase):
+    """Tests for default Cortex-M memory map"""
+
+    def setUp(self):
+        self._memmap = swd.memmap.MemoryMap()
+
+    def test_find(self):
+        """test finding region"""
+        self.assertEqual(self._memmap.find(0x08000000).name, 'CODE')
+        self.assertEqual(self._memmap.find(0xe000edf0).name, 'PPB')
+        self.assertEqual(self._memmap.find(0xe00ff000).name, 'ROM_TABLE')
+
+    def test_attributes(self):
+        """test range attributes"""
+        self.assertTrue(self._memmap.is_cacheable(0x08000000, 0x1000))
+        self.assertFalse(self._memmap.is_cacheable(0x1ffff000, 0x2000))
+        self.assertTrue(self._memmap.is_ram(0x20000000, 0x100))
+        self.assertTrue(self._memmap.is_word_access(0x1ffff000, 0x2000))
+        self.assertFalse(self._memmap.is_word_access(0x40000000, 4))
+        self.assertFalse(self._memmap.is_ram(0xe000edf0, 4))
+
+    def test_overlap(self):
+        """test adding overlapping region"""
+        with self.assertRaises(swd.memmap.MemoryMapException):
+            self._memmap.add_region(
+                swd.memmap.MemoryRegion(0x20000000, 0x1000, 'CCM'))
+
+    def test_custom(self):
+        """test custom memory map with not covered addresses"""
+        memmap = swd.memmap.MemoryMap([
+            swd.memmap.MemoryRegion(0x08000000, 0x10000, cacheable=True)])
+        self.assertTrue(memmap.is_cacheable(0x08000000, 0x10000))
+        self.assertFalse(memmap.is_cacheable(0x08000000, 0x10001))
+        self.assertIsNone(memmap.find(0x20000000))
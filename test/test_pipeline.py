@@ -0,0 +1,153 @@
+"""Unit tests for stlink/pipeline.py
+"""
+
+import threading
+import unittest
+import swd
+import swd.memmap
+import swd.stlink
+import swd.stlink.emulator
+import swd.stlink.pipeline
+
+
+class UsbErrorMock():
+    """USB mock which fail on write transfers"""
+    dev_name = 'V2'
+
+    def __init__(self):
+        self.commands = []
+
+    def xfer(self, command, data=None, rx_length=0, timeout=200):
+        """Mock xfer"""
+        self.commands.append(command)
+        if data:
+            raise swd.stlink.usb.StlinkUsbException("USB Error")
+        return bytes(rx_length)
+
+
+class TestPipeline(unittest.TestCase):
+    """Tests for StlinkPipeline"""
+
+    def test_attributes(self):
+        """test attributes from wrapped device"""
+        emu = swd.stlink.emulator.StlinkEmulator()
+        pipeline = swd.stlink.pipeline.StlinkPipeline(emu)
+        self.assertEqual(pipeline.dev_name, 'V2')
+        self.assertEqual(pipeline.STLINK_MAXIMUM_TRANSFER_SIZE, 6144)
+        pipeline.close()
+
+    def test_queued_error(self):
+        """test error of queued transfer is raised by next sync call"""
+        usb = UsbErrorMock()
+        pipeline = swd.stlink.pipeline.StlinkPipeline(usb)
+        self.assertIsNone(pipeline.xfer(bytes([1]), data=bytes([1, 2])))
+        pipeline.xfer(bytes([2]))
+        with self.assertRaises(swd.stlink.usb.StlinkUsbException):
+            pipeline.xfer(bytes([3]), rx_length=2)
+        # transfers after error are skipped
+        self.assertEqual(usb.commands, [bytes([1])])
+        self.assertEqual(pipeline.xfer(bytes([4]), rx_length=2), bytes(2))
+        pipeline.close()
+
+    def test_other_thread_error(self):
+        """test error is raised only in thread which queued transfer"""
+        usb = UsbErrorMock()
+        pipeline = swd.stlink.pipeline.StlinkPipeline(usb)
+        pipeline.xfer(bytes([1]), data=bytes([1, 2]))
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            pipeline.xfer(bytes([2]), rx_length=2)))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [bytes(2)])
+        with self.assertRaises(swd.stlink.usb.StlinkUsbException):
+            pipeline.flush()
+        pipeline.close()
+
+    def test_xfer_into_data_copy(self):
+        """test data of queued transfer are copied"""
+        usb = UsbBlockingMock()
+        pipeline = swd.stlink.pipeline.StlinkPipeline(usb)
+        data = bytearray(b'\x01\x02')
+        buffer = bytearray(2)
+        pipeline.xfer_into(bytes([1]), buffer, data=data)
+        data[:] = b'\xff\xff'
+        usb.gate.set()
+        pipeline.flush()
+        self.assertEqual(usb.data, [b'\x01\x02'])
+        pipeline.close()
+
+
+class UsbBlockingMock():
+    """USB mock which wait with transfers until gate is open"""
+    dev_name = 'V2'
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.data = []
+
+    def xfer_into(self, command, buffer, data=None, timeout=200):
+        """Mock xfer_into"""
+        self.gate.wait()
+        self.data.append(data)
+        return len(buffer)
+
+
+class TestPipelineSwd(unittest.TestCase):
+    """Tests for Swd over pipelined emulated ST-Link"""
+
+    def setUp(self):
+        # latency of I/O thread let queued reads finish late
+        self._emu = swd.stlink.emulator.StlinkEmulator(latency=0.002)
+        self._stlink = swd.stlink.Stlink(usb=self._emu, pipeline_depth=4)
+        self._swd = swd.Swd(driver=self._stlink, deferred_check=True)
+        self._stlink.set_mem32(0x20000000, 0x04030201)
+        self._stlink.set_mem32(0x20000004, 0x08070605)
+
+    def test_read_write(self):
+        """test data written and read through pipeline"""
+        data = bytes(range(256)) * 300
+        self._swd.write_mem(0x20000000, data)
+        self.assertEqual(self._swd.read(0x20000000, len(data)), data)
+
+    def test_read_fault(self):
+        """test fault is reported after queued transfers"""
+        with self.assertRaises(swd.stlink.StlinkFaultException) as context:
+            self._swd.read(0x2001c000, 0x8000)
+        self.assertEqual(context.exception.fault_address, 0x20020000)
+
+    def test_get_mem32_many(self):
+        """test values of grouped reads"""
+        self.assertEqual(
+            self._swd.get_mem32_many([0x20000004, 0x20000000, 0x20000004]),
+            [0x08070605, 0x04030201, 0x08070605])
+
+    def test_superset_read(self):
+        """test unaligned read by aligned superset"""
+        dev = swd.Swd(
+            driver=self._stlink, deferred_check=True,
+            memory_map=swd.memmap.MemoryMap())
+        self.assertEqual(dev.read(0x20000001, 6), bytes(range(2, 8)))
+
+    def test_cached_read(self):
+        """test read of cached blocks"""
+        dev = swd.Swd(driver=self._stlink, deferred_check=True, cache_size=4)
+        self.assertEqual(dev.read(0x08000002, 4), b'\xff' * 4)
+        self.assertEqual(dev.read(0x08000000, 8), b'\xff' * 8)
+
+    def test_merged_write(self):
+        """test merge of unaligned write with boundary words"""
+        dev = swd.Swd(
+            driver=self._stlink, deferred_check=True,
+            memory_map=swd.memmap.MemoryMap())
+        dev.write_mem(0x20000001, b'\xaa\xbb')
+        self.assertEqual(
+            self._stlink.get_mem32(0x20000000), 0x04bbaa01)
+        self.assertEqual(
+            self._stlink.get_mem32(0x20000004), 0x08070605)
+
+    def test_nested_read(self):
+        """test read used inside outer memory operation"""
+        with self._swd._memory_operation():  # pylint: disable=protected-access
+            self.assertEqual(
+                self._swd.read(0x20000000, 8), bytes(range(1, 9)))
@@ -0,0 +1,80 @@
+"""Unit tests for plan.py
+"""
+
+import unittest
+import swd.plan
+
+
+class TestReadPlan(unittest.TestCase):
+    """Tests for read plans"""
+
+    def test_aligned(self):
+        """test aligned read split by maximum 32 bit transfer"""
+        self.assertEqual(swd.plan.plan(swd.plan.READ, 0x1000, 2052, 64, 1024), (
+            (32, 0, 1024), (32, 1024, 1024), (32, 2048, 4)))
+
+    def test_unaligned(self):
+        """test unaligned head and tail"""
+        self.assertEqual(swd.plan.plan(swd.plan.READ, 0x1001, 200, 64, 1024), (
+            (8, 0, 63), (32, 63, 136), (8, 199, 1)))
+
+    def test_unaligned_8bit(self):
+        """test unaligned head with maximum 8 bit transfer"""
+        self.assertEqual(swd.plan.plan(swd.plan.READ, 0x1002, 64, 64, 1024), (
+            (8, 0, 64),))
+
+    def test_empty(self):
+        """test empty plan"""
+        self.assertEqual(swd.plan.plan(swd.plan.READ, 0x1003, 0, 64, 1024), ())
+
+
+class TestWritePlan(unittest.TestCase):
+    """Tests for write plans"""
+
+    def test_unaligned(self):
+        """test unaligned head and tail of each chunk"""
+        self.assertEqual(swd.plan.plan(swd.plan.WRITE, 0x1001, 1214, 64, 1024), (
+            (8, 0, 63), (32, 63, 1024), (32, 1087, 124), (8, 1211, 3)))
+
+    def test_short_tail(self):
+        """test short tail written by 8 bit transfer"""
+        self.assertEqual(swd.plan.plan(swd.plan.WRITE, 0x1000, 1087, 64, 1024), (
+            (32, 0, 1024), (8, 1024, 63)))
+
+    def test_memoized(self):
+        """test that split is compiled once for alignment, not for size"""
+        swd.plan.compile_split.cache_clear()
+        swd.plan.plan(swd.plan.WRITE, 0x2001, 100, 64, 1024)
+        swd.plan.plan(swd.plan.WRITE, 0x3001, 5000, 64, 1024)
+        swd.plan.plan(swd.plan.WRITE, 0x3005, 7, 64, 1024)
+        info = swd.plan.compile_split.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+
+
+class TestFillPlan(unittest.TestCase):
+    """Tests for fill plans"""
+
+    def test_unaligned_8bit(self):
+        """test unaligned fill up to maximum 8 bit transfer at once"""
+        self.assertEqual(swd.plan.plan(swd.plan.FILL, 0x1003, 62, 64, 1024), (
+            (8, 0, 62),))
+
+    def test_unaligned(self):
+        """test unaligned head and tail"""
+        self.assertEqual(swd.plan.plan(swd.plan.FILL, 0x1001, 1157, 64, 1024), (
+            (8, 0, 63), (32, 63, 1024), (32, 1087, 68), (8, 1155, 2)))
+
+class TestFixedPlan(unittest.TestCase):
+    """Tests for plans with one access size"""
+
+    def test_fixed(self):
+        """test split by maximum transfer size"""
+        self.assertEqual(swd.plan.fixed(16, 130, 64), (
+            (16, 0, 64), (16, 64, 64), (16, 128, 2)))
+
+    def test_exact(self):
+        """test size of multiple maximum transfer size"""
+        self.assertEqual(swd.plan.fixed(32, 2048, 1024), (
+            (32, 0, 1024), (32, 1024, 1024)))
+        self.assertEqual(swd.plan.fixed(8, 0, 64), ())
@@ -0,0 +1,89 @@
+"""Unit tests for pool.py
+"""
+
+import threading
+import unittest
+import swd
+import swd.pool
+import swd.stlink.emulator
+
+
+class TestProbePool(unittest.TestCase):
+    """Tests for ProbePool with emulated probes"""
+
+    def setUp(self):
+        self._probes = [
+            swd.stlink.emulator.StlinkEmulator(serial_no=f"EMU{i:04d}")
+            for i in range(4)]
+
+    def test_serial_numbers(self):
+        """test selecting probes by part of serial numbers"""
+        with swd.ProbePool(
+                serial_numbers=['0001', 'EMU0003'],
+                probes=self._probes) as pool:
+            self.assertEqual(pool.serial_numbers, ['EMU0001', 'EMU0003'])
+            self.assertIsInstance(pool['EMU0001'], swd.Swd)
+
+    def test_run(self):
+        """test running job on all probes in own threads"""
+        threads = set()
+
+        def job(dev, value):
+            threads.add(threading.current_thread().name)
+            dev.set_mem32(0x20000000, value)
+            return dev.get_mem32(0x20000000)
+
+        with swd.ProbePool(probes=self._probes) as pool:
+            results = pool.run(job, 0x12345678)
+        self.assertEqual(results, {
+            'EMU0000': 0x12345678,
+            'EMU0001': 0x12345678,
+            'EMU0002': 0x12345678,
+            'EMU0003': 0x12345678})
+        self.assertEqual(len(threads), 4)
+
+    def test_run_error(self):
+        """test error on some probes"""
+
+        def job(dev):
+            if dev.get_mem32(0x20000000):
+                raise ValueError("wrong value")
+            return True
+
+        with swd.ProbePool(probes=self._probes) as pool:
+            pool['EMU0002'].set_mem32(0x20000000, 1)
+            with self.assertRaises(swd.pool.ProbePoolException) as context:
+                pool.run(job)
+        self.assertEqual(list(context.exception.errors), ['EMU0002'])
+        self.assertEqual(len(context.exception.results), 3)
+
+    def test_serial_numbers_none(self):
+        """test probe which serial number can not be read"""
+        probes = self._probes + [
+            swd.stlink.emulator.StlinkEmulator(serial_no=None)]
+        with swd.ProbePool(
+                serial_numbers=['0002'], probes=probes) as pool:
+            self.assertEqual(pool.serial_numbers, ['EMU0002'])
+        with self.assertRaises(swd.pool.ProbePoolException) as context:
+            swd.ProbePool(probes=probes)
+        self.assertEqual(
+            str(context.exception), 'Probe without serial number')
+
+    def test_duplicate_serial_numbers(self):
+        """test probes with same serial number"""
+        probes = self._probes + [
+            swd.stlink.emulator.StlinkEmulator(serial_no='EMU0001')]
+        with self.assertRaises(swd.pool.ProbePoolException) as context:
+            swd.ProbePool(probes=probes)
+        self.assertEqual(
+            str(context.exception), 'Duplicate serial numbers: EMU0001')
+
+    def test_close(self):
+        """test that USB devices are released"""
+        closed = []
+        for probe in self._probes:
+            probe.close = lambda probe=probe: closed.append(probe.serial_no)
+        with swd.ProbePool(probes=self._probes):
+            self.assertEqual(closed, [])
+        self.assertEqual(
+            closed, ['EMU0000', 'EMU0001', 'EMU0002', 'EMU0003'])
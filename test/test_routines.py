@@ -0,0 +1,24 @@
+"""Unit tests for routines.py
+"""
+
+import struct
+import unittest
+import zlib
+import swd.routines
+
+
+class TestCrc32(unittest.TestCase):
+    """Tests for CRC32 routine"""
+
+    def test_table(self):
+        """test byte-wise CRC32 with table is same as zlib.crc32"""
+        table = struct.unpack('<256L', swd.routines.crc32_table())
+        data = bytes(range(256)) * 3
+        crc = 0xffffffff
+        for byte in data:
+            crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+        self.assertEqual(crc ^ 0xffffffff, zlib.crc32(data))
+
+    def test_table_alignment(self):
+        """test that table is aligned to 4 Bytes after code"""
+        self.assertEqual(len(swd.routines.CRC32_SECTORS) % 4, 0)
@@ -0,0 +1,251 @@
+"""Tests for RTT"""
+
+import struct
+import unittest
+import swd
+import swd.rtt
+import swd.stlink
+import swd.stlink.emulator
+
+
+class _TestRtt(unittest.TestCase):
+    """Base class with RTT control block in emulated RAM"""
+
+    ADDRESS = 0x20001ffc
+    UP_BUFFERS = ((0x20003000, 64, 'Terminal'), (0, 0, ''))
+    DOWN_BUFFERS = ((0x20003100, 16, 'Terminal'), )
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator()
+        self._swd = swd.Swd(driver=swd.stlink.Stlink(usb=self._emu))
+        memory = self._emu.memory
+        # not aligned ID is ignored
+        memory.write(0x20000101, swd.rtt.RTT_ID)
+        memory.write(self.ADDRESS, swd.rtt.RTT_ID.ljust(16, b'\x00'))
+        memory.write(self.ADDRESS + 16, struct.pack(
+            '<2L', len(self.UP_BUFFERS), len(self.DOWN_BUFFERS)))
+        address = self.ADDRESS + 24
+        name_address = 0x20003200
+        for buffer_address, size, name in self.UP_BUFFERS + self.DOWN_BUFFERS:
+            memory.write(name_address, name.encode() + b'\x00')
+            memory.write(address, struct.pack(
+                '<6L', name_address, buffer_address, size, 0, 0, 0))
+            address += 24
+            name_address += 32
+
+    def _descriptor(self, index):
+        return self.ADDRESS + 24 + index * 24
+
+    def _target_write(self, index, data):
+        """Write data into up buffer as target"""
+        memory = self._emu.memory
+        buffer_address, size, _ = self.UP_BUFFERS[index]
+        wr_off, = struct.unpack(
+            '<L', memory.read(self._descriptor(index) + 12, 4))
+        for byte in data:
+            memory.write(buffer_address + wr_off, bytes([byte]))
+            wr_off = (wr_off + 1) % size
+        memory.write(self._descriptor(index) + 12, struct.pack('<L', wr_off))
+
+    def _rd_off(self, index):
+        return struct.unpack(
+            '<L', self._emu.memory.read(self._descriptor(index) + 16, 4))[0]
+
+
+class TestRttControlBlock(_TestRtt):
+    """Tests for searching and parsing of control block"""
+
+    def test_find(self):
+        """test search of control block on boundary of chunks"""
+        rtt = swd.rtt.Rtt(self._swd, search_size=0x8000)
+        self.assertEqual(rtt.address, self.ADDRESS)
+
+    def test_not_found(self):
+        """test search in range without control block"""
+        with self.assertRaises(swd.rtt.RttException):
+            swd.rtt.Rtt(self._swd, search_start=0x20010000)
+
+    def test_address(self):
+        """test explicit address"""
+        rtt = swd.rtt.Rtt(self._swd, address=self.ADDRESS)
+        self.assertEqual(rtt.address, self.ADDRESS)
+        with self.assertRaises(swd.rtt.RttException):
+            swd.rtt.Rtt(self._swd, address=0x20000100)
+
+    def test_cached_address(self):
+        """test that found address is only verified next time"""
+        swd.rtt.Rtt(self._swd, search_size=0x4000)
+        self._emu.reset_statistics()
+        rtt = swd.rtt.Rtt(self._swd, search_size=0x4000)
+        self.assertEqual(rtt.address, self.ADDRESS)
+        self.assertLess(self._emu.rx_bytes, 200)
+
+    def test_channels(self):
+        """test parsing of buffer descriptors"""
+        rtt = swd.rtt.Rtt(self._swd, address=self.ADDRESS)
+        up_channels = rtt.up_channels
+        self.assertEqual(len(up_channels), 2)
+        self.assertEqual(up_channels[0].name, 'Terminal')
+        self.assertEqual(up_channels[0].buffer_address, 0x20003000)
+        self.assertEqual(up_channels[0].size, 64)
+        self.assertTrue(up_channels[0].is_active())
+        self.assertFalse(up_channels[1].is_active())
+        down_channels = rtt.down_channels
+        self.assertEqual(len(down_channels), 1)
+        self.assertEqual(down_channels[0].index, 0)
+        self.assertEqual(down_channels[0].size, 16)
+
+
+class TestRttUpChannel(_TestRtt):
+    """Tests for reading of up channels"""
+
+    def setUp(self):
+        super().setUp()
+        self._rtt = swd.rtt.Rtt(self._swd, address=self.ADDRESS)
+        self._channel = self._rtt.up_channels[0]
+
+    def test_read_available(self):
+        """test reading of new data"""
+        self.assertEqual(self._channel.read_available(), b'')
+        self._target_write(0, b'hello ')
+        self._target_write(0, b'world')
+        self.assertEqual(self._channel.read_available(), b'hello world')
+        self.assertEqual(self._rd_off(0), 11)
+        self.assertEqual(self._channel.read_available(), b'')
+
+    def test_wrapped(self):
+        """test data wrapped over end of buffer"""
+        self._target_write(0, bytes(60))
+        self._channel.read_available()
+        self._target_write(0, bytes(range(10)))
+        self._emu.reset_statistics()
+        self.assertEqual(self._channel.read_available(), bytes(range(10)))
+        self.assertEqual(self._rd_off(0), 6)
+        # offsets, two reads of data and RdOff
+        self.assertLessEqual(self._emu.xfer_count, 8)
+
+    def test_poll(self):
+        """test reading of all channels"""
+        self._target_write(0, b'abc')
+        self.assertEqual(self._rtt.poll(), [b'abc', b''])
+        self.assertEqual(self._rtt.poll(), [b'', b''])
+
+    def test_chunks(self):
+        """test generator with timeout"""
+        self._target_write(0, b'abc')
+        self.assertEqual(
+            list(self._channel.chunks(poll_interval=0, timeout=0.01)),
+            [b'abc'])
+
+    def test_open(self):
+        """test file-like stream"""
+        self._target_write(0, b'line 1\nline 2\n')
+        stream = self._channel.open(poll_interval=0, timeout=0.01)
+        self.assertEqual(stream.readline(), b'line 1\n')
+        self.assertEqual(stream.read(), b'line 2\n')
+
+    def test_wrong_offsets(self):
+        """test corrupted descriptor"""
+        self._emu.memory.write(
+            self._descriptor(0) + 12, struct.pack('<L', 1000))
+        with self.assertRaises(swd.rtt.RttException):
+            self._channel.read_available()
+
+
+class _Consumer():
+    """Emulated target reading down buffer between transfers"""
+
+    def __init__(self, descriptor, buffer_address, size, chunk_size):
+        self._descriptor = descriptor
+        self._buffer_address = buffer_address
+        self._size = size
+        self._chunk_size = chunk_size
+        self.received = bytearray()
+
+    def __call__(self, emu):
+        wr_off, rd_off = struct.unpack(
+            '<2L', emu.memory.read(self._descriptor + 12, 8))
+        for _ in range(self._chunk_size):
+            if rd_off == wr_off:
+                break
+            self.received += emu.memory.read(
+                self._buffer_address + rd_off, 1)
+            rd_off = (rd_off + 1) % self._size
+        emu.memory.write(self._descriptor + 16, struct.pack('<L', rd_off))
+        return False
+
+
+class TestRttDownChannel(_TestRtt):
+    """Tests for writing into down channels"""
+
+    def setUp(self):
+        super().setUp()
+        self._rtt = swd.rtt.Rtt(self._swd, address=self.ADDRESS)
+        self._channel = self._rtt.down_channels[0]
+        self._down = self._descriptor(len(self.UP_BUFFERS))
+
+    def _offsets(self):
+        return struct.unpack(
+            '<2L', self._emu.memory.read(self._down + 12, 8))
+
+    def _start_consumer(self, chunk_size):
+        consumer = _Consumer(self._down, 0x20003100, 16, chunk_size)
+        self._emu = swd.stlink.emulator.StlinkEmulator(
+            memory=self._emu.memory, core=consumer)
+        self._swd = swd.Swd(driver=swd.stlink.Stlink(usb=self._emu))
+        self._rtt = swd.rtt.Rtt(self._swd, address=self.ADDRESS)
+        self._channel = self._rtt.down_channels[0]
+        # core is running
+        self._swd.set_mem32(0xe000edf0, 0xa05f0001)
+        return consumer
+
+    def test_write(self):
+        """test write into free space"""
+        self._emu.reset_statistics()
+        self.assertEqual(self._channel.write(b'hello'), 5)
+        self.assertEqual(self._emu.memory.read(0x20003100, 5), b'hello')
+        self.assertEqual(self._offsets(), (5, 0))
+        # offsets, data and WrOff
+        xfer_count = self._emu.xfer_count
+        self._emu.reset_statistics()
+        self.assertEqual(self._channel.write(b' world'), 6)
+        # offsets are not read again while there is free space
+        self.assertLess(self._emu.xfer_count, xfer_count)
+
+    def test_wrapped(self):
+        """test write over end of buffer"""
+        self._emu.memory.write(self._down + 12, struct.pack('<2L', 12, 12))
+        self.assertEqual(self._channel.write(b'abcdefgh'), 8)
+        self.assertEqual(self._emu.memory.read(0x20003100, 4), b'efgh')
+        self.assertEqual(self._emu.memory.read(0x2000310c, 4), b'abcd')
+        self.assertEqual(self._offsets(), (4, 12))
+
+    def test_timeout(self):
+        """test full buffer without reading by target"""
+        self.assertEqual(
+            self._channel.write(bytes(100), timeout=0.01,
+                                max_poll_interval=0.001), 15)
+        self.assertEqual(self._channel.write(b'x', timeout=0), 0)
+        self.assertFalse(self._channel.flush(timeout=0))
+
+    def test_no_buffer(self):
+        """test channel without buffer"""
+        self._emu.memory.write(self._down + 8, struct.pack('<L', 0))
+        channel = swd.rtt.Rtt(self._swd, address=self.ADDRESS).down_channels[0]
+        with self.assertRaises(swd.rtt.RttException) as context:
+            channel.write(b'x')
+        self.assertEqual(str(context.exception), 'Channel 0 has no buffer')
+        with self.assertRaises(swd.rtt.RttException):
+            channel.flush(timeout=0)
+
+    def test_flow_control(self):
+        """test streaming of data through small buffer"""
+        consumer = self._start_consumer(chunk_size=5)
+        data = bytes(range(256)) * 8
+        self.assertEqual(self._channel.write(data, timeout=1.0), len(data))
+        self.assertTrue(self._channel.flush(timeout=1.0))
+        self.assertEqual(consumer.received, data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,12 @@
 """Unit tests for stlink.py
 """
 
+import array
 import unittest
 import swd
+import swd.memmap
+import swd.stlink
+import swd.stlink.emulator
 
 
 class FncMock():
@@ -1023,3 +1027,471 @@ class TestFillMem32(_TestSwd):
     def test_2048bytes(self):
         """Test filling memory"""
         self._test_fill_mem32(0xa300000c, [0x42, 0x43, 0x44, 0x45, ], 2048)
+
+
+class TestRead(_TestSwd):
+    """Tests for Swd.read class"""
+
+    def test_4bytes(self):
+        """Test reading memory"""
+        data = bytes(range(4))
+        self._drv.read_mem32_mock.set_return_data([
+            data,
+        ])
+        ret_data = self._swd.read(0x00000000, 4)
+        self.assertEqual(self._drv.read_mem32_mock.get_call_log(), [
+            {'address': 0x00000000, 'size': 4},
+        ])
+        self.assertEqual(ret_data, data)
+
+    def test_2048bytes(self):
+        """Test reading memory"""
+        data = bytes(i & 0xff for i in range(2048))
+        self._drv.read_mem32_mock.set_return_data([
+            data[:1024],
+            data[1024:],
+        ])
+        ret_data = self._swd.read(0x08000000, 2048)
+        self.assertEqual(self._drv.read_mem32_mock.get_call_log(), [
+            {'address': 0x08000000, 'size': 1024},
+            {'address': 0x08000400, 'size': 1024},
+        ])
+        self.assertIsInstance(ret_data, bytes)
+        self.assertEqual(ret_data, data)
+
+    def test_1150bytes_unaligned(self):
+        """Test reading memory with unaligned address and size"""
+        data = bytes(i & 0xff for i in range(1150))
+        self._drv.read_mem8_mock.set_return_data([
+            data[:63],
+            data[1087:],
+        ])
+        self._drv.read_mem32_mock.set_return_data([
+            data[63:1087],
+        ])
+        ret_data = self._swd.read(0x76000019, 1150)
+        self.assertEqual(self._drv.read_mem8_mock.get_call_log(), [
+            {'address': 0x76000019, 'size': 63},
+            {'address': 0x76000458, 'size': 63},
+        ])
+        self.assertEqual(self._drv.read_mem32_mock.get_call_log(), [
+            {'address': 0x76000058, 'size': 1024},
+        ])
+        self.assertEqual(ret_data, data)
+
+
+class _TestSwdEmulator(unittest.TestCase):
+    """Base class for testing Swd with StlinkEmulator"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator()
+        self._stlink = swd.stlink.Stlink(usb=self._emu)
+        self._swd = swd.Swd(driver=self._stlink)
+        self._emu.reset_statistics()
+
+
+class TestReadInto(_TestSwdEmulator):
+    """Tests for Swd.readinto through emulated ST-Link"""
+
+    def test_readinto_slice(self):
+        """test reading into slice of caller buffer"""
+        data = bytes(i & 0xff for i in range(7001))
+        self._emu.memory.write(0x20000001, data)
+        buffer = bytearray(7005)
+        count = self._swd.readinto(
+            0x20000001, memoryview(buffer)[2:7003])
+        self.assertEqual(count, 7001)
+        self.assertEqual(buffer[2:7003], data)
+        self.assertEqual(buffer[:2] + buffer[7003:], bytes(4))
+
+    def test_read(self):
+        """test reading into bytes"""
+        data = bytes(range(256)) * 30
+        self._swd.write_mem32(0x20001000, data)
+        self.assertEqual(self._swd.read(0x20001000, len(data)), data)
+
+
+class TestDeferredCheck(_TestSwdEmulator):
+    """Tests for Swd with deferred checking of transfers"""
+
+    def setUp(self):
+        super().setUp()
+        self._swd.deferred_check = True
+
+    def test_xfer_count(self):
+        """test that last state is checked only once"""
+        self._swd.read(0x20000000, 4 * 6144)
+        self.assertEqual(self._emu.xfer_count, 5)
+        self._emu.reset_statistics()
+        self._swd.write_mem(0x20000000, bytes(4 * 6144))
+        self.assertEqual(self._emu.xfer_count, 5)
+
+    def test_read_fault(self):
+        """test fault in middle of multi chunk read"""
+        with self.assertRaises(swd.stlink.StlinkFaultException) as context:
+            self._swd.read(0x2001c000, 0x8000)
+        self.assertEqual(context.exception.fault_address, 0x20020000)
+        self.assertEqual(context.exception.transfer, (0x2001f000, 6144))
+        self.assertEqual(
+            str(context.exception),
+            'AP fault at address: 0x20020000'
+            ' (in transfer of 6144 Bytes from 0x2001f000)')
+
+    def test_write_fault(self):
+        """test fault in second chunk of write"""
+        with self.assertRaises(swd.stlink.StlinkFaultException) as context:
+            self._swd.write_mem(0x2001c000, bytes(0x4800))
+        self.assertEqual(context.exception.fault_address, 0x20020000)
+        self.assertEqual(context.exception.transfer, (0x2001f000, 6144))
+
+    def test_interleaved_generators(self):
+        """test interleaved and abandoned read generators"""
+        self._swd.write_mem(0x20000000, bytes(range(256)) * 64)
+        first = self._swd.read_mem32(0x20000000, 0x4000)
+        second = self._swd.read_mem8(0x20000100, 0x100)
+        self.assertEqual(next(first), 0)
+        self.assertEqual(next(second), 0)
+        self.assertEqual(next(first), 1)
+        self.assertEqual(list(second), list(range(1, 256)))
+        del first
+        self.assertEqual(self._swd.get_mem32(0x20000004), 0x07060504)
+        with self.assertRaises(swd.stlink.StlinkFaultException):
+            self._swd.read(0x2001fff0, 0x20)
+
+
+    def test_generator_chunk_check(self):
+        """test that generator check each chunk before it is yielded"""
+        data = self._swd.read_mem32(0x2001e800, 0x2000)
+        self.assertEqual(len([next(data) for _ in range(0x1800)]), 0x1800)
+        with self.assertRaises(swd.stlink.StlinkFaultException) as context:
+            next(data)
+        self.assertEqual(context.exception.fault_address, 0x20020000)
+
+class TestSampleMem32(_TestSwdEmulator):
+    """Tests for repeated reads of one register"""
+
+    def test_sample(self):
+        """test that register is read by separate transfers"""
+        self._emu.memory.write(0xe000101c, b'\x00\x01\x00\x08')
+        self.assertEqual(
+            self._swd.sample_mem32(0xe000101c, 5), [0x08000100] * 5)
+        self.assertLessEqual(self._emu.xfer_count, 5)
+
+    def test_deferred_check(self):
+        """test that state of all reads is checked only once"""
+        self._swd.deferred_check = True
+        self._swd.sample_mem32(0xe000101c, 8)
+        self.assertEqual(self._emu.xfer_count, 9)
+
+    def test_unaligned(self):
+        """test unaligned address"""
+        with self.assertRaises(swd.swd.SwdException):
+            self._swd.sample_mem32(0xe000101e, 1)
+
+
+class TestMemoryCache(unittest.TestCase):
+    """Tests for Swd with memory cache"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator()
+        self._stlink = swd.stlink.Stlink(usb=self._emu)
+        self._swd = swd.Swd(driver=self._stlink, cache_size=4)
+        self._emu.memory.write(0x08000000, bytes(range(256)) * 64)
+        self._emu.reset_statistics()
+
+    def test_read_cached(self):
+        """test repeated read of flash"""
+        data = self._swd.read(0x08000101, 100)
+        self.assertEqual(data, bytes(range(1, 101)))
+        count = self._emu.xfer_count
+        self.assertEqual(self._swd.read(0x08000101, 100), data)
+        self.assertEqual(self._swd.get_mem32(0x08000004), 0x07060504)
+        self.assertEqual(self._emu.xfer_count, count)
+        self.assertEqual(self._swd.cache.hits, 2)
+
+    def test_volatile(self):
+        """test that RAM is not cached"""
+        self._swd.set_mem32(0x20000000, 1)
+        self.assertEqual(self._swd.get_mem32(0x20000000), 1)
+        self._emu.memory.write(0x20000000, bytes([2, 0, 0, 0]))
+        self.assertEqual(self._swd.get_mem32(0x20000000), 2)
+        self.assertEqual(len(self._swd.cache), 0)
+
+    def test_invalidate_write(self):
+        """test invalidating blocks by write"""
+        memmap = swd.memmap.MemoryMap([
+            swd.memmap.MemoryRegion(0x20000000, 0x20000, cacheable=True)])
+        dev = swd.Swd(driver=self._stlink, memory_map=memmap, cache_size=4)
+        dev.read(0x20000000, 16)
+        self._emu.memory.write(0x20000000, b'\xaa' * 4)
+        self.assertEqual(dev.read(0x20000000, 4), bytes(4))
+        dev.set_mem32(0x20000000, 0x55555555)
+        self.assertEqual(len(dev.cache), 0)
+        dev.read(0x20000000, 16)
+        dev.write_mem(0x20000002, b'\x11')
+        self.assertEqual(dev.read(0x20000000, 4), b'\x55\x55\x11\x55')
+
+    def test_invalidate_run(self):
+        """test invalidating whole cache by CortexM.run"""
+        self._swd.read(0x08000000, 16)
+        swd.CortexM(self._swd).run()
+        self.assertEqual(len(self._swd.cache), 0)
+
+    def test_lru(self):
+        """test eviction of least recently used block"""
+        block_size = self._swd.cache.block_size
+        for block in range(5):
+            self._swd.read(0x08000000 + block * block_size, 4)
+        self.assertEqual(len(self._swd.cache), 4)
+        self._swd.cache.hits = 0
+        self._swd.read(0x08000000, 4)
+        self.assertEqual(self._swd.cache.hits, 0)
+
+    def test_cross_region(self):
+        """test read over cacheable and volatile blocks"""
+        data = bytes(range(256)) * 16
+        self._emu.memory.write(0x1ffff000, data)
+        self._emu.memory.write(0x20000000, data[::-1])
+        self.assertEqual(
+            self._swd.read(0x1ffff800, 0x1000),
+            data[0x800:] + data[::-1][:0x800])
+        self.assertEqual(len(self._swd.cache), 1)
+
+
+class TestWriteCombining(_TestSwdEmulator):
+    """Tests for Swd write combining"""
+
+    def test_combine(self):
+        """test merging of continuous writes into one transfer"""
+        with self._swd.write_combining():
+            for index in range(64):
+                self._swd.set_mem32(0x20000000 + index * 4, index)
+            self.assertEqual(self._emu.xfer_count, 0)
+        self.assertEqual(self._emu.xfer_count, 2)
+        self.assertEqual(
+            self._swd.read(0x20000000, 256),
+            b''.join(index.to_bytes(4, 'little') for index in range(64)))
+
+    def test_read_barrier(self):
+        """test that read of pending range flush writes"""
+        with self._swd.write_combining():
+            self._swd.set_mem32(0x20000000, 0x11111111)
+            self._swd.set_mem32(0x20000010, 0x22222222)
+            self.assertEqual(self._swd.get_mem32(0x20000100), 0)
+            self.assertEqual(self._emu.xfer_count, 1)
+            self.assertEqual(self._swd.get_mem32(0x20000010), 0x22222222)
+            self.assertEqual(self._swd.get_mem32(0x20000000), 0x11111111)
+
+    def test_overlap(self):
+        """test overlapping writes, merged only in RAM"""
+        with self._swd.write_combining():
+            self._swd.set_mem32(0x20000000, 1)
+            self._swd.set_mem32(0x20000000, 2)
+        self.assertEqual(self._emu.xfer_count, 2)
+        self._emu.reset_statistics()
+        dev = swd.Swd(driver=self._stlink, memory_map=swd.memmap.MemoryMap())
+        with dev.write_combining():
+            dev.write_mem32(0x20000000, bytes(16))
+            dev.set_mem32(0x20000004, 0x12345678)
+        # one bulk write and its status check
+        self.assertEqual(self._emu.xfer_count, 2)
+        self.assertEqual(dev.get_mem32(0x20000004), 0x12345678)
+
+    def test_cortexm_barrier(self):
+        """test flushing by CortexM halt"""
+        cortexm = swd.CortexM(self._swd)
+        with self._swd.write_combining():
+            cortexm.halt()
+            self.assertEqual(self._emu.xfer_count, 1)
+            self.assertTrue(cortexm.is_halted())
+
+
+class TestMem32Many(_TestSwdEmulator):
+    """Tests for scatter/gather 32 bit access"""
+
+    def setUp(self):
+        super().setUp()
+        self._emu.memory.write(
+            0x20000000, b''.join(
+                index.to_bytes(4, 'little') for index in range(2048)))
+        self._emu.reset_statistics()
+
+    def test_get_many(self):
+        """test grouping of near addresses in RAM of memory map"""
+        dev = swd.Swd(driver=self._stlink, memory_map=swd.memmap.MemoryMap())
+        addresses = [
+            0x20000010, 0x20000000, 0x20000018, 0x20001000, 0x20000000]
+        self.assertEqual(
+            dev.get_mem32_many(addresses), [0x4, 0x0, 0x6, 0x400, 0x0])
+        self.assertEqual(self._emu.xfer_count, 4)
+
+    def test_get_many_no_memory_map(self):
+        """test that gaps are not read without memory map"""
+        addresses = [0x20000010, 0x20000000, 0x20000014, 0x20001000]
+        self.assertEqual(
+            self._swd.get_mem32_many(addresses), [0x4, 0x0, 0x5, 0x400])
+        self.assertEqual(self._emu.xfer_count, 6)
+
+    def test_get_many_no_gap(self):
+        """test grouping of continuous addresses only"""
+        addresses = [0x20000000, 0x20000004, 0x2000000c]
+        self.assertEqual(self._swd.get_mem32_many(addresses, gap=0), [0, 1, 3])
+        self.assertEqual(self._emu.xfer_count, 4)
+
+    def test_get_many_max_transfer(self):
+        """test splitting groups by maximum transfer size"""
+        addresses = list(range(0x20000000, 0x20002000, 4))
+        self.assertEqual(
+            self._swd.get_mem32_many(addresses), list(range(2048)))
+        self.assertEqual(self._emu.xfer_count, 4)
+
+    def test_get_many_peripheral_gap(self):
+        """test that gaps are not read in peripheral region"""
+        dev = swd.Swd(driver=self._stlink, memory_map=swd.memmap.MemoryMap())
+        dev.get_mem32_many([0x40000000, 0x40000008])
+        # two reads, each with status check
+        self.assertEqual(self._emu.xfer_count, 4)
+
+    def test_unaligned(self):
+        """test unaligned address"""
+        with self.assertRaises(swd.swd.SwdException):
+            self._swd.get_mem32_many([0x20000002])
+
+    def test_set_many(self):
+        """test writing of continuous addresses"""
+        self._swd.set_mem32_many(
+            (0x20000100 + index * 4, index) for index in range(16))
+        self.assertEqual(self._emu.xfer_count, 2)
+        self.assertEqual(
+            self._swd.get_mem32_many([0x20000100, 0x2000013c]), [0, 15])
+
+
+class TestSupersetRead(_TestSwdEmulator):
+    """Tests for unaligned reads with memory map"""
+
+    def setUp(self):
+        super().setUp()
+        self._data = bytes(range(256)) * 64
+        self._emu.memory.write(0x20000000, self._data)
+        self._swd = swd.Swd(
+            driver=self._stlink, memory_map=swd.memmap.MemoryMap())
+
+    def test_ram(self):
+        """test unaligned read from RAM by one 32 bit transfer"""
+        self.assertEqual(
+            self._swd.read(0x20000001, 101), self._data[1:102])
+        self.assertEqual(self._emu.xfer_count, 2)
+        self.assertEqual(
+            bytes(self._swd.read_mem(0x20000003, 9000)),
+            self._data[3:9003])
+
+    def test_peripheral(self):
+        """test that peripheral is read with exact 8 bit access"""
+        self._swd.read(0x40000001, 101)
+        self.assertEqual(self._emu.xfer_count, 4)
+
+
+class TestMergedWrite(_TestSwdEmulator):
+    """Tests for unaligned writes with memory map"""
+
+    def setUp(self):
+        super().setUp()
+        self._data = bytes(range(256)) * 64
+        self._emu.memory.write(0x20000000, self._data)
+        self._swd = swd.Swd(
+            driver=self._stlink, memory_map=swd.memmap.MemoryMap())
+        # core is halted
+        self._swd.set_mem32(0xe000edf0, 0xa05f0003)
+        self._emu.reset_statistics()
+
+    def test_ram(self):
+        """test unaligned write into RAM by 32 bit transfers"""
+        self._swd.write_mem(0x20000001, b'\xaa' * 101)
+        # DHCSR, two boundary words read, one write, each with status check
+        self.assertEqual(self._emu.xfer_count, 7)
+        self.assertEqual(
+            self._swd.read(0x20000000, 104),
+            self._data[:1] + b'\xaa' * 101 + self._data[102:104])
+
+    def test_ram_one_word(self):
+        """test write inside one word"""
+        self._swd.write_mem(0x20000001, b'\xaa\xbb')
+        self.assertEqual(self._emu.xfer_count, 5)
+        self.assertEqual(
+            self._swd.read(0x20000000, 4), b'\x00\xaa\xbb\x03')
+
+    def test_tail(self):
+        """test aligned write with odd tail"""
+        self._swd.write_mem(0x20000000, b'\xaa' * 7)
+        self.assertEqual(
+            self._swd.read(0x20000000, 8), b'\xaa' * 7 + b'\x07')
+
+    def test_running_core(self):
+        """test that boundary words are not merged while core is running"""
+        calls = []
+
+        def firmware(emu):
+            # firmware increments variable next to written range
+            calls.append(None)
+            value = emu.memory.read(0x20000000, 1)[0]
+            emu.memory.write(0x20000000, bytes([(value + 1) & 0xff]))
+            return False
+
+        emu = swd.stlink.emulator.StlinkEmulator(core=firmware)
+        emu.memory.write(0x20000000, self._data[:8])
+        dev = swd.Swd(
+            driver=swd.stlink.Stlink(usb=emu),
+            memory_map=swd.memmap.MemoryMap())
+        dev.set_mem32(0xe000edf0, 0xa05f0001)
+        del calls[:]
+        value = emu.memory.read(0x20000000, 1)[0]
+        dev.write_mem(0x20000001, b'\xaa\xbb')
+        # no increment of firmware is lost
+        self.assertEqual(
+            bytes(emu.memory.read(0x20000000, 4)),
+            bytes([(value + len(calls)) & 0xff]) + b'\xaa\xbb\x03')
+
+    def test_peripheral(self):
+        """test that peripheral is written with exact 8 bit access"""
+        self._swd.write_mem(0x40000001, bytes(101))
+        self.assertEqual(self._emu.xfer_count, 4)
+
+    def test_unaligned_tail(self):
+        """test write of more than 64 bytes with odd tail without map"""
+        dev = swd.Swd(driver=self._stlink)
+        dev.write_mem(0x20000000, b'\x55' * 103)
+        self.assertEqual(
+            dev.read(0x20000000, 104), b'\x55' * 103 + b'\x67')
+
+
+class TestFillPattern(_TestSwdEmulator):
+    """Tests for fill_mem"""
+
+    def test_fill_pattern(self):
+        """test fill with pattern longer than 4 bytes"""
+        pattern = b'\x01\x02\x03\x04\x05'
+        self._swd.fill_mem(0x20000001, pattern, 20000)
+        self.assertEqual(
+            self._swd.read(0x20000001, 20000), (pattern * 4000))
+
+
+class TestWriteBuffer(_TestSwdEmulator):
+    """Tests for writing from buffer objects"""
+
+    def test_write_memoryview(self):
+        """test writing of slice of buffer"""
+        data = bytearray(range(256)) * 40
+        self._swd.write_mem(0x20000001, memoryview(data)[3:10003])
+        self.assertEqual(self._swd.read(0x20000001, 10000), data[3:10003])
+
+    def test_write_mem32_array(self):
+        """test writing of array with 32 bit items"""
+        data = array.array('I', range(2000))
+        self._swd.write_mem32(0x20000000, data)
+        self.assertEqual(self._swd.read(0x20000000, 8000), data.tobytes())
+
+    def test_write_generator(self):
+        """test writing of generic iterable"""
+        self._swd.write_mem8(0x20000000, (i & 0xff for i in range(100)))
+        self.assertEqual(
+            self._swd.read(0x20000000, 100), bytes(range(100)))
@@ -0,0 +1,129 @@
+"""Tests for SWO trace capture"""
+
+import io
+import os
+import tempfile
+import time
+import unittest
+import swd
+import swd.swo
+import swd.stlink
+import swd.stlink.emulator
+
+
+class TestTraceBuffer(unittest.TestCase):
+    """Tests for ring buffer"""
+
+    def test_read(self):
+        """test partial and whole read"""
+        buffer = swd.swo.TraceBuffer(16)
+        buffer.write(b'hello ')
+        buffer.write(b'world')
+        self.assertEqual(len(buffer), 11)
+        self.assertEqual(buffer.read(6), b'hello ')
+        self.assertEqual(buffer.read(), b'world')
+        self.assertEqual(buffer.read(timeout=0.01), b'')
+
+    def test_overflow(self):
+        """test dropping of oldest data"""
+        buffer = swd.swo.TraceBuffer(8)
+        buffer.write(b'abcdef')
+        buffer.write(b'ghij')
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual(buffer.read(), b'cdefghij')
+        buffer.write(bytes(range(20)))
+        self.assertEqual(buffer.dropped, 14)
+        self.assertEqual(buffer.read(), bytes(range(12, 20)))
+
+
+class TestSwoCapture(unittest.TestCase):
+    """Tests for target configuration and capture thread"""
+
+    def setUp(self):
+        self._emu = swd.stlink.emulator.StlinkEmulator()
+        self._swd = swd.Swd(driver=swd.stlink.Stlink(usb=self._emu))
+
+    def _mem32(self, address):
+        return int.from_bytes(self._emu.memory.read(address, 4), 'little')
+
+    def _read_all(self, capture, size):
+        data = b''
+        deadline = time.monotonic() + 1.0
+        while len(data) < size and time.monotonic() < deadline:
+            data += capture.read(timeout=0.01)
+        return data
+
+    def test_prescaler(self):
+        """test SWO frequency derived from CPU frequency"""
+        self.assertEqual(
+            swd.swo.SwoCapture.prescaler(72000000, 2000000), 35)
+        self.assertEqual(
+            swd.swo.SwoCapture.prescaler(2000000, 2000000), 0)
+        with self.assertRaises(swd.swo.SwoException):
+            swd.swo.SwoCapture.prescaler(10000000, 4000000)
+
+    def test_configure(self):
+        """test TPIU, ITM and DWT registers"""
+        capture = swd.swo.SwoCapture(
+            self._swd, 168000000, ports=0x3, pc_sampling=True)
+        capture.configure()
+        cls = swd.swo.SwoCapture
+        self.assertTrue(self._mem32(cls.DEMCR) & cls.DEMCR_TRCENA)
+        self.assertEqual(self._mem32(cls.TPIU_ACPR), 83)
+        self.assertEqual(self._mem32(cls.TPIU_SPPR), 2)
+        self.assertEqual(self._mem32(cls.TPIU_FFCR), 0x100)
+        self.assertEqual(self._mem32(cls.ITM_LAR), 0xc5acce55)
+        self.assertEqual(self._mem32(cls.ITM_TER), 0x3)
+        self.assertEqual(self._mem32(cls.ITM_TCR) & 0xf, 0xd)
+        self.assertTrue(self._mem32(cls.DWT_CTRL) & cls.DWT_CTRL_PCSAMPLENA)
+        # vendor register is not written by default
+        self.assertEqual(self._mem32(cls.STM32_DBGMCU_CR), 0)
+
+    def test_configure_dbgmcu(self):
+        """test enabling of trace pin on STM32"""
+        cls = swd.swo.SwoCapture
+        capture = cls(
+            self._swd, 72000000, dbgmcu_cr=cls.STM32_DBGMCU_CR)
+        capture.configure()
+        self.assertEqual(self._mem32(cls.STM32_DBGMCU_CR), 0x20)
+
+    def test_capture(self):
+        """test draining of trace data by thread"""
+        with swd.swo.SwoCapture(self._swd, 72000000) as capture:
+            self.assertEqual(self._emu.trace_frequency, 2000000)
+            self._emu.trace_write(b'\x01hello')
+            # memory access from main thread during capture
+            self._swd.write_mem(0x20000000, bytes(range(64)))
+            self._emu.trace_write(b'\x01world')
+            self.assertEqual(
+                self._read_all(capture, 12), b'\x01hello\x01world')
+        self.assertIsNone(self._emu.trace_frequency)
+        self.assertEqual(capture.received, 12)
+        self.assertFalse(capture.running)
+
+    def test_drain_on_stop(self):
+        """test data waiting in debugger are read by stop()"""
+        capture = swd.swo.SwoCapture(
+            self._swd, 72000000, poll_interval=10.0)
+        capture.start()
+        time.sleep(0.01)
+        self._emu.trace_write(b'last')
+        capture.stop()
+        self.assertEqual(list(capture.chunks()), [b'last'])
+
+    def test_output(self):
+        """test writing of captured data into file"""
+        stream = io.BytesIO()
+        with swd.swo.SwoCapture(self._swd, 72000000, output=stream):
+            self._emu.trace_write(b'stream')
+        self.assertEqual(stream.getvalue(), b'stream')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.bin')
+            with swd.swo.SwoCapture(self._swd, 72000000, output=path):
+                self._emu.trace_write(b'file')
+            with open(path, 'rb') as trace_file:
+                self.assertEqual(trace_file.read(), b'file')
+
+
+if __name__ == "__main__":
+    unittest.main()
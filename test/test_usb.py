@@ -0,0 +1,177 @@
+"""Unit tests for stlink/usb.py
+"""
+
+import ctypes
+import unittest
+import swd.stlink.usb
+
+
+class DevMock():
+    """USB device mock which write received data into buffer"""
+
+    def __init__(self, rx_data):
+        self._rx_data = rx_data
+        self.tx_data = []
+
+    def write(self, data, timeout=200):
+        """Mock write"""
+        self.tx_data.append(bytes(data))
+
+    def read(self, size, timeout=200):
+        """Mock read"""
+        return self._rx_data[:size]
+
+    def read_into(self, buffer, timeout=200):
+        """Mock read_into, use buffer like pyusb backend"""
+        address, length = swd.stlink.usb._BufferInfo(buffer).buffer_info()
+        ctypes.memmove(address, self._rx_data, length)
+        return length
+
+
+class StlinkUsbMock(swd.stlink.usb.StlinkUsb):
+    """StlinkUsb with mocked device"""
+
+    def __init__(self, dev):
+        super().__init__(dev=dev)
+
+
+class TestStlinkUsbXferInto(unittest.TestCase):
+    """Tests for StlinkUsb.xfer_into()"""
+
+    def test_xfer_into(self):
+        """test receiving data directly into slice of buffer"""
+        dev = DevMock(bytes(range(16)))
+        usb = StlinkUsbMock(dev)
+        buffer = bytearray(20)
+        count = usb.xfer_into(bytes([0xf2, 0x07]), memoryview(buffer)[2:18])
+        self.assertEqual(count, 16)
+        self.assertEqual(buffer, bytes(2) + bytes(range(16)) + bytes(2))
+        self.assertEqual(dev.tx_data, [bytes([0xf2, 0x07]) + bytes(14)])
+
+    def test_xfer_into_1byte(self):
+        """test receiving one byte, which is read with minimal length"""
+        dev = DevMock(bytes([0x42, 0x00]))
+        usb = StlinkUsbMock(dev)
+        buffer = bytearray(1)
+        usb.xfer_into(bytes([0xf2, 0x0c]), buffer)
+        self.assertEqual(buffer, bytes([0x42]))
+
+
+class PyusbDeviceMock():
+    """pyusb device mock without backend internals"""
+
+    def __init__(self, rx_data):
+        self._rx_data = rx_data
+        self.reads = []
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        """Mock read, which fill array.array like pyusb"""
+        self.reads.append(endpoint)
+        count = min(len(size_or_buffer), len(self._rx_data))
+        size_or_buffer[:count] = swd.stlink.usb._array.array(
+            'B', self._rx_data[:count])
+        return count
+
+    def finalize(self):
+        """Mock finalize"""
+
+
+class TestStlinkUsbBaseReadInto(unittest.TestCase):
+    """Tests for StlinkUsbBase.read_into()"""
+
+    def test_fallback(self):
+        """test read into buffer without pyusb backend internals"""
+        dev = PyusbDeviceMock(bytes(range(8)))
+        usb = swd.stlink.usb.StlinkUsbV2(dev)
+        buffer = bytearray(12)
+        count = usb.read_into(memoryview(buffer)[2:12])
+        self.assertEqual(count, 8)
+        self.assertEqual(buffer, bytes(2) + bytes(range(8)) + bytes(2))
+        self.assertEqual(dev.reads, [swd.stlink.usb.StlinkUsbV2.PIPE_IN])
+
+
+class UsbDeviceMock():
+    """pyusb device mock"""
+
+    def __init__(self, id_product, serial_number):
+        self.idProduct = id_product  # pylint: disable=invalid-name
+        self._serial_number = serial_number
+        self.serial_reads = 0
+
+    @property
+    def serial_number(self):
+        """Mock string descriptor read"""
+        self.serial_reads += 1
+        return self._serial_number
+
+    def finalize(self):
+        """Mock finalize"""
+
+
+class TestStlinkUsbFindDevices(unittest.TestCase):
+    """Tests for StlinkUsb device enumeration"""
+
+    def setUp(self):
+        self._devices = [
+            UsbDeviceMock(0x3748, 'AAAA0001'),
+            UsbDeviceMock(0x374b, 'BBBB0002'),
+            UsbDeviceMock(0x1234, 'CCCC0003'),
+            UsbDeviceMock(0x374f, 'DDDD0004'),
+        ]
+        self._find_calls = []
+        self._find = swd.stlink.usb._usb.core.find
+        swd.stlink.usb._usb.core.find = self._find_mock
+
+    def tearDown(self):
+        swd.stlink.usb._usb.core.find = self._find
+
+    def _find_mock(self, **kwargs):
+        self._find_calls.append(kwargs)
+        custom_match = kwargs['custom_match']
+        return (dev for dev in self._devices if custom_match(dev))
+
+    def test_single_scan(self):
+        """test that bus is scanned only once and by vendor ID"""
+        devices = swd.stlink.usb.StlinkUsb._find_all_devices()
+        self.assertEqual(len(self._find_calls), 1)
+        self.assertEqual(self._find_calls[0]['idVendor'], 0x0483)
+        self.assertEqual(
+            [dev.DEV_NAME for dev in devices], ['V2', 'V2-1', 'V3'])
+        self.assertEqual(
+            [dev.serial_reads for dev in self._devices], [0, 0, 0, 0])
+
+    def test_serial_no_cache(self):
+        """test that serial number is read only once per device"""
+        usb = swd.stlink.usb.StlinkUsb(serial_no='0002')
+        self.assertEqual(usb.dev_name, 'V2-1')
+        self.assertEqual(
+            [dev.serial_reads for dev in self._devices], [1, 1, 0, 1])
+
+    def test_more_devices(self):
+        """test list of serial numbers for more devices"""
+        with self.assertRaises(
+                swd.stlink.usb.MoreDevicesException) as context:
+            swd.stlink.usb.StlinkUsb()
+        self.assertEqual(
+            context.exception.serial_numbers,
+            ['AAAA0001', 'BBBB0002', 'DDDD0004'])
+
+
+class TestStlinkUsbSendData(unittest.TestCase):
+    """Tests for conversion of written data"""
+
+    def test_buffer(self):
+        """test memoryview slice is converted at once"""
+        data = memoryview(bytearray(range(16)))[4:12]
+        array = swd.stlink.usb.StlinkUsb._as_array(data)
+        self.assertEqual(array.tobytes(), bytes(range(4, 12)))
+
+    def test_list(self):
+        """test list of bytes"""
+        array = swd.stlink.usb.StlinkUsb._as_array([1, 2, 3])
+        self.assertEqual(array.tobytes(), b'\x01\x02\x03')
+
+    def test_not_bytes(self):
+        """test list with too big values"""
+        with self.assertRaises(swd.stlink.usb.StlinkUsbError):
+            swd.stlink.usb.StlinkUsb._as_array([1, 256])